@@ -0,0 +1,88 @@
+"""
+Helpers shared by the command line scripts: option parsing, byte sizes,
+subprocesses and file locks
+"""
+
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to unlocked access
+    fcntl = None
+
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+def pop_option(args, name, default=None, convert=str):
+    """Remove ``name VALUE`` from ``args`` and return the converted value"""
+    if name not in args:
+        return default
+    index = args.index(name)
+    if index + 1 >= len(args):
+        print(f"Error: {name} requires a value")
+        sys.exit(2)
+    value = args[index + 1]
+    del args[index:index + 2]
+    try:
+        return convert(value)
+    except ValueError:
+        print(f"Error: invalid value for {name}: {value}")
+        sys.exit(2)
+
+def format_size(num_bytes):
+    """Format a byte count for humans (``-`` when unknown)"""
+    if num_bytes is None:
+        return "-"
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def parse_size(text):
+    """Parse sizes such as ``500M`` or ``10G`` into bytes"""
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+def run_command(cmd, cwd=None, timeout=None):
+    """Run a command and return ``(success, stdout, stderr)``.
+
+    git never blocks on an interactive credential prompt.
+    """
+    try:
+        result = subprocess.run(
+            cmd, shell=isinstance(cmd, str), cwd=cwd, capture_output=True,
+            text=True, timeout=timeout, env=dict(os.environ, GIT_TERMINAL_PROMPT="0")
+        )
+        return result.returncode == 0, result.stdout, result.stderr
+    except subprocess.TimeoutExpired:
+        return False, "", f"timed out after {timeout}s"
+    except Exception as e:
+        return False, "", str(e)
+
+@contextmanager
+def file_lock(lock_file):
+    """Hold an exclusive lock on ``lock_file`` across processes and threads"""
+    with open(lock_file, "a") as handle:
+        if fcntl:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+def disk_usage(path):
+    """Return the total size in bytes of all files below ``path``"""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.lstat(os.path.join(root, file_name)).st_size
+            except OSError:
+                pass
+    return total
@@ -1,15 +1,86 @@
 #!/usr/bin/env python3
 """
 OpenSCAD Project Creator
-Create a new project from template
+Create a new project from template, or many from a manifest
 """
 
+import csv
+import json
 import os
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
 from datetime import datetime
 
+import project_index
+from cli_utils import format_size, pop_option
+from scad_values import format_value
+
+# Template placeholders and the project fields that replace them
+TEMPLATE_FIELDS = {
+    "My Project": "name",
+    "Description of your project": "description",
+    "Your Name": "author",
+    "1.0.0": "version",
+}
+DEFAULT_FIELDS = {"author": "OpenSCAD User", "version": "1.0.0", "description": ""}
+
+# Top-level assignments whose values a manifest may override, e.g. "width = 50;"
+PARAMETER_RE = re.compile(r"^(\$?[A-Za-z_]\w*)[ \t]*=[ \t]*([^;\n]*);", re.MULTILINE)
+FIELD_RE = re.compile("|".join(re.escape(placeholder) for placeholder in TEMPLATE_FIELDS))
+PROJECT_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+def compile_template(text):
+    """Split template text into literal text, field and parameter segments.
+
+    Rendering a compiled template is a single join, so bulk creation parses
+    the template once instead of running a replace pass per field.
+    """
+    segments = []
+
+    def add_text(chunk):
+        position = 0
+        for match in FIELD_RE.finditer(chunk):
+            segments.append(("text", chunk[position:match.start()]))
+            segments.append(("field", TEMPLATE_FIELDS[match.group(0)]))
+            position = match.end()
+        segments.append(("text", chunk[position:]))
+
+    position = 0
+    parameters = {}
+    for match in PARAMETER_RE.finditer(text):
+        name = match.group(1)
+        if name.startswith("PROJECT_"):
+            continue
+        add_text(text[position:match.start(2)])
+        segments.append(("parameter", name))
+        parameters[name] = match.group(2)
+        position = match.end(2)
+    add_text(text[position:])
+    return {"segments": [segment for segment in segments if segment != ("text", "")], "parameters": parameters}
+
+def escape_string(value):
+    """Escape a value placed inside an OpenSCAD string literal"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def render_template(compiled, fields, parameters=None):
+    """Render a compiled template with project fields and parameter overrides"""
+    fields = dict(DEFAULT_FIELDS, **{k: v for k, v in fields.items() if v is not None})
+    parameters = parameters or {}
+    parts = []
+    for kind, value in compiled["segments"]:
+        if kind == "text":
+            parts.append(value)
+        elif kind == "field":
+            parts.append(escape_string(fields[value]))
+        else:
+            parts.append(format_value(parameters[value]) if value in parameters
+                         else compiled["parameters"][value])
+    return "".join(parts)
+
 def create_project(project_name, description=""):
     """Create a new OpenSCAD project"""
     script_dir = Path(__file__).parent
@@ -21,28 +92,24 @@ def create_project(project_name, description=""):
     projects_dir.mkdir(exist_ok=True)
     
     # Create project directory
+    if not PROJECT_NAME_RE.match(project_name):
+        print(f"Error: Invalid project name '{project_name}' (use letters, digits, '.', '_' and '-')")
+        return False
     project_dir = projects_dir / project_name
     if project_dir.exists():
         print(f"Error: Project '{project_name}' already exists")
         return False
     
-    project_dir.mkdir()
-    
     # Copy template file
     template_file = templates_dir / "project_template.scad"
     project_file = project_dir / f"{project_name}.scad"
     
     if template_file.exists():
-        shutil.copy2(template_file, project_file)
+        project_dir.mkdir()
         
-        # Update template with project information
-        content = project_file.read_text()
-        content = content.replace("My Project", project_name)
-        content = content.replace("Description of your project", description)
-        content = content.replace("Your Name", "OpenSCAD User")
-        content = content.replace("1.0.0", "1.0.0")
-        
-        project_file.write_text(content)
+        # Fill in the template with project information
+        compiled = compile_template(template_file.read_text())
+        project_file.write_text(render_template(compiled, {"name": project_name, "description": description}))
         
         print(f"✓ Project '{project_name}' created successfully")
         print(f"  Location: {project_dir}")
@@ -59,17 +126,124 @@ def create_project(project_name, description=""):
         print(f"Error: Template file not found: {template_file}")
         return False
 
-def list_projects():
-    """List all existing projects"""
+def read_manifest(manifest_file):
+    """Read project entries from a CSV or JSON manifest.
+
+    Each entry has a ``name`` and optional ``description``, ``author`` and
+    ``version``; any other CSV column (or JSON key, or the entries of a JSON
+    ``parameters`` object) overrides a template parameter default.
+    """
+    manifest_file = Path(manifest_file)
+    if manifest_file.suffix.lower() == ".csv":
+        with open(manifest_file, newline="") as handle:
+            rows = [dict(row) for row in csv.DictReader(handle)]
+    else:
+        rows = json.loads(manifest_file.read_text())
+        if isinstance(rows, dict):
+            rows = rows.get("projects", [])
+        if not isinstance(rows, list):
+            raise ValueError(f"{manifest_file}: expected a list of projects")
+    entries = []
+    for row in rows:
+        row = dict(row)
+        parameters = dict(row.pop("parameters", None) or {})
+        fields = {key: row.pop(key, None) for key in ("name", "description", "author", "version")}
+        parameters.update({key: value for key, value in row.items() if value not in (None, "")})
+        entries.append({"fields": fields, "parameters": parameters})
+    return entries
+
+def validate_manifest(entries, compiled, projects_dir):
+    """Return a list of problems with manifest entries (empty if all can be created)"""
+    problems, seen = [], set()
+    for number, entry in enumerate(entries, 1):
+        name = (entry["fields"].get("name") or "").strip()
+        entry["fields"]["name"] = name
+        if not PROJECT_NAME_RE.match(name):
+            problems.append(f"entry {number}: invalid project name '{name}'")
+        elif name in seen:
+            problems.append(f"entry {number}: duplicate project name '{name}'")
+        elif (projects_dir / name).exists():
+            problems.append(f"entry {number}: project '{name}' already exists")
+        seen.add(name)
+        unknown = sorted(set(entry["parameters"]) - set(compiled["parameters"]))
+        if unknown:
+            problems.append(f"entry {number} ({name}): unknown parameters {', '.join(unknown)}")
+    return problems
+
+def create_projects_bulk(manifest_file, jobs=8, dry_run=False):
+    """Create every project in a manifest, all or nothing.
+
+    Projects are written into a staging directory inside projects/ and moved
+    into place only once all of them were written; on any error the staged
+    and already moved projects are removed again.
+    """
     script_dir = Path(__file__).parent
     workspace_dir = script_dir.parent
     projects_dir = workspace_dir / "projects"
+    template_file = workspace_dir / "templates" / "project_template.scad"
+    
+    start = time.monotonic()
+    try:
+        compiled = compile_template(template_file.read_text())
+        entries = read_manifest(manifest_file)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return False
+    
+    problems = validate_manifest(entries, compiled, projects_dir)
+    if problems:
+        print(f"✗ Manifest has {len(problems)} problems, no projects were created:")
+        for problem in problems:
+            print(f"  {problem}")
+        return False
+    if dry_run:
+        print(f"✓ {len(entries)} projects would be created")
+        return True
+    
+    projects_dir.mkdir(exist_ok=True)
+    staging_dir = projects_dir / f".staging-{os.getpid()}"
+    staging_dir.mkdir()
+    moved = []
+    
+    def write_project(entry):
+        name = entry["fields"]["name"]
+        project_dir = staging_dir / name
+        project_dir.mkdir()
+        content = render_template(compiled, entry["fields"], entry["parameters"])
+        (project_dir / f"{name}.scad").write_text(content)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            list(pool.map(write_project, entries))
+        for entry in entries:
+            name = entry["fields"]["name"]
+            if (projects_dir / name).exists():
+                raise FileExistsError(f"Project '{name}' appeared while creating projects")
+            os.rename(staging_dir / name, projects_dir / name)
+            moved.append(projects_dir / name)
+    except (OSError, ValueError) as e:
+        for project_dir in moved:
+            shutil.rmtree(project_dir, ignore_errors=True)
+        print(f"✗ Bulk creation failed, no projects were created: {e}")
+        return False
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
     
-    if not projects_dir.exists():
+    print(f"✓ Created {len(entries)} projects in {time.monotonic() - start:.2f}s")
+    return True
+
+def list_projects(pattern=None, status=None, sort="name", reverse=False, as_json=False):
+    """List existing projects from the project index"""
+    if not project_index.PROJECTS_DIR.exists():
         print("No projects directory found")
         return
     
-    projects = [d for d in projects_dir.iterdir() if d.is_dir()]
+    index = project_index.load_updated_index()[0]
+    projects = project_index.query(index, pattern, status, sort, reverse)
+    
+    if as_json:
+        print(json.dumps(projects, indent=2))
+        return
     
     if not projects:
         print("No projects found")
@@ -78,32 +252,67 @@ def list_projects():
     print("Existing Projects:")
     print("=" * 20)
     
-    for project in sorted(projects):
-        scad_files = list(project.glob("*.scad"))
-        print(f"📁 {project.name}")
-        if scad_files:
-            print(f"   Files: {len(scad_files)} .scad files")
+    render_labels = {"rendered": "up to date", "stale": "outdated", "never": "not rendered"}
+    for project in projects:
+        metadata = project["metadata"]
+        version = f" (v{metadata['version']})" if metadata.get("version") else ""
+        print(f"📁 {project['name']}{version}")
+        if metadata.get("description"):
+            print(f"   {metadata['description']}")
+        if project["files"]:
+            print(f"   Files: {len(project['files'])} .scad files ({format_size(project['size'])})")
         else:
             print("   Files: No .scad files")
-        print(f"   Path: {project}")
+        print(f"   Render: {render_labels[project['render_status']]}")
+        print(f"   Path: {project['path']}")
         print()
 
+def print_usage():
+    """Print command line usage"""
+    print("Usage:")
+    print("  python3 create_project.py <project_name> [description]  # Create new project")
+    print("  python3 create_project.py bulk <manifest.csv|json> [--jobs N] [--dry-run]")
+    print("                                                          # Create many projects at once")
+    print("  python3 create_project.py list                          # List existing projects")
+    print("      [--filter TEXT] [--status rendered|stale|never]")
+    print(f"      [--sort {'|'.join(project_index.SORT_KEYS)}] [--reverse] [--json]")
+
 def main():
     """Main function"""
-    if len(sys.argv) < 2:
-        print("Usage:")
-        print("  python3 create_project.py <project_name> [description]  # Create new project")
-        print("  python3 create_project.py list                          # List existing projects")
-        sys.exit(1)
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print_usage()
+        sys.exit(0 if len(sys.argv) > 1 else 1)
     
     command = sys.argv[1]
     
-    if command == "list":
-        list_projects()
+    if command == "bulk":
+        args = sys.argv[2:]
+        jobs = pop_option(args, "--jobs", 8, int)
+        dry_run = "--dry-run" in args
+        args = [a for a in args if a != "--dry-run"]
+        if not args:
+            print("Please specify a manifest file")
+            sys.exit(1)
+        if not create_projects_bulk(args[0], jobs, dry_run):
+            sys.exit(1)
+    elif command == "list":
+        args = sys.argv[2:]
+        pattern = pop_option(args, "--filter")
+        status = pop_option(args, "--status")
+        sort = pop_option(args, "--sort", "name")
+        if sort not in project_index.SORT_KEYS or status not in (None, "rendered", "stale", "never"):
+            print("Error: invalid --sort or --status value")
+            sys.exit(2)
+        list_projects(pattern, status, sort, "--reverse" in args, "--json" in args)
+    elif command.startswith("-"):
+        print(f"Error: Unknown option {command}")
+        print_usage()
+        sys.exit(2)
     else:
         project_name = command
         description = sys.argv[2] if len(sys.argv) > 2 else ""
-        create_project(project_name, description)
+        if not create_project(project_name, description):
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
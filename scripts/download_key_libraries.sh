@@ -6,47 +6,41 @@
 LIBRARIES_DIR="../libraries"
 mkdir -p "$LIBRARIES_DIR"
 
+# Clone or update a library. When OPENSCAD_LIBRARY_CACHE is set, objects are
+# borrowed from the shared mirror cache managed by library_cache.py.
+sync_library() {
+    local dir="$LIBRARIES_DIR/$1"
+    local url="$2"
+    if [ -n "$OPENSCAD_LIBRARY_CACHE" ]; then
+        python3 library_cache.py sync "$url" "$dir"
+    elif [ -d "$dir" ]; then
+        cd "$dir" && git pull && cd - > /dev/null
+    else
+        git clone "$url" "$dir"
+    fi
+}
+
 echo "Downloading key OpenSCAD libraries..."
 
 # BOSL2 - Most comprehensive library
 echo "Downloading BOSL2..."
-if [ -d "$LIBRARIES_DIR/bosl2" ]; then
-    cd "$LIBRARIES_DIR/bosl2" && git pull && cd - > /dev/null
-else
-    git clone https://github.com/revarbat/BOSL2.git "$LIBRARIES_DIR/bosl2"
-fi
+sync_library bosl2 https://github.com/revarbat/BOSL2.git
 
 # Round Anything - Essential for rounded shapes
 echo "Downloading Round Anything..."
-if [ -d "$LIBRARIES_DIR/round-anything" ]; then
-    cd "$LIBRARIES_DIR/round-anything" && git pull && cd - > /dev/null
-else
-    git clone https://github.com/Irev-Dev/Round-Anything.git "$LIBRARIES_DIR/round-anything"
-fi
+sync_library round-anything https://github.com/Irev-Dev/Round-Anything.git
 
 # threads.scad - For threaded parts
 echo "Downloading threads.scad..."
-if [ -d "$LIBRARIES_DIR/threads-scad" ]; then
-    cd "$LIBRARIES_DIR/threads-scad" && git pull && cd - > /dev/null
-else
-    git clone https://github.com/JohK/threads.scad.git "$LIBRARIES_DIR/threads-scad"
-fi
+sync_library threads-scad https://github.com/JohK/threads.scad.git
 
 # NopSCADlib - For 3D printing parts
 echo "Downloading NopSCADlib..."
-if [ -d "$LIBRARIES_DIR/nopscadlib" ]; then
-    cd "$LIBRARIES_DIR/nopscadlib" && git pull && cd - > /dev/null
-else
-    git clone https://github.com/nophead/NopSCADlib.git "$LIBRARIES_DIR/nopscadlib"
-fi
+sync_library nopscadlib https://github.com/nophead/NopSCADlib.git
 
 # dotSCAD - Mathematical utilities
 echo "Downloading dotSCAD..."
-if [ -d "$LIBRARIES_DIR/dotscad" ]; then
-    cd "$LIBRARIES_DIR/dotscad" && git pull && cd - > /dev/null
-else
-    git clone https://github.com/JustinSDK/dotSCAD.git "$LIBRARIES_DIR/dotscad"
-fi
+sync_library dotscad https://github.com/JustinSDK/dotSCAD.git
 
 echo "Download complete!"
 echo "Key libraries are now available in the libraries/ directory"
@@ -4,11 +4,21 @@ OpenSCAD Libraries Downloader
 Downloads all official OpenSCAD libraries from their GitHub repositories
 """
 
-import os
-import subprocess
+import shutil
 import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import git_metadata
+import library_cache
+import library_lock
+import library_snapshot
+import scad_symbols
+from cli_utils import disk_usage, format_size, pop_option, run_command
+
 # Library definitions with their GitHub repositories
 LIBRARIES = {
     # General Purpose Libraries
@@ -18,7 +28,8 @@ LIBRARIES = {
     },
     "bosl2": {
         "url": "https://github.com/revarbat/BOSL2.git",
-        "description": "Belfry OpenScad Library v2 (beta)"
+        "description": "Belfry OpenScad Library v2 (beta)",
+        "strategy": "shallow"
     },
     "dotscad": {
         "url": "https://github.com/JustinSDK/dotSCAD.git",
@@ -26,7 +37,9 @@ LIBRARIES = {
     },
     "nopscadlib": {
         "url": "https://github.com/nophead/NopSCADlib.git",
-        "description": "Parts for 3D printers and electronics enclosures"
+        "description": "Parts for 3D printers and electronics enclosures",
+        "strategy": "sparse",
+        "sparse_profile": "scad"
     },
     "ub-scad": {
         "url": "https://github.com/UBaer21/UB.scad.git",
@@ -46,7 +59,8 @@ LIBRARIES = {
     },
     "bolts": {
         "url": "https://github.com/jreinhardt/BOLTS.git",
-        "description": "Open Library of Technical Specifications"
+        "description": "Open Library of Technical Specifications",
+        "strategy": "partial"
     },
     "asset-collection": {
         "url": "https://github.com/JustinSDK/AssetCollection.git",
@@ -112,39 +126,347 @@ LIBRARIES = {
     }
 }
 
-def run_command(cmd, cwd=None):
-    """Run a command and return success status"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        return result.returncode == 0, result.stdout, result.stderr
-    except Exception as e:
-        return False, "", str(e)
-
-def download_library(name, info, libraries_dir):
-    """Download a single library"""
-    print(f"Downloading {name}: {info['description']}")
-    
+# Clone strategies: extra `git clone` arguments for each mode.
+# A library picks one with its "strategy" key; --strategy overrides them all.
+CLONE_STRATEGIES = {
+    "full": [],
+    "shallow": ["--depth", "1"],
+    "partial": ["--filter=blob:none"],
+    "sparse": ["--filter=blob:none", "--no-checkout"],
+}
+DEFAULT_STRATEGY = "full"
+
+# Sparse-checkout profiles (non-cone patterns) used by the "sparse" strategy
+SPARSE_PROFILES = {
+    "scad": ["*.scad"],
+    "scad-with-licenses": ["*.scad", "LICENSE*", "COPYING*"],
+}
+DEFAULT_SPARSE_PROFILE = "scad"
+
+# Sync engine defaults
+DEFAULT_JOBS = 8
+DEFAULT_TIMEOUT = 600
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 2.0
+
+def summarize_error(stderr):
+    """Reduce git's stderr to the line that explains the failure"""
+    lines = [line.strip() for line in stderr.splitlines() if line.strip()]
+    for line in lines:
+        if line.startswith(("fatal:", "error:")):
+            return line
+    return lines[-1] if lines else "unknown error"
+
+def clone_library(name, info, libraries_dir, strategy, timeout=None, use_cache=False):
+    """Clone a library using the given clone strategy.
+
+    With ``use_cache`` the clone borrows its objects from the shared mirror
+    (see library_cache.py), so depth/filter options are not needed; sparse
+    profiles still apply to the working tree.
+    """
     lib_dir = libraries_dir / name
-    if lib_dir.exists():
-        print(f"  {name} already exists, updating...")
-        success, stdout, stderr = run_command("git pull", cwd=lib_dir)
+    if use_cache:
+        success, mirror, stderr = library_cache.ensure_mirror(info["url"], timeout=timeout)
         if success:
-            print(f"  ✓ {name} updated successfully")
-        else:
-            print(f"  ✗ Failed to update {name}: {stderr}")
+            success, stderr = library_cache.clone_from_mirror(
+                info["url"], mirror, lib_dir, checkout=strategy != "sparse", timeout=timeout
+            )
     else:
-        print(f"  Cloning {name}...")
-        success, stdout, stderr = run_command(f"git clone {info['url']} {name}", cwd=libraries_dir)
-        if success:
-            print(f"  ✓ {name} downloaded successfully")
+        cmd = ["git", "clone", *CLONE_STRATEGIES[strategy], info["url"], name]
+        success, stdout, stderr = run_command(cmd, cwd=libraries_dir, timeout=timeout)
+    if not success or strategy != "sparse":
+        return success, stderr
+
+    profile = info.get("sparse_profile", DEFAULT_SPARSE_PROFILE)
+    success, stdout, stderr = run_command(
+        ["git", "sparse-checkout", "set", "--no-cone", *SPARSE_PROFILES[profile]],
+        cwd=lib_dir, timeout=timeout
+    )
+    if success:
+        success, stdout, stderr = run_command(["git", "checkout"], cwd=lib_dir, timeout=timeout)
+    return success, stderr
+
+def checkout_pinned(lib_dir, pin, timeout=None, use_cache=False):
+    """Check out the commit recorded in a lockfile entry and verify its tree"""
+    commit = pin["commit"]
+    has_commit, stdout, stderr = run_command(["git", "cat-file", "-e", f"{commit}^{{commit}}"], cwd=lib_dir)
+    if not has_commit:
+        source = "origin"
+        if use_cache:
+            success, mirror, stderr = library_cache.ensure_mirror(pin["url"], timeout=timeout)
+            if not success:
+                return False, stderr
+            source = str(mirror)
+        cmd = ["git", "fetch", "--quiet", source, commit]
+        if git_metadata.is_shallow(lib_dir):
+            cmd[3:3] = ["--depth", "1"]
+        success, stdout, stderr = run_command(cmd, cwd=lib_dir, timeout=timeout)
+        if not success:
+            return False, stderr
+
+    success, stdout, stderr = run_command(["git", "checkout", "--quiet", "--detach", commit],
+                                          cwd=lib_dir, timeout=timeout)
+    if not success:
+        return False, stderr
+    tree = library_lock.tree_hash(lib_dir)
+    if pin.get("tree") and tree != pin["tree"]:
+        return False, f"error: tree {tree} does not match locked tree {pin['tree']}"
+    return True, ""
+
+def download_library(name, info, libraries_dir, timeout=DEFAULT_TIMEOUT,
+                     retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, strategy=None,
+                     use_cache=False, pin=None):
+    """Download or update a single library, retrying with exponential backoff.
+
+    With ``pin`` (a lockfile entry) the library is checked out at the locked
+    commit instead of following its upstream branch.
+
+    Returns a result dict; progress lines are collected in ``log`` instead of
+    being printed so that concurrent workers do not interleave their output.
+    """
+    lib_dir = libraries_dir / name
+    log = [f"Downloading {name}: {info['description']}"]
+    strategy = strategy or info.get("strategy", DEFAULT_STRATEGY)
+    result = {"name": name, "success": False, "attempts": 0, "error": "", "strategy": strategy}
+    start = time.monotonic()
+
+    if pin and lib_dir.exists() and git_metadata.head_commit(lib_dir) == pin["commit"]:
+        log.append(f"  ✓ {name} already at locked commit {pin['commit'][:8]}")
+        result.update(action="locked", success=True, elapsed=time.monotonic() - start,
+                      disk_usage=0, log=log)
+        return result
+
+    if pin and lib_dir.exists():
+        log.append(f"  {name} already exists, checking out {pin['commit'][:8]}...")
+        result["action"] = "update"
+    elif lib_dir.exists():
+        log.append(f"  {name} already exists, updating...")
+        result["action"] = "update"
+    else:
+        log.append(f"  Cloning {name} ({strategy})...")
+        result["action"] = "clone"
+
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = backoff * 2 ** (attempt - 1)
+            log.append(f"  Retrying {name} in {delay:.1f}s (attempt {attempt + 1}/{retries + 1})")
+            time.sleep(delay)
+        result["attempts"] = attempt + 1
+
+        if result["action"] == "update" and pin:
+            success, stderr = checkout_pinned(lib_dir, pin, timeout, use_cache)
+        elif result["action"] == "update" and use_cache:
+            success, mirror, stderr = library_cache.ensure_mirror(info["url"], timeout=timeout)
+            if success:
+                success, stderr = library_cache.update_from_mirror(lib_dir, mirror, timeout=timeout)
+        elif result["action"] == "update":
+            success, stdout, stderr = run_command(["git", "pull"], cwd=lib_dir, timeout=timeout)
         else:
-            print(f"  ✗ Failed to download {name}: {stderr}")
+            success, stderr = clone_library(name, info, libraries_dir, strategy, timeout, use_cache)
+            if success and pin:
+                success, stderr = checkout_pinned(lib_dir, pin, timeout, use_cache)
+            if not success and lib_dir.exists():
+                # Don't leave a half-cloned directory behind for the next attempt
+                shutil.rmtree(lib_dir, ignore_errors=True)
+
+        if success:
+            result["success"] = True
+            break
+        result["error"] = summarize_error(stderr)
 
-def main():
+    result["elapsed"] = time.monotonic() - start
+    result["disk_usage"] = disk_usage(lib_dir) if lib_dir.exists() else 0
+    if result["success"]:
+        verb = "updated" if result["action"] == "update" else "downloaded"
+        log.append(f"  ✓ {name} {verb} successfully "
+                   f"({result['elapsed']:.1f}s, {format_size(result['disk_usage'])})")
+    else:
+        verb = "update" if result["action"] == "update" else "download"
+        log.append(f"  ✗ Failed to {verb} {name}: {result['error']}")
+    result["log"] = log
+    return result
+
+def sync_libraries(libraries, libraries_dir, jobs=DEFAULT_JOBS, timeout=DEFAULT_TIMEOUT,
+                   retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, strategy=None,
+                   use_cache=False, pins=None):
+    """Download or update libraries concurrently with a bounded worker pool.
+
+    ``libraries`` has the same shape as ``LIBRARIES``, so callers can point
+    the engine at any set of repositories (e.g. local bare repositories).
+    ``pins`` maps library names to lockfile entries to install exactly.
+    Results are returned in the order of ``libraries``.
+    """
+    pins = pins or {}
+    print_lock = threading.Lock()
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {
+            pool.submit(download_library, name, info, libraries_dir,
+                        timeout, retries, backoff, strategy, use_cache, pins.get(name)): name
+            for name, info in libraries.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"name": name, "action": "sync", "success": False, "attempts": 0,
+                          "elapsed": 0.0, "disk_usage": 0, "error": str(e),
+                          "log": [f"  ✗ {name}: {e}"]}
+            results[name] = result
+            with print_lock:
+                print("\n".join(result["log"]))
+                print()
+
+    return [results[name] for name in libraries]
+
+def print_summary(results, elapsed):
+    """Print an aggregated summary and return the process exit code"""
+    failed = [r for r in results if not r["success"]]
+    cloned = sum(1 for r in results if r["success"] and r["action"] == "clone")
+    updated = sum(1 for r in results if r["success"] and r["action"] == "update")
+    unchanged = sum(1 for r in results if r["success"] and r["action"] == "locked")
+    serial = sum(r["elapsed"] for r in results)
+
+    print("Summary")
+    print("=" * 50)
+    print(f"  Cloned:  {cloned}")
+    print(f"  Updated: {updated}")
+    if unchanged:
+        print(f"  Already at locked commit: {unchanged}")
+    print(f"  Failed:  {len(failed)}")
+    print(f"  Wall time: {elapsed:.1f}s (sum of per-library time: {serial:.1f}s)")
+    print(f"  Disk usage: {format_size(sum(r['disk_usage'] for r in results))}")
+    print()
+    print(f"  {'Library':<24} {'Strategy':<9} {'Time':>8} {'Disk':>10}")
+    for r in sorted(results, key=lambda r: r["disk_usage"], reverse=True):
+        disk = "-" if r["action"] == "locked" else format_size(r["disk_usage"])
+        print(f"  {r['name']:<24} {r.get('strategy', '-'):<9} {r['elapsed']:>7.1f}s {disk:>10}")
+    for r in failed:
+        print(f"  ✗ {r['name']} ({r['attempts']} attempts): {r['error']}")
+
+    return 1 if failed else 0
+
+def load_lockfile(lockfile):
+    """Read the lockfile, printing an error and returning None if it is missing or invalid"""
+    if not lockfile.exists():
+        print(f"Error: Lockfile not found: {lockfile}")
+        return None
+    try:
+        return library_lock.read_lockfile(lockfile)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return None
+
+def restore_snapshot(snapshot, libraries_dir, jobs, lockfile=None):
+    """Install libraries from a snapshot, optionally verifying them against ``lockfile``"""
+    print(f"Restoring libraries from snapshot: {snapshot}")
+    print()
+    start = time.monotonic()
+    try:
+        results = library_snapshot.import_snapshot(snapshot, libraries_dir, jobs, force=lockfile is not None)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"Error: {e}")
+        return 1
+    exit_code = library_snapshot.print_results(results, time.monotonic() - start)
+    print(scad_symbols.refresh())
+    if exit_code == 0 and lockfile is not None:
+        pins = load_lockfile(lockfile)
+        if pins is None:
+            return 1
+        print()
+        results, elapsed = library_lock.timed_verify(pins, libraries_dir)
+        exit_code = library_lock.print_verification(results, elapsed)
+    return exit_code
+
+def print_usage():
+    """Print command line usage"""
+    print("Usage:")
+    print("  python3 download_libraries.py [options]           # Download/update libraries")
+    print("  python3 download_libraries.py lock                # Write libraries.lock from libraries/")
+    print("  python3 download_libraries.py verify              # Check libraries/ against libraries.lock")
+    print()
+    print("Options:")
+    print(f"  --jobs N        Number of libraries to sync concurrently (default: {DEFAULT_JOBS})")
+    print(f"  --timeout S     Per-library git timeout in seconds (default: {DEFAULT_TIMEOUT})")
+    print(f"  --retries N     Retries per library with exponential backoff (default: {DEFAULT_RETRIES})")
+    print("  --only a,b,...  Only sync the named libraries")
+    print(f"  --strategy S    Clone strategy for all libraries: {', '.join(CLONE_STRATEGIES)}")
+    print("                  (default: each library's \"strategy\" entry, else full)")
+    print("  --cache         Clone and refresh through the shared mirror cache")
+    print(f"                  (enabled automatically when {library_cache.CACHE_ENV} is set)")
+    print("  --locked        Install the exact commits recorded in the lockfile")
+    print(f"  --lockfile PATH Lockfile to use (default: <workspace>/{library_lock.LOCKFILE_NAME})")
+    print("  --snapshot FILE Restore libraries from a snapshot instead of the network")
+    print("                  (with --locked, verify them against the lockfile afterwards)")
+
+def main(argv=None):
     """Main function to download all libraries"""
+    args = list(sys.argv[1:] if argv is None else argv)
+    if "-h" in args or "--help" in args:
+        print_usage()
+        return 0
+
     script_dir = Path(__file__).parent
     workspace_dir = script_dir.parent
     libraries_dir = workspace_dir / "libraries"
+    lockfile = Path(pop_option(args, "--lockfile", library_lock.default_lockfile(workspace_dir)))
+
+    if args and args[0] == "lock":
+        entries = library_lock.create_lock(libraries_dir, LIBRARIES) if libraries_dir.exists() else {}
+        library_lock.write_lockfile(lockfile, entries)
+        print(f"✓ Locked {len(entries)} libraries in {lockfile}")
+        return 0
+    if args and args[0] == "verify":
+        pins = load_lockfile(lockfile)
+        if pins is None:
+            return 1
+        results, elapsed = library_lock.timed_verify(pins, libraries_dir)
+        return library_lock.print_verification(results, elapsed)
+
+    jobs = pop_option(args, "--jobs", DEFAULT_JOBS, int)
+    timeout = pop_option(args, "--timeout", DEFAULT_TIMEOUT, float)
+    retries = pop_option(args, "--retries", DEFAULT_RETRIES, int)
+    only = pop_option(args, "--only")
+    use_cache = library_cache.cache_enabled()
+    if "--cache" in args:
+        args.remove("--cache")
+        use_cache = True
+    locked = "--locked" in args
+    if locked:
+        args.remove("--locked")
+    strategy = pop_option(args, "--strategy")
+    snapshot = pop_option(args, "--snapshot")
+    if strategy and strategy not in CLONE_STRATEGIES:
+        print(f"Unknown clone strategy: {strategy}")
+        print(f"Available strategies: {', '.join(CLONE_STRATEGIES)}")
+        return 2
+    if args:
+        print(f"Unknown arguments: {' '.join(args)}")
+        print_usage()
+        return 2
+
+    if snapshot:
+        return restore_snapshot(Path(snapshot), libraries_dir, jobs, lockfile if locked else None)
+
+    libraries = LIBRARIES
+    pins = None
+    if locked:
+        pins = load_lockfile(lockfile)
+        if pins is None:
+            return 1
+        libraries = {
+            name: dict(LIBRARIES.get(name, {"description": name}), url=entry["url"])
+            for name, entry in pins.items()
+        }
+    if only:
+        names = [n.strip() for n in only.split(",") if n.strip()]
+        unknown = [n for n in names if n not in libraries]
+        if unknown:
+            print(f"Unknown libraries: {', '.join(unknown)}")
+            return 2
+        libraries = {n: libraries[n] for n in names}
     
     # Create libraries directory
     libraries_dir.mkdir(exist_ok=True)
@@ -152,25 +474,32 @@ def main():
     print("OpenSCAD Libraries Downloader")
     print("=" * 50)
     print(f"Downloading to: {libraries_dir}")
+    print(f"Syncing {len(libraries)} libraries with {jobs} workers")
+    if use_cache:
+        print(f"Using shared library cache: {library_cache.get_cache_dir()}")
     print()
     
     # Check if git is available
-    success, _, _ = run_command("git --version")
+    success, _, _ = run_command(["git", "--version"])
     if not success:
         print("Error: Git is not installed or not in PATH")
         print("Please install Git to download the libraries")
-        sys.exit(1)
+        return 1
     
-    # Download all libraries
-    for name, info in LIBRARIES.items():
-        download_library(name, info, libraries_dir)
-        print()
+    # Download all libraries concurrently
+    start = time.monotonic()
+    results = sync_libraries(libraries, libraries_dir, jobs=jobs, timeout=timeout,
+                             retries=retries, strategy=strategy, use_cache=use_cache, pins=pins)
+    exit_code = print_summary(results, time.monotonic() - start)
+    print(scad_symbols.refresh())
+    print()
     
-    print("Download complete!")
+    print("Download complete!" if exit_code == 0 else "Download finished with errors")
     print(f"Libraries are available in: {libraries_dir}")
     print()
     print("To use a library in your OpenSCAD files:")
     print("  use <libraries/library-name/main-file.scad>")
+    return exit_code
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
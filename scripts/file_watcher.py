@@ -0,0 +1,160 @@
+"""
+OpenSCAD File Watcher
+Event-driven change notification for .scad files
+
+Uses inotify on Linux (through ctypes, no extra packages) and falls back to
+polling elsewhere. Both watchers share the same small interface:
+``watch_directory()``, ``wait()`` and ``close()``.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+# Quiet period that ends an editor's burst of save events
+DEBOUNCE_SECONDS = 0.15
+POLL_INTERVAL = 0.25
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+def is_watched_file(name):
+    """Return True for files whose changes should trigger a render"""
+    return name.endswith(".scad")
+
+class InotifyWatcher:
+    """Watch directories with Linux inotify"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        self._recursive = set()
+
+    def watch_directory(self, directory, recursive=False):
+        """Watch ``directory`` (and, if ``recursive``, all directories below it)"""
+        directory = Path(directory).resolve()
+        if recursive:
+            self._recursive.add(directory)
+        if directory in self._dirs.values():
+            if not recursive:
+                return
+        else:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self._dirs[wd] = directory
+        if recursive:
+            for child in directory.iterdir():
+                if child.is_dir() and child.name != ".git" and not child.is_symlink():
+                    self.watch_directory(child, recursive=True)
+
+    def wait(self, timeout=None):
+        """Block until events arrive (or ``timeout`` expires); return changed paths"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and any(
+                        directory == root or root in directory.parents for root in self._recursive):
+                    self.watch_directory(path, recursive=True)
+            elif is_watched_file(name):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        """Release the inotify descriptor"""
+        os.close(self._fd)
+
+class PollingWatcher:
+    """Portable fallback that compares file mtimes at a short interval"""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self._dirs = {}
+        self._snapshot = {}
+
+    def watch_directory(self, directory, recursive=False):
+        """Watch ``directory`` (and, if ``recursive``, all directories below it)"""
+        directory = Path(directory).resolve()
+        self._dirs[directory] = self._dirs.get(directory, False) or recursive
+        self._snapshot.update(self._scan_directory(directory, self._dirs[directory]))
+
+    def _scan_directory(self, directory, recursive):
+        files = {}
+        pattern = "**/*.scad" if recursive else "*.scad"
+        for path in directory.glob(pattern):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def wait(self, timeout=None):
+        """Poll until something changes (or ``timeout`` expires); return changed paths"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = {}
+            for directory, recursive in self._dirs.items():
+                snapshot.update(self._scan_directory(directory, recursive))
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            time.sleep(max(0.0, remaining))
+
+    def close(self):
+        """Nothing to release"""
+
+def create_watcher():
+    """Return an inotify watcher where available, else a polling watcher"""
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher()
+
+def wait_for_changes(watcher, timeout=None, debounce=DEBOUNCE_SECONDS):
+    """Wait for a change and keep collecting until the burst has been quiet for ``debounce``"""
+    changed = watcher.wait(timeout)
+    if not changed:
+        return changed
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changed
+        changed |= more
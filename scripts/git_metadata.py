@@ -0,0 +1,117 @@
+"""
+Git Metadata Reader
+Read checkout state straight from the .git directory without spawning git
+
+Used wherever the scripts only need to know which commit a library is on;
+forking ``git rev-parse`` per library costs far more than reading two files.
+"""
+
+from pathlib import Path
+
+# packed-refs contents keyed by (path, mtime_ns, size) so repeated lookups
+# against the same repository parse the file only once
+_packed_refs_cache = {}
+
+def resolve_git_dir(checkout):
+    """Return the git directory of a checkout (handles submodule/worktree ``.git`` files)"""
+    dot_git = Path(checkout) / ".git"
+    if dot_git.is_file():
+        content = dot_git.read_text().strip()
+        if content.startswith("gitdir:"):
+            return (dot_git.parent / content[len("gitdir:"):].strip()).resolve()
+    return dot_git
+
+def common_dir(git_dir):
+    """Return the directory holding refs and config (differs for linked worktrees)"""
+    commondir_file = Path(git_dir) / "commondir"
+    if commondir_file.is_file():
+        return (Path(git_dir) / commondir_file.read_text().strip()).resolve()
+    return Path(git_dir)
+
+def read_packed_refs(git_dir):
+    """Return a dict of ref name -> commit from ``packed-refs``"""
+    packed_file = common_dir(git_dir) / "packed-refs"
+    try:
+        stat = packed_file.stat()
+    except OSError:
+        return {}
+    key = (str(packed_file), stat.st_mtime_ns, stat.st_size)
+    refs = _packed_refs_cache.get(key)
+    if refs is None:
+        refs = {}
+        for line in packed_file.read_text().splitlines():
+            if not line or line[0] in "#^":
+                continue
+            sha, _, name = line.partition(" ")
+            refs[name.strip()] = sha
+        _packed_refs_cache[key] = refs
+    return refs
+
+def resolve_ref(git_dir, ref, depth=0):
+    """Resolve a ref name (e.g. ``refs/heads/main``) to a commit, or None"""
+    if depth > 5:
+        return None
+    for base in (Path(git_dir), common_dir(git_dir)):
+        ref_file = base / ref
+        if ref_file.is_file():
+            content = ref_file.read_text().strip()
+            if content.startswith("ref:"):
+                return resolve_ref(git_dir, content[4:].strip(), depth + 1)
+            return content or None
+    return read_packed_refs(git_dir).get(ref)
+
+def read_head(checkout):
+    """Return ``(branch_ref, commit)`` for a checkout; ``branch_ref`` is None when detached.
+
+    Returns ``(None, None)`` if the checkout is not a readable git repository.
+    """
+    git_dir = resolve_git_dir(checkout)
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+    except OSError:
+        return None, None
+    if head.startswith("ref:"):
+        ref = head[4:].strip()
+        return ref, resolve_ref(git_dir, ref)
+    return None, head or None
+
+def head_commit(checkout):
+    """Return the commit checked out in ``checkout``, or None"""
+    return read_head(checkout)[1]
+
+def is_shallow(checkout):
+    """Return True if the checkout is a shallow clone"""
+    return (common_dir(resolve_git_dir(checkout)) / "shallow").exists()
+
+def read_config(checkout):
+    """Parse the repository ``config`` into ``{section: {key: value}}``.
+
+    Subsections are kept in git's spelling, e.g. ``remote "origin"``.
+    Only the subset of the format git itself writes is supported.
+    """
+    config_file = common_dir(resolve_git_dir(checkout)) / "config"
+    try:
+        lines = config_file.read_text().splitlines()
+    except OSError:
+        return {}
+    config = {}
+    section = None
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            name, _, subsection = line[1:-1].partition(" ")
+            section = name.lower() + (f" {subsection.strip()}" if subsection else "")
+            config.setdefault(section, {})
+        elif section is not None:
+            key, _, value = line.partition("=")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            config[section].setdefault(key.strip().lower(), value)
+    return config
+
+def remote_url(checkout, remote="origin"):
+    """Return the URL of ``remote`` from the repository config, or None"""
+    return read_config(checkout).get(f'remote "{remote}"', {}).get("url")
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Library Cache
+Machine-wide store of bare library mirrors shared by all workspaces
+
+Each library URL maps to one bare mirror under the cache directory. Workspaces
+clone from the mirror with ``--reference`` so their objects live in the cache
+(via git alternates) and refresh incrementally from it instead of GitHub.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import git_metadata
+from cli_utils import disk_usage, file_lock, format_size, parse_size, run_command
+
+# Setting this variable enables the cache and selects its location
+CACHE_ENV = "OPENSCAD_LIBRARY_CACHE"
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "openscad-workspace" / "mirrors"
+INDEX_FILE = "index.json"
+
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+
+def cache_enabled():
+    """Return True if the shared cache is enabled through the environment"""
+    return bool(os.environ.get(CACHE_ENV))
+
+def get_cache_dir():
+    """Return the cache directory, creating it if needed"""
+    cache_dir = Path(os.environ.get(CACHE_ENV) or DEFAULT_CACHE_DIR).expanduser()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+def normalize_url(url):
+    """Normalize a repository URL so equivalent spellings share a mirror"""
+    url = url.strip().rstrip("/")
+    if url.endswith(".git"):
+        url = url[:-4]
+    scheme, sep, rest = url.partition("://")
+    if sep:
+        host, slash, path = rest.partition("/")
+        url = f"{scheme.lower()}://{host.lower()}{slash}{path}"
+    return url
+
+def mirror_key(url):
+    """Return the cache key for a repository URL"""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()[:16]
+
+def mirror_path(url, cache_dir=None):
+    """Return the mirror directory for a repository URL"""
+    return (cache_dir or get_cache_dir()) / f"{mirror_key(url)}.git"
+
+def load_index(cache_dir):
+    """Load the cache index"""
+    index_file = cache_dir / INDEX_FILE
+    try:
+        index = json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        index = {}
+    index.setdefault("mirrors", {})
+    index.setdefault("stats", {"hits": 0, "misses": 0})
+    return index
+
+def save_index(cache_dir, index):
+    """Atomically write the cache index"""
+    tmp_file = cache_dir / f"{INDEX_FILE}.{os.getpid()}.tmp"
+    tmp_file.write_text(json.dumps(index, indent=2, sort_keys=True))
+    os.replace(tmp_file, cache_dir / INDEX_FILE)
+
+@contextmanager
+def edit_index(cache_dir):
+    """Read-modify-write the cache index under the cache lock"""
+    with file_lock(cache_dir / ".lock"):
+        index = load_index(cache_dir)
+        yield index
+        save_index(cache_dir, index)
+
+def ensure_mirror(url, timeout=None, refresh=True, cache_dir=None):
+    """Create or incrementally refresh the mirror for ``url``.
+
+    Returns ``(success, mirror_dir, stderr)``.
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    mirror = mirror_path(url, cache_dir)
+    key = mirror.stem
+
+    with file_lock(cache_dir / f"{key}.lock"):
+        hit = mirror.exists()
+        if not hit:
+            tmp_dir = cache_dir / f"{key}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            success, stdout, stderr = run_command(
+                ["git", "clone", "--bare", "--quiet", url, str(tmp_dir)], timeout=timeout
+            )
+            if success:
+                # Track branches and tags only; GitHub's refs/pull/* would bloat the mirror
+                run_command(["git", "config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"],
+                            cwd=tmp_dir)
+                os.replace(tmp_dir, mirror)
+            else:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return False, mirror, stderr
+        elif refresh:
+            success, stdout, stderr = run_command(
+                ["git", "fetch", "--prune", "--tags", "--quiet", "origin"], cwd=mirror, timeout=timeout
+            )
+            if not success:
+                return False, mirror, stderr
+        size = disk_usage(mirror)
+
+        # Still under the mirror lock, so a concurrent prune cannot drop the entry in between
+        with edit_index(cache_dir) as index:
+            entry = index["mirrors"].setdefault(key, {"url": url, "users": []})
+            entry["last_used"] = time.time()
+            entry["size"] = size
+            index["stats"]["hits" if hit else "misses"] += 1
+
+    return True, mirror, ""
+
+def register_user(url, lib_dir, cache_dir=None):
+    """Record that ``lib_dir`` borrows objects from the mirror for ``url``"""
+    cache_dir = cache_dir or get_cache_dir()
+    with edit_index(cache_dir) as index:
+        entry = index["mirrors"].setdefault(mirror_key(url), {"url": url, "users": []})
+        user = str(Path(lib_dir).resolve())
+        if user not in entry["users"]:
+            entry["users"].append(user)
+
+def clone_from_mirror(url, mirror, lib_dir, checkout=True, timeout=None):
+    """Clone ``lib_dir`` from a mirror, sharing its objects through alternates.
+
+    The clone's ``origin`` is pointed back at ``url`` so it stays a normal
+    checkout of the upstream repository. The mirror lock is held for the
+    whole clone and the workspace is registered before it starts, so
+    :func:`prune_cache` cannot evict the mirror underneath it.
+    """
+    cmd = ["git", "clone", "--quiet", "--reference", str(mirror), str(mirror), str(lib_dir)]
+    if not checkout:
+        cmd.insert(2, "--no-checkout")
+    with file_lock(mirror.parent / f"{mirror.stem}.lock"):
+        if not mirror.exists():
+            return False, f"mirror {mirror} was evicted from the cache"
+        register_user(url, lib_dir, mirror.parent)
+        success, stdout, stderr = run_command(cmd, timeout=timeout)
+        if not success:
+            return False, stderr
+        success, stdout, stderr = run_command(["git", "remote", "set-url", "origin", url], cwd=lib_dir)
+    return success, stderr
+
+def fetch_from_mirror(lib_dir, mirror, timeout=None):
+    """Update ``lib_dir``'s ``origin/*`` refs from its (already refreshed) mirror"""
+    success, stdout, stderr = run_command(
+        ["git", "fetch", "--quiet", "--tags", str(mirror), "+refs/heads/*:refs/remotes/origin/*"],
+        cwd=lib_dir, timeout=timeout
+    )
+    return success, stderr
+
+def update_from_mirror(lib_dir, mirror, timeout=None):
+    """Fast-forward ``lib_dir`` from its (already refreshed) mirror without network access"""
+    success, stderr = fetch_from_mirror(lib_dir, mirror, timeout)
+    if not success:
+        return False, stderr
+    success, stdout, stderr = run_command(["git", "merge", "--ff-only", "--quiet", "@{upstream}"],
+                                          cwd=lib_dir, timeout=timeout)
+    return success, stderr
+
+def dissociate(lib_dir, mirror):
+    """Copy borrowed objects into ``lib_dir`` so it no longer needs ``mirror``"""
+    alternates = git_metadata.resolve_git_dir(lib_dir) / "objects" / "info" / "alternates"
+    if not alternates.exists():
+        return True
+    mirror_objects = str((mirror / "objects").resolve())
+    lines = alternates.read_text().splitlines()
+    if not any(str(Path(line).resolve()) == mirror_objects for line in lines if line.strip()):
+        return True
+    success, stdout, stderr = run_command(["git", "repack", "-a", "-d", "--quiet"], cwd=lib_dir)
+    if not success:
+        return False
+    remaining = [line for line in lines if line.strip() and str(Path(line).resolve()) != mirror_objects]
+    if remaining:
+        alternates.write_text("\n".join(remaining) + "\n")
+    else:
+        alternates.unlink()
+    return True
+
+def prune_cache(max_size=DEFAULT_MAX_SIZE, max_age_days=None, dry_run=False, cache_dir=None):
+    """Evict least recently used mirrors until the cache fits the limits.
+
+    Workspaces that still borrow objects from an evicted mirror are
+    dissociated first (``git repack -a -d``) so they keep working. Each
+    mirror is evicted under its own lock (the one :func:`ensure_mirror` and
+    :func:`clone_from_mirror` hold), with its users re-read under that lock.
+    Returns the list of evicted index entries.
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    evicted = []
+    started = time.time()
+    with file_lock(cache_dir / ".lock"):
+        mirrors = sorted(load_index(cache_dir)["mirrors"].items(), key=lambda item: item[1].get("last_used", 0))
+    total = sum(entry.get("size", 0) for key, entry in mirrors)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+
+    for key, entry in mirrors:
+        too_old = cutoff is not None and entry.get("last_used", 0) < cutoff
+        if total <= max_size and not too_old:
+            continue
+        if dry_run:
+            evicted.append(dict(entry, key=key))
+            total -= entry.get("size", 0)
+            continue
+        mirror = cache_dir / f"{key}.git"
+        # Lock order is always mirror lock, then index lock
+        with file_lock(cache_dir / f"{key}.lock"):
+            with file_lock(cache_dir / ".lock"):
+                entry = load_index(cache_dir)["mirrors"].get(key)
+            # Gone, or used again since the candidates were chosen
+            if entry is None or entry.get("last_used", 0) >= started:
+                continue
+            users = [user for user in entry.get("users", []) if Path(user).exists()]
+            if not all(dissociate(Path(user), mirror) for user in users):
+                print(f"  ✗ Could not dissociate all users of {entry['url']}, keeping mirror")
+                continue
+            shutil.rmtree(mirror, ignore_errors=True)
+            with edit_index(cache_dir) as index:
+                index["mirrors"].pop(key, None)
+        evicted.append(dict(entry, key=key))
+        total -= entry.get("size", 0)
+    return evicted
+
+def print_stats(cache_dir=None):
+    """Print cache usage statistics"""
+    cache_dir = cache_dir or get_cache_dir()
+    index = load_index(cache_dir)
+    mirrors = index["mirrors"]
+    stats = index["stats"]
+    lookups = stats["hits"] + stats["misses"]
+
+    print("OpenSCAD Library Cache")
+    print("=" * 50)
+    print(f"Location: {cache_dir}")
+    print(f"Mirrors: {len(mirrors)}")
+    print(f"Total size: {format_size(sum(e.get('size', 0) for e in mirrors.values()))}")
+    if lookups:
+        print(f"Hit rate: {stats['hits']}/{lookups} ({100.0 * stats['hits'] / lookups:.0f}%)")
+    print()
+    for key, entry in sorted(mirrors.items(), key=lambda item: item[1].get("last_used", 0), reverse=True):
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.get("last_used", 0)))
+        users = sum(1 for user in entry.get("users", []) if Path(user).exists())
+        print(f"  {entry['url']}")
+        print(f"    Size: {format_size(entry.get('size', 0))}  Last used: {last_used}  Workspaces: {users}")
+
+def main(argv=None):
+    """Main function"""
+    args = list(sys.argv[1:] if argv is None else argv)
+    if not args or args[0] not in ("stats", "prune", "mirror", "sync"):
+        print("Usage:")
+        print("  python3 library_cache.py stats                       # Show cache usage")
+        print("  python3 library_cache.py prune [--max-size 10G] [--max-age DAYS] [--dry-run]")
+        print("  python3 library_cache.py mirror <url>                # Create/refresh a mirror, print its path")
+        print("  python3 library_cache.py sync <url> <dir>            # Clone or update <dir> through the cache")
+        print()
+        print(f"Set {CACHE_ENV}=<dir> to enable the cache for download_libraries.py and library_manager.py")
+        return 1
+
+    command = args.pop(0)
+    if command == "stats":
+        print_stats()
+    elif command == "mirror":
+        if not args:
+            print("Please specify a repository URL")
+            return 1
+        success, mirror, stderr = ensure_mirror(args[0])
+        if not success:
+            print(f"✗ Failed to mirror {args[0]}: {stderr.strip()}", file=sys.stderr)
+            return 1
+        print(mirror)
+    elif command == "sync":
+        if len(args) < 2:
+            print("Please specify a repository URL and a target directory")
+            return 1
+        url, lib_dir = args[0], Path(args[1])
+        success, mirror, stderr = ensure_mirror(url)
+        if success and lib_dir.exists():
+            success, stderr = update_from_mirror(lib_dir, mirror)
+        elif success:
+            success, stderr = clone_from_mirror(url, mirror, lib_dir)
+        if not success:
+            print(f"✗ Failed to sync {lib_dir} from {url}: {stderr.strip()}", file=sys.stderr)
+            return 1
+        print(f"✓ {lib_dir} synced from {mirror}")
+    else:
+        max_size, max_age, dry_run = DEFAULT_MAX_SIZE, None, False
+        while args:
+            option = args.pop(0)
+            try:
+                if option == "--max-size":
+                    max_size = parse_size(args.pop(0))
+                elif option == "--max-age":
+                    max_age = float(args.pop(0))
+                elif option == "--dry-run":
+                    dry_run = True
+                else:
+                    print(f"Unknown option: {option}")
+                    return 1
+            except (IndexError, ValueError):
+                print(f"Invalid value for {option}")
+                return 1
+        evicted = prune_cache(max_size, max_age, dry_run)
+        verb = "Would evict" if dry_run else "Evicted"
+        for entry in evicted:
+            print(f"  {verb} {entry['url']} ({format_size(entry.get('size', 0))})")
+        print(f"{verb} {len(evicted)} mirrors, {format_size(sum(e.get('size', 0) for e in evicted))}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
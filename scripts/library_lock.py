@@ -0,0 +1,110 @@
+"""
+OpenSCAD Library Lockfile
+Record and verify the exact library commits a workspace is built against
+
+``libraries.lock`` lives in the workspace root and maps each library name to
+its URL, commit and tree hash. Verification reads ``.git/HEAD`` and refs
+directly (see git_metadata.py), so checking every library spawns no
+processes.
+"""
+
+import json
+import subprocess
+import time
+from pathlib import Path
+
+import git_metadata
+
+LOCKFILE_NAME = "libraries.lock"
+LOCKFILE_VERSION = 1
+
+def default_lockfile(workspace_dir):
+    """Return the lockfile path for a workspace"""
+    return Path(workspace_dir) / LOCKFILE_NAME
+
+def read_lockfile(lockfile):
+    """Read a lockfile and return its ``libraries`` mapping.
+
+    Raises OSError if it cannot be read and ValueError if it is not a lockfile.
+    """
+    try:
+        data = json.loads(Path(lockfile).read_text())
+    except ValueError as e:
+        raise ValueError(f"{lockfile} is not valid JSON: {e}")
+    if not isinstance(data, dict) or data.get("version") != LOCKFILE_VERSION:
+        raise ValueError(f"Unsupported lockfile version: {data.get('version') if isinstance(data, dict) else None}")
+    libraries = data.get("libraries")
+    if not isinstance(libraries, dict) or not all(
+            isinstance(entry, dict) and "url" in entry and "commit" in entry for entry in libraries.values()):
+        raise ValueError(f"{lockfile} has no valid libraries table")
+    return libraries
+
+def write_lockfile(lockfile, libraries):
+    """Write a lockfile with entries sorted by library name"""
+    data = {"version": LOCKFILE_VERSION, "libraries": dict(sorted(libraries.items()))}
+    Path(lockfile).write_text(json.dumps(data, indent=2) + "\n")
+
+def tree_hash(lib_dir, commit="HEAD"):
+    """Return the tree hash of ``commit`` in ``lib_dir``, or None"""
+    result = subprocess.run(["git", "rev-parse", f"{commit}^{{tree}}"], cwd=lib_dir,
+                            capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def create_lock(libraries_dir, known_libraries=None):
+    """Build lock entries for every git checkout in ``libraries_dir``.
+
+    URLs come from ``known_libraries`` (the ``LIBRARIES`` table) when the
+    library is listed there, otherwise from the checkout's ``origin``.
+    """
+    known_libraries = known_libraries or {}
+    entries = {}
+    for lib_dir in sorted(Path(libraries_dir).iterdir()):
+        if not lib_dir.is_dir() or not (lib_dir / ".git").exists():
+            continue
+        commit = git_metadata.head_commit(lib_dir)
+        if not commit:
+            continue
+        url = known_libraries.get(lib_dir.name, {}).get("url") or git_metadata.remote_url(lib_dir)
+        entries[lib_dir.name] = {"url": url, "commit": commit, "tree": tree_hash(lib_dir)}
+    return entries
+
+def verify_lock(locked, libraries_dir):
+    """Compare checkouts against lock entries without spawning any process.
+
+    Returns a list of ``(name, status, detail)`` tuples where status is one
+    of ``ok``, ``missing``, ``mismatch`` or ``unlocked``.
+    """
+    results = []
+    for name, entry in sorted(locked.items()):
+        lib_dir = Path(libraries_dir) / name
+        commit = git_metadata.head_commit(lib_dir) if lib_dir.exists() else None
+        if commit is None:
+            results.append((name, "missing", "not installed"))
+        elif commit != entry["commit"]:
+            results.append((name, "mismatch", f"at {commit[:8]}, locked {entry['commit'][:8]}"))
+        else:
+            results.append((name, "ok", commit[:8]))
+
+    if Path(libraries_dir).exists():
+        for lib_dir in sorted(Path(libraries_dir).iterdir()):
+            if lib_dir.name not in locked and (lib_dir / ".git").exists():
+                results.append((lib_dir.name, "unlocked", "installed but not in lockfile"))
+    return results
+
+def print_verification(results, elapsed):
+    """Print verification results and return the process exit code"""
+    icons = {"ok": "✓", "missing": "✗", "mismatch": "✗", "unlocked": "?"}
+    for name, status, detail in results:
+        if status != "ok":
+            print(f"  {icons[status]} {name}: {detail}")
+    failed = sum(1 for r in results if r[1] in ("missing", "mismatch"))
+    locked = sum(1 for r in results if r[1] != "unlocked")
+    print(f"Verified {locked} locked libraries in {elapsed * 1000:.1f} ms: "
+          f"{locked - failed} ok, {failed} failed")
+    return 1 if failed else 0
+
+def timed_verify(locked, libraries_dir):
+    """Run :func:`verify_lock` and return ``(results, elapsed_seconds)``"""
+    start = time.perf_counter()
+    results = verify_lock(locked, libraries_dir)
+    return results, time.perf_counter() - start
@@ -5,56 +5,87 @@ Manage and update OpenSCAD libraries
 """
 
 import os
-import subprocess
 import sys
 import json
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
-def run_command(cmd, cwd=None):
-    """Run a command and return success status"""
-    try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        return result.returncode == 0, result.stdout, result.stderr
-    except Exception as e:
-        return False, "", str(e)
+import git_metadata
+import library_cache
+import library_snapshot
+import scad_symbols
+from cli_utils import run_command
+
+DEFAULT_JOBS = 8
+
+def read_git_state_batched(lib_dirs):
+    """Read commit and origin URL for several checkouts with one subprocess.
+
+    Fallback for checkouts whose metadata cannot be read in-process (e.g. an
+    unusual ref storage); returns ``{path: (commit, remote_url)}``.
+    """
+    if not lib_dirs:
+        return {}
+    script = "; ".join(
+        f"git -C {shlex.quote(str(d))} rev-parse --verify -q HEAD || echo unknown; "
+        f"git -C {shlex.quote(str(d))} remote get-url origin 2>/dev/null || echo unknown"
+        for d in lib_dirs
+    )
+    success, stdout, stderr = run_command(script)
+    lines = stdout.splitlines()
+    if len(lines) != 2 * len(lib_dirs):
+        return {d: ("unknown", "unknown") for d in lib_dirs}
+    return {d: (lines[2 * i].strip(), lines[2 * i + 1].strip()) for i, d in enumerate(lib_dirs)}
 
 def get_library_status(libraries_dir):
-    """Get status of all libraries"""
+    """Get status of all libraries.
+
+    Commits and remote URLs are read directly from each checkout's git
+    metadata; only checkouts that cannot be read that way fall back to a
+    single batched git invocation.
+    """
     libraries = {}
+    unresolved = []
+    
+    if not libraries_dir.exists():
+        return libraries
     
     for lib_dir in libraries_dir.iterdir():
         if lib_dir.is_dir() and lib_dir.name != ".git":
             # Check if it's a git repository
             git_dir = lib_dir / ".git"
             if git_dir.exists():
-                # Get current commit
-                success, stdout, stderr = run_command("git rev-parse HEAD", cwd=lib_dir)
-                if success:
-                    current_commit = stdout.strip()
-                else:
-                    current_commit = "unknown"
-                
-                # Get remote URL
-                success, stdout, stderr = run_command("git remote get-url origin", cwd=lib_dir)
-                if success:
-                    remote_url = stdout.strip()
-                else:
-                    remote_url = "unknown"
+                branch, current_commit = git_metadata.read_head(lib_dir)
+                remote_url = git_metadata.remote_url(lib_dir)
+                if current_commit is None or remote_url is None:
+                    unresolved.append(lib_dir)
                 
                 libraries[lib_dir.name] = {
                     "path": str(lib_dir),
                     "status": "installed",
-                    "commit": current_commit,
-                    "remote": remote_url
+                    "commit": current_commit or "unknown",
+                    "branch": branch[len("refs/heads/"):] if branch else "detached",
+                    "remote": remote_url or "unknown"
                 }
             else:
                 libraries[lib_dir.name] = {
                     "path": str(lib_dir),
                     "status": "not_git",
                     "commit": "unknown",
+                    "branch": "unknown",
                     "remote": "unknown"
                 }
     
+    for lib_dir, (commit, remote_url) in read_git_state_batched(unresolved).items():
+        info = libraries[lib_dir.name]
+        if info["commit"] == "unknown":
+            info["commit"] = commit
+        if info["remote"] == "unknown":
+            info["remote"] = remote_url
+    
     return libraries
 
 def update_library(lib_name, libraries_dir):
@@ -66,19 +97,156 @@ def update_library(lib_name, libraries_dir):
         return False
     
     print(f"Updating {lib_name}...")
-    success, stdout, stderr = run_command("git pull", cwd=lib_dir)
+    remote_url = git_metadata.remote_url(lib_dir)
+    if library_cache.cache_enabled() and remote_url:
+        # Refresh the shared mirror once, then fast-forward from it locally
+        success, mirror, stderr = library_cache.ensure_mirror(remote_url)
+        if success:
+            success, stderr = library_cache.update_from_mirror(lib_dir, mirror)
+    else:
+        success, stdout, stderr = run_command("git pull", cwd=lib_dir)
     
     if success:
         print(f"  ✓ {lib_name} updated successfully")
+        print(f"  {scad_symbols.refresh()}")
         return True
     else:
         print(f"  ✗ Failed to update {lib_name}: {stderr}")
         return False
 
-def list_libraries(libraries_dir):
+def upstream_ref(lib_dir, branch):
+    """Return the remote-tracking ref a checkout follows.
+
+    Uses the branch's configured upstream, or ``origin/HEAD`` for detached
+    checkouts such as submodules.
+    """
+    if branch:
+        name = branch[len("refs/heads/"):]
+        config = git_metadata.read_config(lib_dir).get(f'branch "{name}"', {})
+        remote, merge = config.get("remote"), config.get("merge")
+        if remote and merge and merge.startswith("refs/heads/"):
+            return f"refs/remotes/{remote}/{merge[len('refs/heads/'):]}"
+    return "refs/remotes/origin/HEAD"
+
+def fetch_and_fast_forward(lib_dir, use_cache=False):
+    """Fetch a library and fast-forward it only if its upstream moved.
+
+    Returns a report entry with the old and new commit and the ``.scad``
+    files that changed between them. A checkout whose branch already
+    contains the upstream commit is reported as ``ahead`` and left alone.
+    """
+    start = time.monotonic()
+    branch, old_commit = git_metadata.read_head(lib_dir)
+    report = {"name": lib_dir.name, "status": "unchanged", "old_commit": old_commit,
+              "new_commit": old_commit, "changed_scad_files": [], "error": ""}
+
+    remote_url = git_metadata.remote_url(lib_dir)
+    if use_cache and remote_url:
+        success, mirror, stderr = library_cache.ensure_mirror(remote_url)
+        if success:
+            success, stderr = library_cache.fetch_from_mirror(lib_dir, mirror)
+    else:
+        success, stdout, stderr = run_command(["git", "fetch", "--quiet", "origin"], cwd=lib_dir)
+
+    if success:
+        new_commit = git_metadata.resolve_ref(git_metadata.resolve_git_dir(lib_dir),
+                                              upstream_ref(lib_dir, branch))
+        if new_commit is None:
+            report["status"] = "skipped"
+            report["error"] = "no upstream branch"
+        elif new_commit != old_commit and old_commit and run_command(
+                ["git", "merge-base", "--is-ancestor", new_commit, old_commit], cwd=lib_dir)[0]:
+            report["status"] = "ahead"
+        elif new_commit != old_commit:
+            success, stdout, stderr = run_command(["git", "merge", "--ff-only", "--quiet", new_commit],
+                                                  cwd=lib_dir)
+            if success and git_metadata.head_commit(lib_dir) != new_commit:
+                success, stderr = False, f"HEAD did not move to {new_commit[:8]}"
+            if success:
+                report["status"] = "updated"
+                report["new_commit"] = new_commit
+                ok, stdout, _ = run_command(
+                    ["git", "diff", "--name-only", old_commit, new_commit, "--", "*.scad"], cwd=lib_dir
+                )
+                report["changed_scad_files"] = stdout.split() if ok else []
+
+    if not success:
+        report["status"] = "failed"
+        report["error"] = stderr.strip()
+    report["elapsed"] = round(time.monotonic() - start, 3)
+    return report
+
+def update_all_parallel(lib_dirs, jobs=DEFAULT_JOBS, use_cache=False):
+    """Fetch and fast-forward many libraries concurrently.
+
+    Libraries whose upstream has not moved are left untouched. Returns the
+    report entries in the order of ``lib_dirs``.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(lambda d: fetch_and_fast_forward(d, use_cache), lib_dirs))
+
+def print_update_report(report):
+    """Print a human-readable update report and return the process exit code"""
+    icons = {"updated": "↑", "ahead": "+", "unchanged": "=", "skipped": "-", "failed": "✗"}
+    for entry in report:
+        line = f"{icons[entry['status']]} {entry['name']}: {entry['status']}"
+        if entry["status"] == "updated":
+            line += (f" {entry['old_commit'][:8]} -> {entry['new_commit'][:8]}"
+                     f" ({len(entry['changed_scad_files'])} .scad files changed)")
+        elif entry["status"] == "ahead":
+            line += f" (local commits not upstream, at {entry['old_commit'][:8]})"
+        elif entry["error"]:
+            line += f" ({entry['error']})"
+        print(line)
+    counts = {status: sum(1 for e in report if e["status"] == status) for status in icons}
+    print()
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    return 1 if counts["failed"] else 0
+
+def write_update_report(report, report_file):
+    """Write a machine-readable update report"""
+    data = {"generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "libraries": report}
+    Path(report_file).write_text(json.dumps(data, indent=2) + "\n")
+
+def run_update_all(lib_dirs, args):
+    """Handle the ``update-all`` options shared with update_libraries.py"""
+    jobs, report_file, as_json = DEFAULT_JOBS, None, False
+    while args:
+        option = args.pop(0)
+        try:
+            if option == "--jobs":
+                jobs = int(args.pop(0))
+            elif option == "--report":
+                report_file = args.pop(0)
+            elif option == "--json":
+                as_json = True
+            else:
+                print(f"Unknown option: {option}")
+                return 1
+        except (IndexError, ValueError):
+            print(f"Invalid value for {option}")
+            return 1
+
+    report = update_all_parallel(lib_dirs, jobs, library_cache.cache_enabled())
+    if report_file:
+        write_update_report(report, report_file)
+    symbols = scad_symbols.refresh()
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return 1 if any(e["status"] == "failed" for e in report) else 0
+    exit_code = print_update_report(report)
+    print(symbols)
+    return exit_code
+
+def list_libraries(libraries_dir, as_json=False):
     """List all available libraries"""
     libraries = get_library_status(libraries_dir)
     
+    if as_json:
+        print(json.dumps(dict(sorted(libraries.items())), indent=2))
+        return
+    
     print("OpenSCAD Libraries Status")
     print("=" * 50)
     
@@ -94,7 +262,7 @@ def list_libraries(libraries_dir):
         if info["remote"] != "unknown":
             print(f"  Remote: {info['remote']}")
         if info["commit"] != "unknown":
-            print(f"  Commit: {info['commit'][:8]}")
+            print(f"  Commit: {info['commit'][:8]} ({info['branch']})")
         print()
 
 def main():
@@ -105,15 +273,21 @@ def main():
     
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  python3 library_manager.py list                    # List all libraries")
+        print("  python3 library_manager.py list [--json]           # List all libraries")
         print("  python3 library_manager.py update <library>       # Update specific library")
-        print("  python3 library_manager.py update-all             # Update all libraries")
+        print("  python3 library_manager.py update-all [--jobs N] [--report FILE] [--json]")
+        print("                                                    # Update all libraries in parallel")
+        print("  python3 library_manager.py cache stats            # Show shared cache usage")
+        print("  python3 library_manager.py cache prune [options]  # Evict old cache mirrors")
+        print("  python3 library_manager.py snapshot export <file> # Pack all libraries for offline use")
+        print("  python3 library_manager.py snapshot import <file> [--force]")
+        print("                                                    # Restore libraries from a snapshot")
         sys.exit(1)
     
     command = sys.argv[1]
     
     if command == "list":
-        list_libraries(libraries_dir)
+        list_libraries(libraries_dir, as_json="--json" in sys.argv[2:])
     elif command == "update":
         if len(sys.argv) < 3:
             print("Please specify a library name")
@@ -122,9 +296,13 @@ def main():
         update_library(lib_name, libraries_dir)
     elif command == "update-all":
         libraries = get_library_status(libraries_dir)
-        for lib_name in libraries.keys():
-            update_library(lib_name, libraries_dir)
-            print()
+        lib_dirs = [Path(info["path"]) for name, info in sorted(libraries.items())
+                    if info["status"] == "installed"]
+        sys.exit(run_update_all(lib_dirs, sys.argv[2:]))
+    elif command == "cache":
+        sys.exit(library_cache.main(sys.argv[2:]))
+    elif command == "snapshot":
+        sys.exit(library_snapshot.main(sys.argv[2:], libraries_dir))
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Library Snapshots
+Pack all installed libraries into one file and restore them without network
+
+A snapshot is a tar archive (optionally .tar.gz) that starts with
+``manifest.json`` (URL, branch, commit and tree hash of every library, as
+in libraries.lock) followed by one git bundle per library. Bundles are
+packfiles, so each repository's history is already delta-compressed and
+deduplicated. Shallow and partial clones cannot be bundled and are stored
+as plain directory trees instead.
+
+Import reads the archive in a single streaming pass. Bundles are cloned
+in parallel while the rest of the stream is still being read, and every
+library is moved into libraries/ only once it is at the recorded commit.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import git_metadata
+import library_lock
+import scad_symbols
+from cli_utils import format_size, pop_option, run_command
+
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DEFAULT_JOBS = 8
+COPY_CHUNK = 1024 * 1024
+# Reject absolute paths, links out of the target and device files on import
+EXTRACT_OPTIONS = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+def snapshot_format(lib_dir):
+    """Return how a checkout is stored: ``bundle``, or ``tree`` for shallow/partial clones"""
+    config = git_metadata.read_config(lib_dir)
+    partial = config.get("extensions", {}).get("partialclone") or any(
+        values.get("promisor") == "true" for section, values in config.items() if section.startswith("remote"))
+    return "tree" if git_metadata.is_shallow(lib_dir) or partial else "bundle"
+
+def tar_mode(path, writing):
+    """Return the streaming tarfile mode for a snapshot path (.tar.gz/.tgz are gzipped)"""
+    gzipped = str(path).lower().endswith((".gz", ".tgz"))
+    if writing:
+        return "w|gz" if gzipped else "w|"
+    return "r|*"
+
+def file_sha256(path):
+    """Return the SHA-256 of a file"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(COPY_CHUNK), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def create_bundle(name, lib_dir, staging_dir):
+    """Bundle a checkout's branches, tags and HEAD; return ``(path, error)``"""
+    bundle = staging_dir / f"{name}.bundle"
+    success, stdout, stderr = run_command(["git", "bundle", "create", "--quiet", str(bundle),
+                                           "--branches", "--tags", "HEAD"], cwd=lib_dir)
+    return (bundle, None) if success else (None, stderr.strip() or "git bundle failed")
+
+def export_snapshot(libraries_dir, output, jobs=DEFAULT_JOBS):
+    """Write a snapshot of every git checkout in ``libraries_dir``; return ``(manifest, errors)``"""
+    libraries_dir = Path(libraries_dir)
+    entries = library_lock.create_lock(libraries_dir)
+    with tempfile.TemporaryDirectory(prefix="snapshot-") as staging:
+        staging_dir = Path(staging)
+
+        def prepare(name):
+            lib_dir = libraries_dir / name
+            entry = dict(entries[name], branch=git_metadata.read_head(lib_dir)[0], format=snapshot_format(lib_dir))
+            if entry["format"] == "bundle":
+                bundle, error = create_bundle(name, lib_dir, staging_dir)
+                if error:
+                    return name, None, error
+                entry.update(size=bundle.stat().st_size, sha256=file_sha256(bundle))
+            return name, entry, None
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            prepared = list(pool.map(prepare, sorted(entries)))
+        libraries = {name: entry for name, entry, error in prepared if entry}
+        errors = {name: error for name, entry, error in prepared if error}
+        manifest = {"version": SNAPSHOT_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "libraries": libraries}
+
+        output = Path(output)
+        tmp_output = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+        with tarfile.open(str(tmp_output), tar_mode(output, True)) as archive:
+            data = json.dumps(manifest, indent=2).encode()
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size, info.mtime = len(data), int(time.time())
+            archive.addfile(info, io.BytesIO(data))
+            for name, entry in libraries.items():
+                if entry["format"] == "bundle":
+                    archive.add(staging_dir / f"{name}.bundle", arcname=f"bundles/{name}.bundle")
+                else:
+                    archive.add(libraries_dir / name, arcname=f"trees/{name}")
+        os.replace(tmp_output, output)
+    return manifest, errors
+
+def read_manifest(snapshot):
+    """Return a snapshot's manifest (only the first member is read)"""
+    with tarfile.open(str(snapshot), tar_mode(snapshot, False)) as archive:
+        member = archive.next()
+        if member is None or member.name != MANIFEST_NAME:
+            raise ValueError(f"{snapshot}: not a library snapshot (no {MANIFEST_NAME})")
+        manifest = json.load(archive.extractfile(member))
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+    return manifest
+
+def checkout_commit(repo_dir, entry):
+    """Put a restored repository on the recorded branch and commit with its upstream URL"""
+    branch = entry.get("branch")
+    if git_metadata.head_commit(repo_dir) != entry["commit"]:
+        cmd = (["git", "checkout", "--quiet", "-B", branch[len("refs/heads/"):], entry["commit"]]
+               if branch and branch.startswith("refs/heads/") else
+               ["git", "checkout", "--quiet", "--detach", entry["commit"]])
+        success, stdout, stderr = run_command(cmd, cwd=repo_dir)
+        if not success:
+            return stderr.strip()
+    if entry.get("url"):
+        run_command(["git", "remote", "set-url", "origin", entry["url"]], cwd=repo_dir)
+    commit = git_metadata.head_commit(repo_dir)
+    return None if commit == entry["commit"] else f"at {str(commit)[:8]} after restore"
+
+def restore_bundle(bundle, entry, target):
+    """Clone a bundle into ``target`` at the recorded commit; return an error or None"""
+    success, stdout, stderr = run_command(["git", "clone", "--quiet", str(bundle), str(target)])
+    bundle.unlink(missing_ok=True)
+    return checkout_commit(target, entry) if success else stderr.strip()
+
+def install(name, staged, libraries_dir, trash_dir):
+    """Move a restored library into ``libraries_dir``, replacing an existing one"""
+    target = libraries_dir / name
+    if target.exists():
+        os.rename(target, trash_dir / name)
+    os.rename(staged, target)
+
+def import_snapshot(snapshot, libraries_dir, jobs=DEFAULT_JOBS, force=False):
+    """Restore libraries from a snapshot; return ``{name: (status, detail)}``.
+
+    Libraries already at the recorded commit are left alone; ones at another
+    commit are only replaced with ``force``.
+    """
+    libraries_dir = Path(libraries_dir)
+    libraries_dir.mkdir(parents=True, exist_ok=True)
+    staging_dir = Path(tempfile.mkdtemp(prefix=".snapshot-", dir=libraries_dir))
+    for sub_dir in ("repos", "trees", "trash"):
+        (staging_dir / sub_dir).mkdir()
+    results, restores = {}, {}
+    try:
+        with tarfile.open(str(snapshot), tar_mode(snapshot, False)) as archive, \
+                ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            manifest = wanted = None
+            for member in archive:
+                if manifest is None:
+                    if member.name != MANIFEST_NAME:
+                        raise ValueError(f"{snapshot}: not a library snapshot (no {MANIFEST_NAME})")
+                    manifest = json.load(archive.extractfile(member))
+                    if manifest.get("version") != SNAPSHOT_VERSION:
+                        raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+                    wanted = {}
+                    for name, entry in manifest["libraries"].items():
+                        installed = git_metadata.head_commit(libraries_dir / name)
+                        if installed == entry["commit"]:
+                            results[name] = ("unchanged", entry["commit"][:8])
+                        elif (libraries_dir / name).exists() and not force:
+                            results[name] = ("skipped", f"installed at {str(installed)[:8]}, use --force to replace")
+                        else:
+                            wanted[name] = entry
+                    continue
+
+                section, _, path = member.name.partition("/")
+                name = path[:-len(".bundle")] if section == "bundles" else path.split("/", 1)[0]
+                if name not in wanted:
+                    continue
+                if section == "bundles":
+                    bundle = staging_dir / f"{name}.bundle"
+                    hasher = hashlib.sha256()
+                    with archive.extractfile(member) as source, open(bundle, "wb") as handle:
+                        for chunk in iter(lambda: source.read(COPY_CHUNK), b""):
+                            hasher.update(chunk)
+                            handle.write(chunk)
+                    if hasher.hexdigest() != wanted[name].get("sha256"):
+                        results[name] = ("failed", "bundle checksum mismatch")
+                        del wanted[name]
+                        continue
+                    restores[name] = pool.submit(restore_bundle, bundle, wanted[name], staging_dir / "repos" / name)
+                elif section == "trees":
+                    archive.extract(member, staging_dir, **EXTRACT_OPTIONS)
+            if manifest is None:
+                raise ValueError(f"{snapshot}: empty archive")
+
+            for name, entry in wanted.items():
+                if name in restores:
+                    error = restores[name].result()
+                    staged = staging_dir / "repos" / name
+                elif entry["format"] == "tree" and (staging_dir / "trees" / name).exists():
+                    staged = staging_dir / "trees" / name
+                    commit = git_metadata.head_commit(staged)
+                    error = None if commit == entry["commit"] else f"tree is at {str(commit)[:8]}"
+                else:
+                    error = "missing from snapshot"
+                if error:
+                    results[name] = ("failed", error)
+                    continue
+                install(name, staged, libraries_dir, staging_dir / "trash")
+                results[name] = ("restored", entry["commit"][:8])
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return dict(sorted(results.items()))
+
+def print_results(results, elapsed):
+    """Print import results and return the process exit code"""
+    icons = {"restored": "✓", "unchanged": "=", "skipped": "-", "failed": "✗"}
+    for name, (status, detail) in results.items():
+        print(f"{icons[status]} {name}: {status} ({detail})")
+    counts = {status: sum(1 for s, _ in results.values() if s == status) for status in icons}
+    print()
+    print(", ".join(f"{count} {status}" for status, count in counts.items()) + f" in {elapsed:.1f}s")
+    return 1 if counts["failed"] else 0
+
+def main(argv=None, libraries_dir=None):
+    """Main function"""
+    args = list(sys.argv[1:] if argv is None else argv)
+    libraries_dir = Path(libraries_dir or Path(__file__).resolve().parent.parent / "libraries")
+    if len(args) < 2 or args[0] not in ("export", "import", "show"):
+        print("Usage:")
+        print("  python3 library_snapshot.py export <file.tar|file.tar.gz> [--jobs N]")
+        print("                                        # Pack every library in libraries/")
+        print("  python3 library_snapshot.py import <file> [--force] [--jobs N]")
+        print("                                        # Restore libraries without network access")
+        print("  python3 library_snapshot.py show <file>   # List the libraries in a snapshot")
+        return 1
+
+    command, snapshot = args[0], Path(args[1])
+    args = args[2:]
+    jobs = pop_option(args, "--jobs", DEFAULT_JOBS, int)
+
+    start = time.monotonic()
+    try:
+        if command == "export":
+            if not libraries_dir.exists():
+                print(f"Error: {libraries_dir} does not exist")
+                return 1
+            manifest, errors = export_snapshot(libraries_dir, snapshot, jobs)
+            for name, error in errors.items():
+                print(f"✗ {name}: {error}")
+            print(f"✓ Packed {len(manifest['libraries'])} libraries into {snapshot} "
+                  f"({format_size(snapshot.stat().st_size)}) in {time.monotonic() - start:.1f}s")
+            return 1 if errors else 0
+        if command == "show":
+            manifest = read_manifest(snapshot)
+            print(f"Snapshot {snapshot} created {manifest['created']}")
+            for name, entry in sorted(manifest["libraries"].items()):
+                size = f", {format_size(entry['size'])}" if entry.get("size") else ""
+                print(f"  {name}: {entry['commit'][:8]} ({entry['format']}{size}) {entry.get('url') or ''}")
+            return 0
+        results = import_snapshot(snapshot, libraries_dir, jobs, "--force" in args)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"Error: {e}")
+        return 1
+    exit_code = print_results(results, time.monotonic() - start)
+    if any(status == "restored" for status, _ in results.values()):
+        print(scad_symbols.refresh())
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Parameter Sweep
+Render many variants of a model from a parameter grid or parameter-set file
+
+Variants are rendered with ``-D`` overrides across the render_preview.py
+worker pool. Identical variants are rendered once, and because the
+overrides are part of the render cache key, variants rendered before are
+served from the cache. A manifest maps every variant's parameters to its
+outputs and timings.
+"""
+
+import csv
+import hashlib
+import itertools
+import json
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import render_preview
+from cli_utils import pop_option
+from scad_values import format_value
+
+MAX_NAME_LENGTH = 80
+
+def parse_grid(definitions):
+    """Expand ``name=v1,v2`` definitions into the cartesian product of variants"""
+    axes = []
+    for definition in definitions:
+        name, sep, values = definition.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Invalid grid definition: {definition}")
+        axes.append([(name.strip(), value.strip()) for value in values.split(",")])
+    return [dict(combination) for combination in itertools.product(*axes)] if axes else []
+
+def load_parameter_sets(param_file):
+    """Load variants from a CSV file, a JSON list or an OpenSCAD Customizer JSON file.
+
+    Returns ``(name or None, parameters)`` pairs. A ``name`` CSV column or
+    JSON key names the variant; Customizer sets are named by their set name.
+    """
+    param_file = Path(param_file)
+    if param_file.suffix.lower() == ".csv":
+        with open(param_file, newline="") as handle:
+            rows = list(csv.DictReader(handle))
+        return [(row.pop("name", None) or None, row) for row in rows]
+
+    data = json.loads(param_file.read_text())
+    if isinstance(data, dict) and "parameterSets" in data:
+        return [(name, dict(values)) for name, values in data["parameterSets"].items()]
+    if isinstance(data, list):
+        return [(entry.pop("name", None), entry) for entry in (dict(e) for e in data)]
+    raise ValueError(f"Unsupported parameter file format: {param_file}")
+
+def safe_name(name):
+    """Reduce a variant name to file-name-safe characters and a bounded length"""
+    name = re.sub(r"[^A-Za-z0-9._-]+", "", str(name).replace(" ", "-")) or "default"
+    if len(name) > MAX_NAME_LENGTH:
+        digest = hashlib.sha256(name.encode()).hexdigest()[:12]
+        name = f"{name[:MAX_NAME_LENGTH - 13]}-{digest}"
+    return name
+
+def variant_name(parameters):
+    """Derive a file-name-safe variant name from its parameters"""
+    return safe_name("_".join(f"{k}-{v}" for k, v in parameters.items()))
+
+def override_options(parameters):
+    """Return the ``-D`` options for a variant (sorted, so equal variants match)"""
+    options = []
+    for name, value in sorted(parameters.items()):
+        options += ["-D", f"{name}={format_value(value)}"]
+    return options
+
+def plan_variants(named_sets):
+    """Name variants and group identical parameter sets.
+
+    Explicit names are reduced to file-name-safe characters like derived
+    ones, since they become part of the output paths.
+
+    Returns a list of variant dicts; duplicates carry ``duplicate_of``.
+    """
+    variants, seen, used_names = [], {}, set()
+    for name, parameters in named_sets:
+        name = safe_name(name) if name else variant_name(parameters)
+        base, counter = name, 2
+        while name in used_names:
+            name, counter = f"{base}-{counter}", counter + 1
+        used_names.add(name)
+        options = override_options(parameters)
+        key = tuple(options)
+        variant = {"name": name, "parameters": parameters, "options": options}
+        if key in seen:
+            variant["duplicate_of"] = seen[key]
+        else:
+            seen[key] = name
+        variants.append(variant)
+    return variants
+
+def run_sweep(scad_file, variants, output_dir, formats=("stl",), jobs=None, use_cache=True):
+    """Render all unique variants and return the manifest"""
+    scad_path = Path(scad_file).resolve()
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    pending = []
+    for variant in variants:
+        variant["outputs"] = {kind: str(output_dir / f"{scad_path.stem}__{variant['name']}.{kind}")
+                              for kind in formats}
+        if "duplicate_of" in variant:
+            continue
+        for kind in formats:
+            job = render_preview.make_job(scad_path, variant["outputs"][kind], kind, use_cache,
+                                          variant["options"])
+            job["variant"] = variant["name"]
+            pending.append(job)
+
+    unique = sum(1 for v in variants if "duplicate_of" not in v)
+    print(f"Sweeping {scad_path.name}: {len(variants)} variants, {unique} unique, "
+          f"{len(pending)} exports")
+    start = time.monotonic()
+    by_name = {v["name"]: v for v in variants}
+    for job in render_preview.run_jobs(pending, jobs, label=lambda job: job["variant"]):
+        variant = by_name[job["variant"]]
+        variant.setdefault("exports", {})[job["kind"]] = {
+            "success": job["success"], "cached": job["cached"],
+            "elapsed": round(job["elapsed"], 3), "error": job["stderr"] if not job["success"] else "",
+            "mesh": job.get("mesh")
+        }
+    elapsed = time.monotonic() - start
+
+    for variant in variants:
+        source = by_name[variant.get("duplicate_of", variant["name"])]
+        variant["outputs"] = source["outputs"]
+        variant["exports"] = source.get("exports", {})
+        variant["success"] = bool(variant["exports"]) and all(e["success"] for e in variant["exports"].values())
+        del variant["options"]
+
+    return {
+        "model": str(scad_path),
+        "openscad_version": render_preview.get_openscad_version(),
+        "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "elapsed": round(elapsed, 3),
+        "variants": variants,
+    }
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if not args or args[0].startswith("-"):
+        print("Usage:")
+        print("  python3 parameter_sweep.py <file.scad> [options]")
+        print()
+        print("Options:")
+        print("  -D name=v1,v2,...     Grid axis (repeatable; the cartesian product is rendered)")
+        print("  --params FILE         CSV, JSON list or OpenSCAD Customizer parameter-set file")
+        print("  --formats stl,png     Exports per variant (default: stl)")
+        print("  --jobs N              Worker processes (default: one per core)")
+        print("  --output DIR          Output directory (default: renders/<model>-sweep)")
+        print("  --manifest FILE       Manifest path (default: <output>/manifest.json)")
+        print("  --no-cache            Bypass the render cache")
+        sys.exit(1)
+
+    scad_file = Path(args.pop(0))
+    if not scad_file.exists():
+        print(f"Error: File {scad_file} does not exist")
+        sys.exit(1)
+
+    grid, param_files = [], []
+    while "-D" in args:
+        grid.append(pop_option(args, "-D"))
+    while "--params" in args:
+        param_files.append(pop_option(args, "--params"))
+    formats = pop_option(args, "--formats", "stl").split(",")
+    jobs = pop_option(args, "--jobs", None, int)
+    output_dir = Path(pop_option(args, "--output", f"renders/{scad_file.stem}-sweep"))
+    manifest_file = Path(pop_option(args, "--manifest", output_dir / "manifest.json"))
+    use_cache = "--no-cache" not in args
+    if not use_cache:
+        args.remove("--no-cache")
+    if args:
+        print(f"Unknown arguments: {' '.join(args)}")
+        sys.exit(1)
+    if any(kind not in ("stl", "png") for kind in formats):
+        print("Error: --formats accepts stl and png")
+        sys.exit(1)
+
+    try:
+        named_sets = [(None, params) for params in parse_grid(grid)]
+        for param_file in param_files:
+            named_sets += load_parameter_sets(param_file)
+        variants = plan_variants(named_sets)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not named_sets:
+        print("Error: No variants given (use -D and/or --params)")
+        sys.exit(1)
+
+    if render_preview.get_openscad_version() is None:
+        print("Error: OpenSCAD is not installed or not in PATH")
+        sys.exit(1)
+
+    manifest = run_sweep(scad_file, variants, output_dir, formats, jobs, use_cache)
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    manifest_file.write_text(json.dumps(manifest, indent=2) + "\n")
+
+    failed = [v for v in manifest["variants"] if not v["success"]]
+    print()
+    print(f"Rendered {len(manifest['variants']) - len(failed)}/{len(manifest['variants'])} variants "
+          f"in {manifest['elapsed']:.2f}s")
+    for variant in failed:
+        errors = [e["error"] for e in variant["exports"].values() if e["error"]]
+        print(f"  ✗ {variant['name']}: {errors[0].splitlines()[-1] if errors else 'failed'}")
+    print(f"Manifest: {manifest_file}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
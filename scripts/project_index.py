@@ -0,0 +1,159 @@
+"""
+OpenSCAD Project Index
+Cached metadata for every project in projects/
+
+The index lives in .openscad-cache/projects.json and records each project's
+.scad files and sizes, the PROJECT_NAME/PROJECT_VERSION/... metadata from
+the template header of its main file, and whether its renders are up to
+date. A refresh stats every project file but re-reads only files whose
+size or mtime changed.
+"""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+PROJECTS_DIR = WORKSPACE_DIR / "projects"
+RENDERS_DIR = WORKSPACE_DIR / "renders"
+INDEX_FILE = WORKSPACE_DIR / ".openscad-cache" / "projects.json"
+INDEX_VERSION = 1
+
+# Metadata assignments in the project template header, e.g. PROJECT_VERSION = "1.0.0";
+METADATA_RE = re.compile(r'^\s*PROJECT_(NAME|VERSION|AUTHOR|DESCRIPTION)\s*=\s*"((?:[^"\\]|\\.)*)"\s*;',
+                         re.MULTILINE)
+# The header is at the top of the file; large generated bodies are not read
+METADATA_BYTES = 16 * 1024
+
+SORT_KEYS = {
+    "name": lambda p: p["name"],
+    "modified": lambda p: p["modified"],
+    "size": lambda p: p["size"],
+    "files": lambda p: len(p["files"]),
+    "version": lambda p: [(0, int(n), "") if n.isdigit() else (1, 0, n)
+                          for n in re.split(r"[.-]", p["metadata"].get("version", ""))],
+}
+
+def load_index(index_file=INDEX_FILE):
+    """Load the persisted project index"""
+    try:
+        index = json.loads(Path(index_file).read_text())
+    except (OSError, ValueError):
+        index = {}
+    if index.get("version") != INDEX_VERSION:
+        index = {"version": INDEX_VERSION, "projects": {}}
+    return index
+
+def save_index(index, index_file=INDEX_FILE):
+    """Atomically write the project index"""
+    index_file = Path(index_file)
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(index, sort_keys=True))
+    os.replace(tmp_file, index_file)
+
+def parse_metadata(scad_file):
+    """Return the PROJECT_* metadata of a file as a lower-case keyed dict"""
+    with open(scad_file, "rb") as handle:
+        header = handle.read(METADATA_BYTES).decode("utf-8", errors="replace")
+    return {key.lower(): value.replace('\\"', '"') for key, value in METADATA_RE.findall(header)}
+
+def main_file(name, files):
+    """Return the project's main .scad file name: <project>.scad, else the first one"""
+    if f"{name}.scad" in files:
+        return f"{name}.scad"
+    return min(files) if files else None
+
+def render_status(name, stem, modified):
+    """Return ``(status, stl_path)`` for a project's main model.
+
+    Looks for the STL where render_preview.py writes it, both for single
+    renders (renders/<stem>.stl) and batch mode (renders/projects/<name>/).
+    """
+    newest = None
+    for candidate in (RENDERS_DIR / f"{stem}.stl", RENDERS_DIR / "projects" / name / f"{stem}.stl"):
+        try:
+            mtime = candidate.stat().st_mtime_ns
+        except OSError:
+            continue
+        if newest is None or mtime > newest[0]:
+            newest = (mtime, candidate)
+    if newest is None:
+        return "never", None
+    return ("rendered" if newest[0] >= modified else "stale"), str(newest[1])
+
+def scan_project(project_dir, previous):
+    """Build the index entry for one project, reusing ``previous`` for unchanged files"""
+    files = {}
+    for entry in os.scandir(project_dir):
+        if entry.name.endswith(".scad") and entry.is_file():
+            stat = entry.stat()
+            files[entry.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    name = project_dir.name
+    main = main_file(name, files)
+    previous = previous or {}
+    if main and previous.get("main") == main and previous.get("files", {}).get(main) == files[main]:
+        metadata = previous["metadata"]
+    else:
+        try:
+            metadata = parse_metadata(project_dir / main) if main else {}
+        except OSError:
+            metadata = {}
+
+    modified = max((f["mtime_ns"] for f in files.values()), default=0)
+    status, render = render_status(name, Path(main).stem, modified) if main else ("never", None)
+    return {"name": name, "path": str(project_dir), "main": main, "files": files,
+            "size": sum(f["size"] for f in files.values()), "modified": modified,
+            "metadata": metadata, "render_status": status, "render": render}
+
+def update_index(index, projects_dir=PROJECTS_DIR):
+    """Bring ``index`` up to date; return ``(scanned, updated, removed)`` counts"""
+    projects = index["projects"]
+    seen = set()
+    updated = 0
+    try:
+        entries = [entry for entry in os.scandir(projects_dir) if entry.is_dir() and not entry.name.startswith(".")]
+    except OSError:
+        entries = []
+    for entry in entries:
+        seen.add(entry.name)
+        previous = projects.get(entry.name)
+        try:
+            project = scan_project(Path(entry.path), previous)
+        except OSError:
+            continue
+        if project != previous:
+            updated += 1
+            projects[entry.name] = project
+    removed = [name for name in projects if name not in seen]
+    for name in removed:
+        del projects[name]
+    return len(entries), updated, len(removed)
+
+def load_updated_index():
+    """Load and refresh the index, saving it only if it changed; return it with timing stats"""
+    start = time.monotonic()
+    index = load_index()
+    scanned, updated, removed = update_index(index)
+    if updated or removed:
+        index["updated"] = time.time()
+        save_index(index)
+    return index, scanned, updated, removed, time.monotonic() - start
+
+def query(index, pattern=None, status=None, sort="name", reverse=False):
+    """Return index entries matching ``pattern`` (name, title or description) and ``status``"""
+    pattern = pattern.lower() if pattern else None
+    projects = []
+    for project in index["projects"].values():
+        if status and project["render_status"] != status:
+            continue
+        if pattern:
+            metadata = project["metadata"]
+            haystack = " ".join([project["name"], metadata.get("name", ""), metadata.get("description", "")])
+            if pattern not in haystack.lower():
+                continue
+        projects.append(project)
+    return sorted(projects, key=SORT_KEYS[sort], reverse=reverse)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Benchmark
+Time the render pipeline on a fixed corpus and catch regressions
+
+The corpus renders examples/ and the gear() and spiral() workloads in
+benchmarks/ at several $fn/resolution levels. Every case is rendered
+serially, with warm-up runs discarded and the render cache bypassed, and
+the median/p95 latency and peak memory are stored together with the
+OpenSCAD version and machine details. Results are compared against a saved
+baseline. ``--stub`` replaces OpenSCAD with a deterministic cost model
+that grows with the level, so the harness and the comparison can be
+exercised anywhere with reproducible numbers.
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import render_profile
+from cli_utils import format_size, pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = WORKSPACE_DIR / ".openscad-cache" / "benchmarks"
+BASELINE_FILE = WORKSPACE_DIR / "benchmarks" / "baseline.json"
+RESULTS_VERSION = 1
+
+# Each case is rendered once per level, with ``-D <parameter>=<level>``
+CORPUS = [
+    {"name": "basic_shapes", "file": "examples/basic_shapes.scad", "parameter": "$fn", "levels": [16, 64, 128]},
+    {"name": "parametric_design", "file": "examples/parametric_design.scad", "parameter": "$fn",
+     "levels": [16, 64, 128]},
+    {"name": "gear", "file": "benchmarks/gear.scad", "parameter": "teeth", "levels": [12, 24, 48]},
+    {"name": "spiral", "file": "benchmarks/spiral.scad", "parameter": "resolution", "levels": [25, 50, 100]},
+]
+
+DEFAULT_REPEAT = 5
+DEFAULT_WARMUP = 1
+# A case regresses when its median is this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.10
+# ...and slower by at least this many seconds, so timer noise on fast cases is ignored
+MIN_DELTA = 0.02
+
+# Simulated cost of the stub: seconds per render plus seconds per unit of level
+STUB_BASE = 0.005
+STUB_COST = 0.0004
+STUB_RSS = 32 * 1024 ** 2
+
+def stub_render(level):
+    """Deterministic stand-in for one OpenSCAD render: returns the metrics it would record"""
+    wall = STUB_BASE + STUB_COST * level
+    return {"wall": wall, "user_cpu": wall, "sys_cpu": 0.0, "peak_rss": STUB_RSS + 4096 * int(level)}
+
+def openscad_version(stub):
+    """Return the version string of the OpenSCAD in use, or None"""
+    if stub:
+        return "stub"
+    success, stdout, stderr, _ = render_profile.run_profiled(["openscad", "--version"])
+    return (stdout + stderr).strip() if success else None
+
+def machine_info():
+    """Describe the machine results were recorded on"""
+    return {"platform": platform.platform(), "machine": platform.machine(),
+            "processor": platform.processor(), "cpu_count": os.cpu_count(),
+            "python": platform.python_version(), "hostname": platform.node()}
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``"""
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+def case_id(case, level):
+    """Identify one case/level combination in results and baselines"""
+    return f"{case['name']}@{case['parameter']}={level}"
+
+def run_case(case, level, repeat, warmup, stub, work_dir):
+    """Render one case/level ``warmup + repeat`` times and aggregate the timed runs"""
+    scad_path = WORKSPACE_DIR / case["file"]
+    output = Path(work_dir) / f"{case['name']}-{level}.stl"
+    command = ["openscad", "-o", str(output), "-D", f"{case['parameter']}={level}", str(scad_path)]
+    samples, failures, error = [], 0, ""
+    for run in range(warmup + repeat):
+        if stub:
+            success, stderr, metrics = True, "", stub_render(level)
+        else:
+            success, _, stderr, metrics = render_profile.run_profiled(command, cwd=scad_path.parent)
+        if run < warmup:
+            continue
+        if success:
+            samples.append(metrics)
+        else:
+            failures += 1
+            error = stderr.strip().splitlines()[-1] if stderr.strip() else "failed"
+
+    result = {"id": case_id(case, level), "case": case["name"], "file": case["file"],
+              "parameter": case["parameter"], "level": level, "runs": len(samples), "failures": failures}
+    if samples:
+        walls = [m["wall"] for m in samples]
+        result.update({
+            "median": statistics.median(walls), "p95": percentile(walls, 0.95),
+            "mean": statistics.fmean(walls), "min": min(walls),
+            "cpu": statistics.median(m["user_cpu"] + m["sys_cpu"] for m in samples),
+            "peak_rss": max(m["peak_rss"] for m in samples),
+        })
+    if error:
+        result["error"] = error
+    return result
+
+def run_benchmarks(cases, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, stub=False):
+    """Run the corpus and return a results document"""
+    version = openscad_version(stub)
+    if version is None:
+        raise RuntimeError("OpenSCAD is not installed or not in PATH (use --stub to run without it)")
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="openscad-bench-")
+    try:
+        for case in cases:
+            for level in case["levels"]:
+                result = run_case(case, level, repeat, warmup, stub, work_dir)
+                if result["runs"]:
+                    print(f"  ✓ {result['id']:<36} median {result['median'] * 1000:8.1f} ms  "
+                          f"p95 {result['p95'] * 1000:8.1f} ms  "
+                          f"rss {format_size(result['peak_rss'])}")
+                else:
+                    print(f"  ✗ {result['id']:<36} {result.get('error', 'failed')}")
+                results.append(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"version": RESULTS_VERSION,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "openscad_version": version, "stub": stub, "machine": machine_info(),
+            "repeat": repeat, "warmup": warmup, "results": results}
+
+def save_results(document, path=None):
+    """Write results to ``path`` (default: a timestamped file) and to latest.json"""
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = Path(path or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    text = json.dumps(document, indent=2) + "\n"
+    path.write_text(text)
+    (RESULTS_DIR / "latest.json").write_text(text)
+    return path
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD, min_delta=MIN_DELTA):
+    """Compare two results documents; return ``(rows, regressions, notes)``"""
+    notes = []
+    if current.get("openscad_version") != baseline.get("openscad_version"):
+        notes.append(f"OpenSCAD version differs: {baseline.get('openscad_version')} -> "
+                     f"{current.get('openscad_version')}")
+    if current.get("machine", {}).get("hostname") != baseline.get("machine", {}).get("hostname"):
+        notes.append("Results were recorded on a different machine")
+
+    base = {r["id"]: r for r in baseline["results"]}
+    rows, regressions = [], []
+    for result in current["results"]:
+        before = base.get(result["id"])
+        if before is None or "median" not in before:
+            rows.append((result, None, None, "new"))
+            continue
+        if "median" not in result:
+            rows.append((result, before, None, "failed"))
+            regressions.append(result["id"])
+            continue
+        ratio = result["median"] / before["median"] if before["median"] else 1.0
+        delta = result["median"] - before["median"]
+        if ratio > 1 + threshold and delta > min_delta:
+            status = "regression"
+            regressions.append(result["id"])
+        elif ratio < 1 - threshold and -delta > min_delta:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((result, before, ratio, status))
+    return rows, regressions, notes
+
+def print_comparison(rows, regressions, notes):
+    """Print a baseline comparison; return the process exit code"""
+    print()
+    print("Comparison with baseline")
+    print("=" * 50)
+    for note in notes:
+        print(f"  Note: {note}")
+    print(f"  {'Case':<36} {'Baseline':>10} {'Current':>10} {'Change':>8}")
+    for result, before, ratio, status in rows:
+        old = f"{before['median'] * 1000:.1f} ms" if before and "median" in before else "-"
+        new = f"{result['median'] * 1000:.1f} ms" if "median" in result else "failed"
+        change = f"{(ratio - 1) * 100:+.1f}%" if ratio is not None else ""
+        icon = "✗" if status in ("regression", "failed") else "✓"
+        print(f"  {icon} {result['id']:<34} {old:>10} {new:>10} {change:>8}  {status}")
+    print()
+    if regressions:
+        print(f"✗ {len(regressions)} regressions")
+        return 1
+    print("✓ No regressions")
+    return 0
+
+def load_results(path):
+    """Load a results document"""
+    document = json.loads(Path(path).read_text())
+    if document.get("version") != RESULTS_VERSION:
+        raise ValueError(f"Unsupported results version in {path}")
+    return document
+
+def print_usage():
+    """Print command line usage"""
+    print("Usage:")
+    print("  python3 render_benchmark.py run [options]        # Run the corpus, compare with the baseline")
+    print("  python3 render_benchmark.py compare <results> [<baseline>]")
+    print("  python3 render_benchmark.py list                 # Show the corpus")
+    print()
+    print("Options for run:")
+    print(f"  --repeat N          Timed runs per case (default: {DEFAULT_REPEAT})")
+    print(f"  --warmup N          Discarded runs per case (default: {DEFAULT_WARMUP})")
+    print("  --only NAME[,NAME]  Run only these cases")
+    print("  --stub              Use a deterministic OpenSCAD stand-in")
+    print("  --output FILE       Results file (default: .openscad-cache/benchmarks/<time>.json)")
+    print("  --baseline FILE     Baseline to compare against (default: benchmarks/baseline.json)")
+    print("  --save-baseline     Store these results as the new baseline")
+    print(f"  --threshold F       Relative slowdown that counts as a regression (default: {DEFAULT_THRESHOLD})")
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if not args or args[0] not in ("run", "compare", "list"):
+        print_usage()
+        sys.exit(1)
+
+    command = args.pop(0)
+    if command == "list":
+        for case in CORPUS:
+            levels = ", ".join(str(level) for level in case["levels"])
+            print(f"  {case['name']:<20} {case['file']:<34} {case['parameter']} = {levels}")
+        return
+
+    threshold = pop_option(args, "--threshold", DEFAULT_THRESHOLD, float)
+    if command == "compare":
+        if not args:
+            print_usage()
+            sys.exit(1)
+        try:
+            current = load_results(args[0])
+            baseline = load_results(args[1] if len(args) > 1 else BASELINE_FILE)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        sys.exit(print_comparison(*compare_results(current, baseline, threshold)))
+
+    repeat = pop_option(args, "--repeat", DEFAULT_REPEAT, int)
+    warmup = pop_option(args, "--warmup", DEFAULT_WARMUP, int)
+    only = pop_option(args, "--only")
+    output = pop_option(args, "--output")
+    baseline_file = Path(pop_option(args, "--baseline", BASELINE_FILE))
+    stub = "--stub" in args
+    save_baseline = "--save-baseline" in args
+    unknown = [a for a in args if a not in ("--stub", "--save-baseline")]
+    if unknown:
+        print(f"Unknown arguments: {' '.join(unknown)}")
+        sys.exit(1)
+    if repeat < 1:
+        print("Error: --repeat must be at least 1")
+        sys.exit(1)
+
+    cases = CORPUS
+    if only:
+        names = only.split(",")
+        cases = [case for case in CORPUS if case["name"] in names]
+        if len(cases) != len(names):
+            print(f"Error: unknown cases: {', '.join(set(names) - {c['name'] for c in cases})}")
+            sys.exit(1)
+
+    print(f"Benchmarking {sum(len(c['levels']) for c in cases)} cases "
+          f"({warmup} warm-up + {repeat} timed runs each){' with the stub' if stub else ''}...")
+    try:
+        document = run_benchmarks(cases, repeat, warmup, stub)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    path = save_results(document, output)
+    print(f"Results: {path}")
+
+    if save_baseline:
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(document, indent=2) + "\n")
+        print(f"✓ Saved baseline: {baseline_file}")
+        return
+    failed = any(not r["runs"] for r in document["results"])
+    if baseline_file.exists():
+        exit_code = print_comparison(*compare_results(document, load_results(baseline_file), threshold))
+        sys.exit(exit_code or int(failed))
+    print(f"No baseline at {baseline_file} (create one with --save-baseline)")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Cache
+Reuse STL/PNG exports whose inputs have not changed
+
+A cache key covers the source file, every file reachable through
+include <>/use <>, the OpenSCAD version and the export options, so any
+change to a library or to utils/common_modules.scad invalidates exactly the
+models that depend on it.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import scad_deps
+from cli_utils import file_lock, format_size, parse_size
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+
+# Setting this variable moves the cache out of the workspace
+CACHE_ENV = "OPENSCAD_RENDER_CACHE"
+DEFAULT_CACHE_DIR = WORKSPACE_DIR / ".openscad-cache" / "renders"
+INDEX_FILE = "index.json"
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+# File digests keyed by (path, mtime_ns, size) so a batch hashes shared
+# dependencies such as common_modules.scad only once per process
+_digest_cache = {}
+
+def get_cache_dir():
+    """Return the cache directory, creating it if needed"""
+    cache_dir = Path(os.environ.get(CACHE_ENV) or DEFAULT_CACHE_DIR).expanduser()
+    (cache_dir / "objects").mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+def file_digest(path):
+    """Return the SHA-256 of a file's content"""
+    stat = os.stat(path)
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+        _digest_cache[key] = digest
+    return digest
+
+def cache_key(scad_file, options, openscad_version, search_paths=None):
+    """Return the cache key for exporting ``scad_file`` with ``options``.
+
+    Returns None if a dependency cannot be resolved, since the output would
+    then depend on files the key does not cover.
+    """
+    dependencies, missing = scad_deps.dependency_closure(scad_file, search_paths)
+    if missing:
+        return None
+    hasher = hashlib.sha256()
+    hasher.update(f"openscad:{openscad_version}\n".encode())
+    hasher.update(f"options:{json.dumps(list(options))}\n".encode())
+    for path in [Path(scad_file).resolve()] + dependencies:
+        hasher.update(f"{file_digest(path)}\n".encode())
+    return hasher.hexdigest()
+
+def object_path(cache_dir, key, ext):
+    """Return where a cached export is stored"""
+    return cache_dir / "objects" / key[:2] / f"{key}.{ext}"
+
+def load_index(cache_dir):
+    """Load the cache index"""
+    try:
+        index = json.loads((cache_dir / INDEX_FILE).read_text())
+    except (OSError, ValueError):
+        index = {}
+    index.setdefault("entries", {})
+    index.setdefault("stats", {"hits": 0, "misses": 0, "evictions": 0})
+    return index
+
+def save_index(cache_dir, index):
+    """Atomically write the cache index"""
+    tmp_file = cache_dir / f"{INDEX_FILE}.{os.getpid()}.tmp"
+    tmp_file.write_text(json.dumps(index, sort_keys=True))
+    os.replace(tmp_file, cache_dir / INDEX_FILE)
+
+def lookup(key, ext, destination, cache_dir=None):
+    """Copy a cached export to ``destination``; return True on a hit"""
+    cache_dir = cache_dir or get_cache_dir()
+    cached = object_path(cache_dir, key, ext)
+    with file_lock(cache_dir / ".lock"):
+        index = load_index(cache_dir)
+        entry = index["entries"].get(f"{key}.{ext}")
+        hit = entry is not None and cached.exists()
+        if hit:
+            shutil.copyfile(cached, destination)
+            entry["last_access"] = time.time()
+            index["stats"]["hits"] += 1
+        else:
+            index["stats"]["misses"] += 1
+        save_index(cache_dir, index)
+    return hit
+
+def store(key, ext, source, max_size=None, cache_dir=None):
+    """Add an export to the cache and evict least recently used entries over ``max_size``"""
+    cache_dir = cache_dir or get_cache_dir()
+    if max_size is None:
+        max_size = parse_size(os.environ.get("OPENSCAD_RENDER_CACHE_SIZE", str(DEFAULT_MAX_SIZE)))
+    cached = object_path(cache_dir, key, ext)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    shutil.copyfile(source, tmp_file)
+    os.replace(tmp_file, cached)
+
+    with file_lock(cache_dir / ".lock"):
+        index = load_index(cache_dir)
+        index["entries"][f"{key}.{ext}"] = {"size": cached.stat().st_size, "last_access": time.time()}
+        evict(cache_dir, index, max_size)
+        save_index(cache_dir, index)
+
+def evict(cache_dir, index, max_size):
+    """Drop least recently used entries until the cache fits ``max_size`` (lock held)"""
+    entries = index["entries"]
+    total = sum(entry["size"] for entry in entries.values())
+    for name, entry in sorted(entries.items(), key=lambda item: item[1]["last_access"]):
+        if total <= max_size:
+            break
+        key, _, ext = name.rpartition(".")
+        object_path(cache_dir, key, ext).unlink(missing_ok=True)
+        total -= entry["size"]
+        del entries[name]
+        index["stats"]["evictions"] += 1
+
+def print_stats(cache_dir=None):
+    """Print cache statistics"""
+    cache_dir = cache_dir or get_cache_dir()
+    index = load_index(cache_dir)
+    stats = index["stats"]
+    lookups = stats["hits"] + stats["misses"]
+    print("OpenSCAD Render Cache")
+    print("=" * 50)
+    print(f"Location: {cache_dir}")
+    print(f"Entries: {len(index['entries'])}")
+    print(f"Size: {format_size(sum(e['size'] for e in index['entries'].values()))}")
+    print(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Evictions: {stats['evictions']}")
+    if lookups:
+        print(f"Hit rate: {100.0 * stats['hits'] / lookups:.1f}%")
+
+def main():
+    """Main function"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "prune", "clear"):
+        print("Usage:")
+        print("  python3 render_cache.py stats                 # Show hit/miss statistics")
+        print("  python3 render_cache.py prune --max-size 1G   # Evict least recently used renders")
+        print("  python3 render_cache.py clear                 # Remove all cached renders")
+        sys.exit(1)
+
+    cache_dir = get_cache_dir()
+    command = sys.argv[1]
+    if command == "stats":
+        print_stats(cache_dir)
+    elif command == "prune":
+        if len(sys.argv) < 4 or sys.argv[2] != "--max-size":
+            print("Please specify --max-size")
+            sys.exit(1)
+        with file_lock(cache_dir / ".lock"):
+            index = load_index(cache_dir)
+            before = len(index["entries"])
+            evict(cache_dir, index, parse_size(sys.argv[3]))
+            save_index(cache_dir, index)
+        print(f"Evicted {before - len(index['entries'])} renders")
+    else:
+        with file_lock(cache_dir / ".lock"):
+            shutil.rmtree(cache_dir / "objects", ignore_errors=True)
+            index = load_index(cache_dir)
+            index["entries"] = {}
+            save_index(cache_dir, index)
+        print("Render cache cleared")
+
+if __name__ == "__main__":
+    main()
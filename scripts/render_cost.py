@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Cost Estimator
+Predict how long each export takes and schedule the longest first
+
+A static estimate is derived from the source: primitive and library call
+counts, booleans, hull() and minkowski(), CSG nesting depth, the largest
+$fn, resolution argument and for-loop range, and the size of the
+included/used library code OpenSCAD has to parse. Measured timings (from
+batch renders and the render_profile.py log) replace the estimate for
+models that have rendered before and calibrate it for the ones that have
+not.
+
+render_preview.py --batch submits exports longest-first (LPT list
+scheduling), which keeps one expensive model from starting last and
+stretching the whole run. The peak memory of each export is tracked the
+same way and used by render_executor.py to decide how many renders fit in
+memory at once.
+"""
+
+import heapq
+import json
+import os
+import re
+import statistics
+import sys
+from pathlib import Path
+
+import render_profile
+import scad_deps
+from cli_utils import pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+HISTORY_FILE = WORKSPACE_DIR / ".openscad-cache" / "render_costs.json"
+HISTORY_VERSION = 1
+
+# Seconds per feature for a full (CGAL/Manifold) render at 32 segments
+COST_WEIGHTS = {
+    "base": 0.15,          # OpenSCAD start-up and export
+    "parse_mb": 0.5,       # per MB of library code in the include/use closure
+    "primitive": 0.002,
+    "library_call": 0.005,
+    "boolean": 0.02,
+    "hull": 0.01,
+    "minkowski": 0.5,
+}
+# A non-rendered PNG preview (OpenCSG) skips most geometry evaluation
+PREVIEW_FACTOR = 0.1
+# Weight of a new measurement in the moving average of a model's timings
+HISTORY_WEIGHT = 0.5
+# Estimates above this many seconds are flagged by `estimate`
+DEFAULT_WARN_SECONDS = 300
+
+PRIMITIVE_RE = re.compile(r"\b(cube|sphere|cylinder|polyhedron|square|circle|polygon|text|"
+                          r"linear_extrude|rotate_extrude|surface|import)\s*\(")
+BOOLEAN_RE = re.compile(r"\b(difference|intersection)\s*\(")
+CALL_RE = re.compile(r"(?<![\w$.])([A-Za-z_]\w*)\s*\(")
+DEFINITION_RE = re.compile(r"\b(?:module|function)\s+([A-Za-z_]\w*)")
+SEGMENTS_RE = re.compile(r"\$fn\s*=\s*(\d+(?:\.\d+)?)")
+# Detail arguments of library modules, e.g. spiral(..., resolution=500)
+DETAIL_RE = re.compile(r"\b(?:resolution|segments|steps|slices)\s*=\s*(\d+(?:\.\d+)?)")
+RANGE_RE = re.compile(r"\[\s*(-?\d+(?:\.\d+)?)\s*:\s*(?:(-?\d+(?:\.\d+)?)\s*:\s*)?(-?\d+(?:\.\d+)?)\s*\]")
+BUILTINS = {
+    "union", "difference", "intersection", "translate", "rotate", "scale", "mirror", "multmatrix",
+    "color", "offset", "hull", "minkowski", "resize", "projection", "render", "children", "echo",
+    "assert", "let", "for", "intersection_for", "if", "each", "len", "concat", "str", "chr", "ord",
+    "search", "lookup", "min", "max", "abs", "sign", "sin", "cos", "tan", "asin", "acos", "atan",
+    "atan2", "floor", "ceil", "round", "ln", "log", "pow", "sqrt", "exp", "norm", "cross", "rands",
+    "is_undef", "is_bool", "is_num", "is_string", "is_list", "is_function", "version", "version_num",
+    "parent_module", "function", "module",
+}
+
+def static_features(scad_file):
+    """Return the cost-relevant features of a model's source"""
+    path = Path(scad_file)
+    text = scad_deps.strip_comments(path.read_text(errors="replace"))
+    dependencies, _ = scad_deps.dependency_closure(path)
+    defined = set(DEFINITION_RE.findall(text))
+    depth = max_depth = 0
+    for char in text:
+        if char == "{":
+            depth += 1
+            max_depth = max(max_depth, depth)
+        elif char == "}":
+            depth = max(0, depth - 1)
+    ranges = []
+    for start, step, end in RANGE_RE.findall(text):
+        step = abs(float(step)) if step else 1.0
+        ranges.append(abs(float(end) - float(start)) / step + 1 if step else 1)
+    return {
+        "primitives": len(PRIMITIVE_RE.findall(text)),
+        "library_calls": sum(1 for name in CALL_RE.findall(text)
+                             if name not in BUILTINS and name not in defined
+                             and not PRIMITIVE_RE.match(f"{name}(")),
+        "booleans": len(BOOLEAN_RE.findall(text)),
+        "hulls": len(re.findall(r"\bhull\s*\(", text)),
+        "minkowskis": len(re.findall(r"\bminkowski\s*\(", text)),
+        "depth": max_depth,
+        "segments": max([float(v) for v in SEGMENTS_RE.findall(text)], default=0),
+        "detail": max([float(v) for v in DETAIL_RE.findall(text)], default=0),
+        "loop": max(ranges, default=1),
+        "library_bytes": sum(dep.stat().st_size for dep in dependencies if dep.exists()),
+    }
+
+def static_estimate(features, full_render=True):
+    """Estimate an export's seconds from static features"""
+    weights = COST_WEIGHTS
+    segments = max(1.0, features["segments"] / 32)
+    detail = max(1.0, features["detail"] / 100)
+    geometry = ((weights["primitive"] * features["primitives"]
+                 + weights["boolean"] * features["booleans"]
+                 + weights["hull"] * features["hulls"]) * segments
+                + weights["minkowski"] * features["minkowskis"] * segments ** 2
+                + weights["library_call"] * features["library_calls"] * detail)
+    geometry *= min(features["loop"], 10000) * (1 + 0.1 * features["depth"])
+    if not full_render:
+        geometry *= PREVIEW_FACTOR
+    return weights["base"] + weights["parse_mb"] * features["library_bytes"] / 1e6 + geometry
+
+def is_full_render(kind, options):
+    """Return whether an export evaluates the full geometry (STL, or PNG with --render)"""
+    return kind != "png" or "--render" in options
+
+def history_key(scad_file, kind, options):
+    """Return the history key of an export"""
+    return f"{scad_deps.index_key(scad_file)}|{kind}|{'render' if is_full_render(kind, options) else 'preview'}"
+
+def load_history(history_file=HISTORY_FILE, profile_log=render_profile.DEFAULT_LOG):
+    """Load measured timings, folding in profile records added since the last load"""
+    try:
+        history = json.loads(Path(history_file).read_text())
+    except (OSError, ValueError):
+        history = {}
+    if history.get("version") != HISTORY_VERSION:
+        history = {"version": HISTORY_VERSION, "timings": {}, "profile_offset": 0}
+    history.setdefault("peak_rss", {})
+    try:
+        with open(profile_log, "rb") as handle:
+            if os.fstat(handle.fileno()).st_size < history["profile_offset"]:
+                history["profile_offset"] = 0  # The log was cleared
+            handle.seek(history["profile_offset"])
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                history["profile_offset"] += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("cached"):
+                    continue
+                key = history_key(scad_deps.key_path(record["scad"]), record["kind"], record["options"])
+                if record.get("success"):
+                    update_timing(history, key, record["wall"])
+                if record.get("peak_rss"):
+                    update_peak(history, key, record["peak_rss"])
+    except OSError:
+        pass
+    return history
+
+def save_history(history, history_file=HISTORY_FILE):
+    """Atomically write the timing history"""
+    history_file = Path(history_file)
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = history_file.with_name(f"{history_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(history, sort_keys=True))
+    os.replace(tmp_file, history_file)
+
+def update_timing(history, key, seconds):
+    """Fold one measurement into the moving average for ``key``"""
+    previous = history["timings"].get(key)
+    history["timings"][key] = round(seconds if previous is None
+                                    else HISTORY_WEIGHT * seconds + (1 - HISTORY_WEIGHT) * previous, 4)
+
+def update_peak(history, key, peak_rss):
+    """Fold one peak RSS measurement in: increases count in full, decreases decay slowly"""
+    previous = history["peak_rss"].get(key)
+    history["peak_rss"][key] = int(peak_rss if previous is None
+                                   else max(peak_rss, HISTORY_WEIGHT * peak_rss + (1 - HISTORY_WEIGHT) * previous))
+
+def record_results(jobs, history_file=HISTORY_FILE):
+    """Store the wall time and peak RSS of finished, uncached exports in the history.
+
+    Profiled exports are skipped; their profile records are read instead.
+    Peak RSS is kept for failed exports too, since a render killed for
+    exceeding its memory limit still needs that much memory next time.
+    """
+    history = load_history(history_file)
+    for job in jobs:
+        if job["cached"] or job.get("profile"):
+            continue
+        key = history_key(job["scad"], job["kind"], job["options"])
+        if job["success"]:
+            update_timing(history, key, job["elapsed"])
+        if job.get("peak_rss"):
+            update_peak(history, key, job["peak_rss"])
+    save_history(history, history_file)
+
+def estimate_jobs(jobs, history=None):
+    """Return an estimate dict per job: ``seconds``, ``static``, ``measured`` and ``peak_rss``.
+
+    Models without measurements get their static estimate scaled by the
+    median measured/static ratio of the models that have them.
+    """
+    history = load_history() if history is None else history
+    features = {}
+    estimates = []
+    for job in jobs:
+        if job["scad"] not in features:
+            try:
+                features[job["scad"]] = static_features(job["scad"])
+            except OSError:
+                features[job["scad"]] = None
+        static = (static_estimate(features[job["scad"]], is_full_render(job["kind"], job["options"]))
+                  if features[job["scad"]] else COST_WEIGHTS["base"])
+        key = history_key(job["scad"], job["kind"], job["options"])
+        estimates.append({"static": static, "measured": history["timings"].get(key),
+                          "peak_rss": history["peak_rss"].get(key)})
+    ratios = [e["measured"] / e["static"] for e in estimates if e["measured"] is not None]
+    scale = statistics.median(ratios) if ratios else 1.0
+    for estimate in estimates:
+        estimate["seconds"] = estimate["measured"] if estimate["measured"] is not None else estimate["static"] * scale
+    return estimates
+
+def makespan(durations, workers):
+    """Return the finish time of list-scheduling ``durations`` in order on ``workers``"""
+    finish = [0.0] * max(1, workers)
+    for duration in durations:
+        heapq.heappush(finish, heapq.heappop(finish) + duration)
+    return max(finish)
+
+def order_longest_first(jobs, history=None):
+    """Return ``(jobs, estimates)`` sorted by descending estimated cost"""
+    estimates = estimate_jobs(jobs, history)
+    order = sorted(range(len(jobs)), key=lambda i: estimates[i]["seconds"], reverse=True)
+    return [jobs[i] for i in order], [estimates[i] for i in order]
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if not args or args[0] != "estimate":
+        print("Usage:")
+        print("  python3 render_cost.py estimate <file|dir|glob>... [--preset preview|release]")
+        print("      [--jobs N] [--max SECONDS] [--json]")
+        print()
+        print("Lists the estimated cost of each export, most expensive first, and the")
+        print("predicted batch time in file order versus longest-first. Exits 1 if an")
+        print(f"export exceeds --max (default {DEFAULT_WARN_SECONDS}s), e.g. as a pre-commit check.")
+        sys.exit(1)
+
+    import render_preview
+    args = args[1:]
+    preset = pop_option(args, "--preset", "release")
+    workers = pop_option(args, "--jobs", os.cpu_count() or 1, int)
+    limit = pop_option(args, "--max", DEFAULT_WARN_SECONDS, float)
+    as_json = "--json" in args
+    args = [a for a in args if a != "--json"]
+    if preset not in render_preview.PRESETS:
+        print(f"Error: unknown preset {preset}")
+        sys.exit(2)
+
+    settings = render_preview.PRESETS[preset]
+    jobs = [{"scad": str(path), "kind": kind,
+             "options": ["--render"] if kind == "png" and settings["png_render"] else []}
+            for path in render_preview.collect_scad_files(args) for kind in settings["kinds"]]
+    if not jobs:
+        print("Error: No .scad files matched")
+        sys.exit(1)
+
+    in_order = [e["seconds"] for e in estimate_jobs(jobs)]
+    jobs, estimates = order_longest_first(jobs)
+    rows = [dict(estimate, file=scad_deps.index_key(job["scad"]), kind=job["kind"])
+            for job, estimate in zip(jobs, estimates)]
+    over = [row for row in rows if row["seconds"] > limit]
+    if as_json:
+        print(json.dumps({"exports": rows, "workers": workers,
+                          "makespan_in_order": makespan(in_order, workers),
+                          "makespan_longest_first": makespan([r["seconds"] for r in rows], workers)}, indent=2))
+    else:
+        print(f"  {'File':<48} {'Kind':<5} {'Estimate':>9}  Source")
+        for row in rows:
+            source = "measured" if row["measured"] is not None else "static"
+            flag = "  ⚠" if row["seconds"] > limit else ""
+            print(f"  {row['file']:<48} {row['kind']:<5} {row['seconds']:>8.2f}s  {source}{flag}")
+        print()
+        print(f"  {len(rows)} exports, {sum(r['seconds'] for r in rows):.1f}s of work on {workers} workers: "
+              f"~{makespan(in_order, workers):.1f}s in file order, "
+              f"~{makespan([r['seconds'] for r in rows], workers):.1f}s longest-first")
+        for row in over:
+            print(f"  ⚠ {row['file']} {row['kind'].upper()} is estimated at {row['seconds']:.0f}s (limit {limit:.0f}s)")
+    if over:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
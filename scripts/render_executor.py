@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Executor
+Run renders under memory and CPU limits at the highest concurrency that fits in RAM
+
+Every export runs through :func:`run_limited`, which samples the resident
+memory of the OpenSCAD process while it runs and enforces optional per-job
+limits: resident memory, CPU time (RLIMIT_CPU) and wall-clock time. A
+render that crosses a limit is killed and reported with a diagnosis instead
+of pushing the machine into swap or the kernel OOM killer. When
+OPENSCAD_RENDER_CGROUP names a delegated cgroup v2 directory, each render
+also gets its own child cgroup with ``memory.max`` set, which catches
+allocation spikes between samples.
+
+Batch renders admit a job only when its expected peak RSS (measured on
+earlier runs, see render_cost.py) plus the memory the running jobs are
+still expected to allocate fits into the currently available memory, so
+the number of concurrent renders follows the models instead of a fixed
+worker count. Running batches publish their usage to .openscad-cache/usage/,
+shown by ``render_executor.py status``.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from cli_utils import format_size, parse_size
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+USAGE_DIR = WORKSPACE_DIR / ".openscad-cache" / "usage"
+
+# Default per-render limits, overridden by render_preview.py options
+MEMORY_LIMIT_ENV = "OPENSCAD_RENDER_MEMORY_LIMIT"
+CPU_LIMIT_ENV = "OPENSCAD_RENDER_CPU_LIMIT"
+TIMEOUT_ENV = "OPENSCAD_RENDER_TIMEOUT"
+# A cgroup v2 directory the current user may create child cgroups in
+CGROUP_ENV = "OPENSCAD_RENDER_CGROUP"
+
+# Seconds between memory samples of a running render
+SAMPLE_INTERVAL = 0.1
+# Seconds between admission decisions (and usage updates) of a batch
+ADMISSION_INTERVAL = 0.5
+# Seconds of CPU time between SIGXCPU and the hard RLIMIT_CPU kill
+CPU_GRACE = 5
+# Expected peak for models that have never been measured, if no model has
+DEFAULT_PEAK_RSS = 256 * 1024 ** 2
+# Fraction of physical memory admission leaves to everything else
+MEMORY_RESERVE = 0.1
+# Usage files not updated for this many seconds belong to dead batches
+USAGE_STALE = 10
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# RSS of each job of the batch, shared with the pool workers (see init_worker)
+_usage = None
+
+def default_limits(memory=None, cpu=None, timeout=None):
+    """Return per-render limits, filling unset ones from the environment; None if there are none"""
+    try:
+        if memory is None and os.environ.get(MEMORY_LIMIT_ENV):
+            memory = parse_size(os.environ[MEMORY_LIMIT_ENV])
+        if cpu is None and os.environ.get(CPU_LIMIT_ENV):
+            cpu = float(os.environ[CPU_LIMIT_ENV])
+        if timeout is None and os.environ.get(TIMEOUT_ENV):
+            timeout = float(os.environ[TIMEOUT_ENV])
+    except ValueError:
+        raise ValueError(f"invalid render limit in {MEMORY_LIMIT_ENV}, {CPU_LIMIT_ENV} or {TIMEOUT_ENV}")
+    if memory is None and cpu is None and timeout is None:
+        return None
+    return {"memory": memory, "cpu": cpu, "timeout": timeout}
+
+def format_limits(limits):
+    """Describe limits for a status line, e.g. ``memory 4.0 GB, CPU 600s``"""
+    if not limits:
+        return "none"
+    parts = []
+    if limits.get("memory"):
+        parts.append(f"memory {format_size(limits['memory'])}")
+    if limits.get("cpu"):
+        parts.append(f"CPU {limits['cpu']:g}s")
+    if limits.get("timeout"):
+        parts.append(f"timeout {limits['timeout']:g}s")
+    return ", ".join(parts)
+
+def process_rss(pid):
+    """Return the resident set size of a process in bytes, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm") as handle:
+            return int(handle.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+def memory_status():
+    """Return ``(available, total)`` physical memory in bytes, or ``(None, None)`` if unknown"""
+    try:
+        with open("/proc/meminfo") as handle:
+            info = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in handle}
+        return info["MemAvailable"], info["MemTotal"]
+    except (OSError, KeyError, IndexError, ValueError):
+        pass
+    try:
+        return (os.sysconf("SC_AVPHYS_PAGES") * PAGE_SIZE, os.sysconf("SC_PHYS_PAGES") * PAGE_SIZE)
+    except (AttributeError, ValueError, OSError):
+        return None, None
+
+def create_cgroup(memory_limit):
+    """Create a child cgroup capped at ``memory_limit``; return its path or None if unsupported"""
+    parent = os.environ.get(CGROUP_ENV)
+    if not parent or not memory_limit:
+        return None
+    cgroup = Path(parent) / f"render-{os.getpid()}-{threading.get_ident()}"
+    try:
+        cgroup.mkdir(exist_ok=True)
+        (cgroup / "memory.max").write_text(str(int(memory_limit)))
+        if (cgroup / "memory.swap.max").exists():
+            (cgroup / "memory.swap.max").write_text("0")
+        return cgroup
+    except OSError:
+        remove_cgroup(cgroup)
+        return None
+
+def cgroup_oom_kills(cgroup):
+    """Return the number of OOM kills recorded in a cgroup"""
+    try:
+        for line in (cgroup / "memory.events").read_text().splitlines():
+            if line.startswith("oom_kill "):
+                return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def remove_cgroup(cgroup):
+    """Remove a (now empty) child cgroup"""
+    try:
+        cgroup.rmdir()
+    except OSError:
+        pass
+
+def limit_cpu(pid, seconds):
+    """Apply RLIMIT_CPU to a started process (Linux); return False if that is not possible"""
+    if resource is None or not hasattr(resource, "prlimit"):
+        return False
+    soft = math.ceil(seconds)
+    try:
+        resource.prlimit(pid, resource.RLIMIT_CPU, (soft, soft + CPU_GRACE))
+        return True
+    except OSError:
+        return False
+
+def diagnose(limits, metrics, reason, oom_kills):
+    """Explain why a render was killed, or return None if it exited on its own"""
+    peak = format_size(metrics.get("peak_rss"))
+    if reason:
+        return reason
+    if oom_kills:
+        return f"killed: out of memory in its cgroup (limit {format_size(limits['memory'])}, peak RSS {peak})"
+    returncode = metrics.get("returncode")
+    cpu = (metrics.get("user_cpu") or 0.0) + (metrics.get("sys_cpu") or 0.0)
+    if limits.get("cpu") and (returncode == -signal.SIGXCPU
+                              or (returncode == -signal.SIGKILL and cpu >= limits["cpu"])):
+        return f"killed: used {cpu:.1f}s of CPU time (limit {limits['cpu']:g}s)"
+    if returncode == -signal.SIGKILL:
+        return f"killed by SIGKILL, possibly the kernel OOM killer (peak RSS {peak})"
+    return None
+
+def run_limited(cmd, cwd=None, cancel_event=None, limits=None, slot=None):
+    """Run a command under ``limits``, returning ``(success, stdout, stderr, metrics)``.
+
+    ``limits`` may set ``memory`` (bytes of resident memory), ``cpu``
+    (seconds of CPU time) and ``timeout`` (seconds of wall time).
+    ``metrics`` holds wall and CPU time, peak RSS, the return code, the
+    arrival time of every stderr line (see render_profile.parse_stderr) and
+    ``killed``, the diagnosis of a render stopped by a limit (also appended
+    to stderr). With ``slot`` the current RSS is published to the batch
+    that runs this job. If ``cancel_event`` is set the command is killed.
+    Without limits, slot or cancel event the process is not sampled at all.
+    """
+    limits = limits or {}
+    start = time.monotonic()
+    cpu_limit = limits.get("cpu")
+    preexec = None
+    if cpu_limit and resource is not None and not hasattr(resource, "prlimit"):
+        soft = math.ceil(cpu_limit)
+        preexec = lambda: resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + CPU_GRACE))
+    cgroup = create_cgroup(limits.get("memory"))
+    try:
+        process = subprocess.Popen(cmd, shell=isinstance(cmd, str), cwd=cwd, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=True, preexec_fn=preexec)
+    except OSError as e:
+        if cgroup:
+            remove_cgroup(cgroup)
+        return False, "", str(e), {"wall": time.monotonic() - start}
+    if cpu_limit and preexec is None:
+        limit_cpu(process.pid, cpu_limit)
+    if cgroup:
+        try:
+            (cgroup / "cgroup.procs").write_text(str(process.pid))
+        except OSError:
+            pass
+
+    stdout_parts, stderr_lines = [], []
+
+    def read_stdout():
+        stdout_parts.append(process.stdout.read())
+
+    def read_stderr():
+        for line in process.stderr:
+            stderr_lines.append((time.monotonic() - start, line))
+
+    readers = [threading.Thread(target=read_stdout, daemon=True),
+               threading.Thread(target=read_stderr, daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    sampled = bool(limits) or slot is not None or cancel_event is not None
+    cancelled, reason, peak = False, None, 0
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG if sampled else 0)
+        if pid:
+            break
+        rss = process_rss(process.pid)
+        if rss is not None:
+            peak = max(peak, rss)
+            if slot is not None and _usage is not None:
+                _usage[slot] = rss
+        if not (cancelled or reason):
+            if limits.get("memory") and rss is not None and rss > limits["memory"]:
+                reason = f"killed: resident memory exceeded the {format_size(limits['memory'])} limit"
+            elif limits.get("timeout") and time.monotonic() - start > limits["timeout"]:
+                reason = f"killed: still running after {limits['timeout']:g}s (timeout)"
+            elif cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+            if cancelled or reason:
+                process.send_signal(signal.SIGKILL)
+        if cancel_event is not None:
+            cancel_event.wait(SAMPLE_INTERVAL)
+        else:
+            time.sleep(SAMPLE_INTERVAL)
+    wall = time.monotonic() - start
+    # Reaped here, so Popen must not wait for the process again
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    oom_kills = cgroup_oom_kills(cgroup) if cgroup else 0
+    if cgroup:
+        remove_cgroup(cgroup)
+
+    stderr = "".join(line for _, line in stderr_lines)
+    if cancelled:
+        return False, "", "cancelled", {"wall": wall}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    metrics = {"wall": wall, "user_cpu": rusage.ru_utime, "sys_cpu": rusage.ru_stime,
+               "peak_rss": max(peak, rusage.ru_maxrss * scale), "returncode": process.returncode,
+               "stderr_times": [t for t, _ in stderr_lines]}
+    metrics["killed"] = diagnose(limits, metrics, reason, oom_kills)
+    if metrics["killed"]:
+        stderr = stderr.rstrip("\n") + ("\n" if stderr.strip() else "") + metrics["killed"] + "\n"
+    return process.returncode == 0 and not metrics["killed"], "".join(stdout_parts), stderr, metrics
+
+def limit_warnings(limits):
+    """Return warnings about limits this platform cannot enforce"""
+    if not limits or not limits.get("memory") or process_rss(os.getpid()) is not None:
+        return []
+    if os.environ.get(CGROUP_ENV):
+        return [f"resident memory cannot be sampled on this platform; the memory limit is only "
+                f"enforced through the {CGROUP_ENV} cgroup"]
+    return ["resident memory cannot be sampled on this platform; renders will not be killed "
+            "for exceeding the memory limit"]
+
+def init_worker(usage):
+    """Pool initializer: share the batch's RSS array with this worker process"""
+    global _usage
+    _usage = usage
+
+def expected_peaks(estimates):
+    """Return the expected peak RSS of each job, using the median known peak for unmeasured ones"""
+    known = [e["peak_rss"] for e in estimates if e.get("peak_rss")]
+    default = statistics.median(known) if known else DEFAULT_PEAK_RSS
+    return [e.get("peak_rss") or default for e in estimates]
+
+def admits(peak, running, memory):
+    """Return whether a job expected to peak at ``peak`` bytes fits next to ``running``.
+
+    ``running`` holds ``(expected_peak, current_rss)`` pairs; what the
+    running jobs are still expected to allocate counts as taken. A job is
+    always admitted when nothing else runs, or when free memory is unknown.
+    """
+    available, total = memory
+    if not running or available is None:
+        return True
+    growth = sum(max(0, expected - rss) for expected, rss in running)
+    return peak + growth <= available - total * MEMORY_RESERVE
+
+def publish_usage(usage_file, jobs, peaks, running, usage, queued, memory):
+    """Atomically write the current usage of a batch for ``status``"""
+    state = {"pid": os.getpid(), "updated": time.time(), "queued": queued,
+             "memory": {"available": memory[0], "total": memory[1]},
+             "running": [{"scad": jobs[i]["scad"], "kind": jobs[i]["kind"], "rss": usage[i],
+                          "expected_peak": int(peaks[i])} for i in running]}
+    tmp_file = usage_file.with_name(f"{usage_file.name}.tmp")
+    try:
+        tmp_file.write_text(json.dumps(state))
+        os.replace(tmp_file, usage_file)
+    except OSError:
+        pass
+
+def execute(jobs, target, max_workers, peaks):
+    """Run ``target(job)`` for each job on a process pool, yielding results as they finish.
+
+    At most ``max_workers`` jobs run at once, and a job only starts once
+    :func:`admits` lets it in, taking jobs in the given order but starting a
+    later, smaller one when the next one does not fit yet. Jobs are passed
+    to ``target`` with a ``slot`` for publishing their memory use.
+    """
+    usage = multiprocessing.Array("q", max(1, len(jobs)), lock=False)
+    queue = list(range(len(jobs)))
+    running = {}
+    USAGE_DIR.mkdir(parents=True, exist_ok=True)
+    usage_file = USAGE_DIR / f"{os.getpid()}.json"
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(usage,)) as pool:
+            while queue or running:
+                memory = memory_status()
+                active = [(peaks[i], usage[i]) for i in running.values()]
+                for index in list(queue):
+                    if len(running) >= max_workers:
+                        break
+                    if not admits(peaks[index], active, memory):
+                        continue
+                    queue.remove(index)
+                    running[pool.submit(target, dict(jobs[index], slot=index))] = index
+                    active.append((peaks[index], 0))
+                publish_usage(usage_file, jobs, peaks, running.values(), usage, len(queue), memory)
+                done, _ = wait(running, timeout=ADMISSION_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    yield future.result()
+    finally:
+        usage_file.unlink(missing_ok=True)
+
+def read_usage():
+    """Return the usage of all running batches, removing files left by dead ones"""
+    batches = []
+    for usage_file in sorted(USAGE_DIR.glob("*.json")):
+        try:
+            state = json.loads(usage_file.read_text())
+        except (OSError, ValueError):
+            continue
+        if time.time() - state.get("updated", 0) > USAGE_STALE:
+            usage_file.unlink(missing_ok=True)
+            continue
+        batches.append(state)
+    return batches
+
+def print_status(batches, memory):
+    """Print system memory and the renders of every running batch"""
+    available, total = memory
+    if total:
+        print(f"Memory: {format_size(available)} available of {format_size(total)}")
+    if not batches:
+        print("No batch renders running")
+        return
+    for state in batches:
+        used = sum(job["rss"] for job in state["running"])
+        print(f"\nBatch {state['pid']}: {len(state['running'])} running ({format_size(used)} RSS), "
+              f"{state['queued']} waiting")
+        for job in state["running"]:
+            print(f"  {job['kind'].upper():<4} {job['scad']}: {format_size(job['rss'])} "
+                  f"(expected peak {format_size(job['expected_peak'])})")
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if not args or args[0] != "status":
+        print("Usage:")
+        print("  python3 render_executor.py status [--json]   # Memory use of running batch renders")
+        print()
+        print("Limits for every render (render_preview.py --memory-limit/--cpu-limit/--timeout):")
+        print(f"  {MEMORY_LIMIT_ENV}=4G  {CPU_LIMIT_ENV}=600  {TIMEOUT_ENV}=900")
+        print(f"  {CGROUP_ENV}=<delegated cgroup v2 directory>  # Also enforce memory with cgroups")
+        sys.exit(1)
+
+    batches, memory = read_usage(), memory_status()
+    if "--json" in args:
+        print(json.dumps({"memory": {"available": memory[0], "total": memory[1]}, "batches": batches}, indent=2))
+    else:
+        print_status(batches, memory)
+
+if __name__ == "__main__":
+    main()
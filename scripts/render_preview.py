@@ -4,115 +4,523 @@ OpenSCAD Preview Renderer
 Automatically renders OpenSCAD files for preview in Cursor
 """
 
+import glob
 import os
-import subprocess
 import sys
+import threading
 from pathlib import Path
 import time
 
-def run_command(cmd, cwd=None):
-    """Run a command and return success status"""
+import file_watcher
+import render_cache
+import render_cost
+import render_executor
+import render_profile
+import render_service
+import scad_bundle
+import scad_deps
+import stl_tools
+from cli_utils import parse_size, pop_option, run_command
+
+# Image size used for PNG previews
+PNG_SIZE = "800,600"
+
+# Render presets: which exports to produce, the 3D backend and -D overrides.
+# "preview" trades accuracy for turnaround (an OpenCSG thumbnail with coarse
+# curves, no STL); "release" is the full-quality path. The backend only
+# applies to full renders, which the preview preset never runs.
+PRESETS = {
+    "preview": {"kinds": ["png"], "png_render": False, "backend": None,
+                "overrides": {"$fn": 0, "$fa": 12, "$fs": 2}},
+    "release": {"kinds": ["stl", "png"], "png_render": True, "backend": None, "overrides": {}},
+}
+
+# Cached result of `openscad --version`
+_openscad_version = None
+
+# Cached output of `openscad --help`, used to detect backend support
+_openscad_help = None
+
+# Send exports to the render service (render_service.py) when it is running
+_use_service = False
+
+# STL post-processing (see stl_tools.py): convert to binary and compute mesh
+# statistics, optionally keeping a "gzip" or "zstd" compressed copy
+_postprocess = {"convert": True, "compress": None}
+
+# Render tree-shaken single-file bundles (scad_bundle.py) instead of the
+# models themselves, falling back to the model if it cannot be bundled
+_bundle = False
+
+# Per-render memory, CPU time and wall time limits (see render_executor.py);
+# None falls back to the OPENSCAD_RENDER_* environment variables
+_limits = None
+
+def get_openscad_version():
+    """Return the OpenSCAD version string (part of every render cache key)"""
+    global _openscad_version
+    if _openscad_version is None and _use_service:
+        try:
+            _openscad_version = render_service.request({"op": "status"}, timeout=2)["status"]["openscad_version"]
+        except (OSError, ValueError, KeyError):
+            pass
+    if _openscad_version is None:
+        success, stdout, stderr = run_command(["openscad", "--version"])
+        _openscad_version = (stdout + stderr).strip() if success else None
+    return _openscad_version
+
+def backend_options(backend):
+    """Return the options selecting ``backend``, or none if this OpenSCAD lacks it.
+
+    Current builds take ``--backend=manifold``; earlier development
+    snapshots enabled Manifold as the ``manifold`` experimental feature.
+    """
+    global _openscad_help
+    if not backend:
+        return []
+    if _openscad_help is None:
+        success, stdout, stderr = run_command(["openscad", "--help"])
+        _openscad_help = stdout + stderr
+    if "--backend" in _openscad_help:
+        return [f"--backend={backend}"]
+    if backend == "manifold" and "manifold" in _openscad_help:
+        return ["--enable=manifold"]
+    return []
+
+def export_options(kind, preset="release", backend=None):
+    """Return the OpenSCAD options for an STL or PNG export with a render preset.
+
+    ``backend`` overrides the preset's 3D backend for this export only.
+    """
+    settings = dict(PRESETS[preset], backend=backend or PRESETS[preset]["backend"])
+    options = []
+    if kind == "png":
+        if settings["png_render"]:
+            options.append("--render")
+        options.append(f"--imgsize={PNG_SIZE}")
+    if kind == "stl" or settings["png_render"]:
+        options += backend_options(settings["backend"])
+    for name, value in settings["overrides"].items():
+        options += ["-D", f"{name}={value}"]
+    return options
+
+def export_command(scad_path, output_file, options):
+    """Build the OpenSCAD command line for an export"""
+    return ["openscad", "-o", str(output_file), *options, str(scad_path)]
+
+def make_job(scad_path, output_file, kind, use_cache=True, extra_options=(), preset="release", backend=None):
+    """Describe one export for :func:`run_export`.
+
+    ``extra_options`` (e.g. ``-D`` overrides) are passed to OpenSCAD and are
+    part of the render cache key.
+    """
+    return {"scad": str(scad_path), "output": str(output_file), "kind": kind,
+            "options": export_options(kind, preset, backend) + list(extra_options),
+            "version": get_openscad_version(), "cache": use_cache, "service": _use_service,
+            "profile": render_profile.get_profile_log(), "bundle": _bundle,
+            "limits": _limits if _limits is not None else render_executor.default_limits(),
+            "postprocess": dict(_postprocess) if kind == "stl" and _postprocess else None}
+
+def postprocess_export(job):
+    """Post-process a finished STL export; return mesh statistics or an error entry"""
+    settings = job.get("postprocess")
+    if not settings:
+        return None
     try:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True)
-        return result.returncode == 0, result.stdout, result.stderr
-    except Exception as e:
-        return False, "", str(e)
+        return stl_tools.process_stl(job["output"], settings["convert"], settings["compress"], sidecar=True)
+    except (OSError, ValueError) as e:
+        return {"error": str(e)}
+
+def run_export(job, cancel_event=None):
+    """Run one export job created by :func:`make_job`.
+
+    Module-level so it can be shipped to worker processes; returns the job
+    extended with ``success``, ``cached``, ``elapsed`` and ``stderr``.
+    Unchanged inputs are served from the render cache. Jobs with a
+    ``profile`` log record timings and OpenSCAD statistics there (see
+    render_profile.py). STL exports are streamed through stl_tools.py
+    (binary conversion and mesh statistics, in ``mesh``) before they are
+    cached. Jobs with ``bundle`` set render the model's flattened bundle
+    (see scad_bundle.py; the path or the reason it was skipped is returned
+    in ``bundled``). OpenSCAD runs under the job's ``limits`` (see
+    render_executor.py); its peak RSS is returned in ``peak_rss`` and the
+    diagnosis of a render killed by a limit in ``killed``. Jobs flagged for
+    the render service run there (without cancellation support), falling
+    back to a local render if the service is unreachable.
+    """
+    if job.get("service"):
+        result = render_service.submit(job)
+        if result is not None:
+            return result
+    scad_path = Path(job["scad"])
+    start = time.monotonic()
+    key = None
+    if job.get("cache"):
+        key = render_cache.cache_key(scad_path, [job["kind"], *job["options"]], job["version"])
+        if key and render_cache.lookup(key, job["kind"], job["output"]):
+            if job.get("profile"):
+                render_profile.append_record(job["profile"], render_profile.make_record(
+                    job, True, True, metrics={"wall": time.monotonic() - start}))
+            return dict(job, success=True, cached=True, elapsed=time.monotonic() - start, stderr="",
+                        mesh=postprocess_export(job))
 
-def render_scad_file(scad_file, output_dir="renders"):
-    """Render an OpenSCAD file to STL and PNG"""
+    source, bundled = scad_path, None
+    if job.get("bundle"):
+        try:
+            bundled = scad_bundle.bundle_model(scad_path)["path"]
+            source = Path(bundled)
+        except (scad_bundle.BundleError, OSError) as e:
+            bundled = f"not bundled: {e}"
+    command = export_command(source, job["output"], job["options"])
+    success, stdout, stderr, metrics = render_executor.run_limited(
+        command, cwd=scad_path.parent, cancel_event=cancel_event, limits=job.get("limits"), slot=job.get("slot"))
+    if job.get("profile") and stderr != "cancelled":
+        render_profile.append_record(job["profile"], render_profile.make_record(
+            job, success, False, stderr, metrics))
+    mesh = postprocess_export(job) if success else None
+    if success and key:
+        render_cache.store(key, job["kind"], job["output"])
+    return dict(job, success=success, cached=False, elapsed=time.monotonic() - start,
+                stderr=stderr.strip(), mesh=mesh, bundled=bundled,
+                peak_rss=metrics.get("peak_rss"), killed=metrics.get("killed"))
+
+def render_scad_file(scad_file, output_dir="renders", use_cache=True, cancel_event=None, preset="release",
+                     backend=None):
+    """Render an OpenSCAD file to the exports of a render preset (STL and PNG by default)"""
     scad_path = Path(scad_file)
     
     if not scad_path.exists():
         print(f"Error: File {scad_file} does not exist")
         return False
     
-    # Create output directory
-    output_path = Path(output_dir)
-    output_path.mkdir(exist_ok=True)
+    # Create output directory (absolute, since OpenSCAD runs in the file's directory)
+    scad_path = scad_path.resolve()
+    output_path = Path(output_dir).resolve()
+    output_path.mkdir(parents=True, exist_ok=True)
     
-    # Generate output filenames
-    base_name = scad_path.stem
-    stl_file = output_path / f"{base_name}.stl"
-    png_file = output_path / f"{base_name}.png"
+    print(f"Rendering {scad_file}{' (preview)' if preset == 'preview' else ''}...")
     
-    print(f"Rendering {scad_file}...")
+    labels = {"stl": "STL", "png": "PNG preview"}
+    for kind in PRESETS[preset]["kinds"]:
+        output_file = output_path / f"{scad_path.stem}.{kind}"
+        print(f"  Generating {labels[kind]}...")
+        result = run_export(make_job(scad_path, output_file, kind, use_cache, preset=preset, backend=backend),
+                            cancel_event)
+        
+        if not result["success"]:
+            print(f"  ✗ {labels[kind]} generation failed: {result['stderr']}")
+            return False
+        cached = " (cached)" if result["cached"] else ""
+        print(f"  ✓ {labels[kind]} generated{cached}: {output_file}")
+        if result.get("bundled"):
+            print(f"    Bundle: {result['bundled']}")
+        if result.get("mesh"):
+            print(f"    Mesh: {result['mesh'].get('error') or stl_tools.format_stats(result['mesh'])}")
     
-    # Render to STL
-    print("  Generating STL...")
-    success, stdout, stderr = run_command(
-        f"openscad -o {stl_file} {scad_file}",
-        cwd=scad_path.parent
-    )
+    return True
+
+def collect_scad_files(patterns):
+    """Expand files, directories (recursively) and glob patterns into .scad files"""
+    files = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(path.rglob("*.scad"))
+        elif path.is_file():
+            matches = [path]
+        else:
+            matches = sorted(Path(m) for m in glob.glob(pattern, recursive=True) if m.endswith(".scad"))
+        for match in matches:
+            resolved = match.resolve()
+            if resolved not in files:
+                files.append(resolved)
+    return files
+
+def batch_output_base(scad_path, output_dir):
+    """Return the output path stem for a file, mirroring its location below the cwd"""
+    try:
+        relative = scad_path.relative_to(Path.cwd().resolve())
+    except ValueError:
+        relative = Path(scad_path.name)
+    return Path(output_dir).resolve() / relative.with_suffix("")
+
+def run_jobs(pending, jobs=None, label=None, estimates=None):
+    """Run export jobs on a process pool, yielding each result as it finishes.
+
+    Up to ``jobs`` exports (default: one per CPU) run at once, each starting
+    only when its expected peak memory fits (see render_executor.py).
+    ``estimates`` are the render_cost.py estimates of ``pending``.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    estimates = render_cost.estimate_jobs(pending) if estimates is None else estimates
+    for job in render_executor.execute(pending, run_export, jobs, render_executor.expected_peaks(estimates)):
+        icon = "✓" if job["success"] else "✗"
+        cached = ", cached" if job["cached"] else ""
+        name = label(job) if label else job["scad"]
+        print(f"  {icon} {job['kind'].upper()} {name} ({job['elapsed']:.2f}s{cached})")
+        yield job
+
+def render_batch(scad_files, output_dir="renders", jobs=None, use_cache=True, preset="release", backend=None):
+    """Render many files across a process pool.
+
+    STL and PNG exports are scheduled as independent jobs, so the two exports
+    of one file run concurrently. Jobs are submitted longest-first by their
+    render_cost.py estimate, and the measured timings feed that estimate for
+    the next run. Returns per-file results.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    pending = []
+    for scad_path in scad_files:
+        base = batch_output_base(scad_path, output_dir)
+        base.parent.mkdir(parents=True, exist_ok=True)
+        for kind in PRESETS[preset]["kinds"]:
+            pending.append(make_job(scad_path, f"{base}.{kind}", kind, use_cache, preset=preset, backend=backend))
+
+    pending, estimates = render_cost.order_longest_first(pending)
+    results = {str(path): {"file": str(path), "exports": {}} for path in scad_files}
+    print(f"Rendering {len(scad_files)} files ({len(pending)} exports) with up to {jobs} workers as memory "
+          f"allows, longest first (estimated {render_cost.makespan([e['seconds'] for e in estimates], jobs):.1f}s)...")
+    if pending and pending[0]["limits"]:
+        print(f"Limits per render: {render_executor.format_limits(pending[0]['limits'])}")
+    start = time.monotonic()
+    finished = []
+    for job in run_jobs(pending, jobs, estimates=estimates):
+        results[job["scad"]]["exports"][job["kind"]] = job
+        finished.append(job)
+    elapsed = time.monotonic() - start
+    render_cost.record_results(finished)
+
+    for result in results.values():
+        exports = result["exports"].values()
+        result["success"] = all(job["success"] for job in exports)
+        result["elapsed"] = max(job["elapsed"] for job in exports)
+    return list(results.values()), elapsed
+
+def print_batch_report(results, elapsed):
+    """Print per-file timings and failures; return the process exit code"""
+    print()
+    print("Batch Render Report")
+    print("=" * 50)
+    print(f"  {'File':<48} {'STL':>8} {'PNG':>8}")
+    for result in sorted(results, key=lambda r: r["elapsed"], reverse=True):
+        timings = ["-" if kind not in result["exports"]
+                   else f"{result['exports'][kind]['elapsed']:.2f}s" if result["exports"][kind]["success"]
+                   else "failed" for kind in ("stl", "png")]
+        print(f"  {Path(result['file']).name:<48} {timings[0]:>8} {timings[1]:>8}")
+
+    failed = [r for r in results if not r["success"]]
+    serial = sum(job["elapsed"] for r in results for job in r["exports"].values())
+    print()
+    cached = sum(1 for r in results for job in r["exports"].values() if job["cached"])
+    print(f"  Rendered {len(results) - len(failed)}/{len(results)} files in {elapsed:.2f}s "
+          f"(sum of export time: {serial:.2f}s, {cached} exports from cache)")
+    for result in failed:
+        for job in result["exports"].values():
+            if not job["success"]:
+                reason = job["stderr"].splitlines()[-1] if job["stderr"] else "unknown error"
+                print(f"  ✗ {result['file']} {job['kind'].upper()}: {reason}")
+    for result in results:
+        mesh = result["exports"].get("stl", {}).get("mesh")
+        if mesh and (mesh.get("error") or mesh.get("watertight") is False):
+            print(f"  ⚠ {result['file']}: {mesh.get('error') or stl_tools.format_stats(mesh)}")
+    return 1 if failed else 0
+
+def find_top_level_models(scad_files):
+    """Drop files that other files include/use; what remains are the models to render"""
+    closures = {path: set(scad_deps.dependency_closure(path)[0]) for path in scad_files}
+    included = set().union(*closures.values()) if closures else set()
+    return {path: deps for path, deps in closures.items() if path not in included or len(scad_files) == 1}
+
+def render_models(models, output_dir, use_cache, cancel_event, done, preset="preview", backend=None):
+    """Render models one after another until done or cancelled, recording finished ones in ``done``"""
+    for model in models:
+        if cancel_event.is_set():
+            return
+        if render_scad_file(model, output_dir, use_cache, cancel_event, preset, backend) or not cancel_event.is_set():
+            done.add(model)
+
+def watch_and_render(target, output_dir="renders", use_cache=True, preset="preview", backend=None):
+    """Watch a file or directory tree and re-render affected models on changes.
+
+    Changes to any include/use dependency count too. Save bursts are
+    debounced, and a render in progress is cancelled when a newer change
+    arrives. Uses the fast preview preset unless told otherwise.
+    """
+    target_path = Path(target).resolve()
+    if not target_path.exists():
+        print(f"Error: File {target} does not exist")
+        return
     
-    if not success:
-        print(f"  ✗ STL generation failed: {stderr}")
-        return False
-    else:
-        print(f"  ✓ STL generated: {stl_file}")
+    models = find_top_level_models(collect_scad_files([target_path]))
+    watcher = file_watcher.create_watcher()
     
-    # Render to PNG (preview)
-    print("  Generating PNG preview...")
-    success, stdout, stderr = run_command(
-        f"openscad -o {png_file} --render --imgsize=800,600 {scad_file}",
-        cwd=scad_path.parent
-    )
+    def watch_dependencies():
+        for deps in models.values():
+            for dep in deps:
+                watcher.watch_directory(dep.parent)
     
-    if not success:
-        print(f"  ✗ PNG generation failed: {stderr}")
-        return False
+    if target_path.is_dir():
+        watcher.watch_directory(target_path, recursive=True)
     else:
-        print(f"  ✓ PNG preview generated: {png_file}")
-    
-    return True
-
-def watch_and_render(scad_file):
-    """Watch an OpenSCAD file and auto-render on changes"""
-    scad_path = Path(scad_file)
-    if not scad_path.exists():
-        print(f"Error: File {scad_file} does not exist")
-        return
+        watcher.watch_directory(target_path.parent)
+    watch_dependencies()
     
-    print(f"Watching {scad_file} for changes...")
+    print(f"Watching {target} ({len(models)} models) for changes...")
+    print(f"Using {type(watcher).__name__}")
     print("Press Ctrl+C to stop")
     
-    last_modified = 0
+    pending = set(models)
+    current, done, cancel_event, render_thread = [], set(), None, None
     
     try:
         while True:
-            current_modified = scad_path.stat().st_mtime
-            
-            if current_modified > last_modified:
+            if pending and (render_thread is None or not render_thread.is_alive()):
                 print(f"\n{time.strftime('%H:%M:%S')} - File changed, rendering...")
-                render_scad_file(scad_file)
-                last_modified = current_modified
+                current, pending, done = sorted(pending), set(), set()
+                cancel_event = threading.Event()
+                render_thread = threading.Thread(
+                    target=render_models,
+                    args=(current, output_dir, use_cache, cancel_event, done, preset, backend),
+                    daemon=True
+                )
+                render_thread.start()
+            
+            changed = file_watcher.wait_for_changes(watcher)
+            if not changed:
+                continue
+            
+            # Track models that appeared or disappeared below a watched directory
+            if target_path.is_dir():
+                for path in changed:
+                    if path.exists() and target_path in path.parents and path not in models:
+                        models[path] = set()
+                    elif not path.exists():
+                        models.pop(path, None)
             
-            time.sleep(1)
+            affected = {model for model, deps in models.items()
+                        if model in changed or deps & changed}
+            for model in affected:
+                models[model] = set(scad_deps.dependency_closure(model)[0])
+            watch_dependencies()
+            if not affected:
+                continue
+            
+            if render_thread is not None and render_thread.is_alive():
+                print(f"\n{time.strftime('%H:%M:%S')} - Newer change, cancelling current render...")
+                cancel_event.set()
+                render_thread.join()
+                # Models the cancelled run had not finished still need rendering
+                affected |= {model for model in current if model in models and model not in done}
+            pending |= affected
             
     except KeyboardInterrupt:
+        if cancel_event is not None:
+            cancel_event.set()
         print("\nStopping watch mode...")
+    finally:
+        watcher.close()
+
+def print_usage():
+    """Print command line usage"""
+    print("Usage:")
+    print("  python3 render_preview.py <file.scad>           # Render once")
+    print("  python3 render_preview.py <file.scad|dir> --watch  # Watch and auto-render")
+    print("  python3 render_preview.py --batch <file|dir|glob>... [--jobs N] [--output DIR]")
+    print("                                                  # Render many files in parallel")
+    print("  Add --no-cache to bypass the render cache, --service to use a running render service,")
+    print("  --profile to record timings (see render_profile.py summary)")
+    print("  --preset preview|release  preview: PNG only (OpenCSG), coarse $fn/$fa/$fs")
+    print("                            (default for --watch); release: full STL + PNG")
+    print("  --backend NAME            3D backend for full renders (STL, release PNG), e.g. manifold")
+    print("  --compress gzip|zstd      Keep a compressed copy of each STL")
+    print("  --no-postprocess          Keep OpenSCAD's STL as is (no binary conversion or mesh checks)")
+    print("  --bundle                  Render a flattened bundle of only the library code used")
+    print("  --memory-limit SIZE       Kill renders whose resident memory exceeds SIZE (e.g. 4G)")
+    print("  --cpu-limit SECONDS       Kill renders after this much CPU time")
+    print("  --timeout SECONDS         Kill renders running longer than this")
 
 def main():
     """Main function"""
     if len(sys.argv) < 2:
-        print("Usage:")
-        print("  python3 render_preview.py <file.scad>           # Render once")
-        print("  python3 render_preview.py <file.scad> --watch   # Watch and auto-render")
+        print_usage()
         sys.exit(1)
     
-    scad_file = sys.argv[1]
-    watch_mode = len(sys.argv) > 2 and sys.argv[2] == "--watch"
+    args = sys.argv[1:]
+    batch_mode = "--batch" in args
+    if batch_mode:
+        args.remove("--batch")
+    jobs = pop_option(args, "--jobs", None, int)
+    output_dir = pop_option(args, "--output", "renders")
+    use_cache = "--no-cache" not in args
+    if not use_cache:
+        args.remove("--no-cache")
+    if "--service" in args:
+        args.remove("--service")
+        global _use_service
+        _use_service = render_service.ping()
+        if not _use_service:
+            print("Render service is not running, rendering locally")
+    if "--profile" in args:
+        args.remove("--profile")
+        os.environ.setdefault(render_profile.PROFILE_ENV, "1")
+    watch_mode = "--watch" in args
+    if watch_mode:
+        args.remove("--watch")
+    preset = pop_option(args, "--preset", "preview" if watch_mode else "release")
+    if preset not in PRESETS:
+        print(f"Error: unknown preset {preset} (choose from {', '.join(PRESETS)})")
+        sys.exit(2)
+    compress = pop_option(args, "--compress")
+    if compress and compress not in stl_tools.COMPRESSION_FORMATS:
+        print(f"Error: unknown compression format {compress} "
+              f"(choose from {', '.join(stl_tools.COMPRESSION_FORMATS)})")
+        sys.exit(2)
+    global _postprocess
+    if "--no-postprocess" in args:
+        args.remove("--no-postprocess")
+        _postprocess = None
+    elif compress:
+        _postprocess["compress"] = compress
+    if "--bundle" in args:
+        args.remove("--bundle")
+        global _bundle
+        _bundle = True
+    global _limits
+    try:
+        _limits = render_executor.default_limits(
+            memory=pop_option(args, "--memory-limit", None, parse_size),
+            cpu=pop_option(args, "--cpu-limit", None, float),
+            timeout=pop_option(args, "--timeout", None, float))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    for warning in render_executor.limit_warnings(_limits):
+        print(f"⚠ {warning}")
+    backend = pop_option(args, "--backend")
+    backend = backend.lower() if backend else None
+    
+    if not args:
+        print_usage()
+        sys.exit(1)
     
     # Check if OpenSCAD is available
-    success, _, _ = run_command("openscad --version")
-    if not success:
+    if get_openscad_version() is None:
         print("Error: OpenSCAD is not installed or not in PATH")
         print("Please install OpenSCAD to use this tool")
         sys.exit(1)
     
-    if watch_mode:
-        watch_and_render(scad_file)
+    if batch_mode:
+        scad_files = collect_scad_files(args)
+        if not scad_files:
+            print("Error: No .scad files matched")
+            sys.exit(1)
+        results, elapsed = render_batch(scad_files, output_dir, jobs, use_cache, preset, backend)
+        sys.exit(print_batch_report(results, elapsed))
+    elif watch_mode:
+        watch_and_render(args[0], output_dir, use_cache, preset, backend)
     else:
-        render_scad_file(scad_file)
+        if not render_scad_file(args[0], output_dir, use_cache, preset=preset, backend=backend):
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
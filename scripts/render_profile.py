@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Profiler
+Record where render time goes and rank the slowest models and libraries
+
+Every profiled OpenSCAD run records wall time, CPU time and peak RSS (from
+``os.wait4``), the time spent in each stage OpenSCAD announces on stderr
+("Parsing design...", "Rendering Polygons to CGAL...") and the cache and
+geometry statistics it prints. Records are appended as JSON lines to
+.openscad-cache/profile.jsonl when OPENSCAD_RENDER_PROFILE is set or
+render_preview.py runs with --profile.
+"""
+
+import json
+import os
+import re
+import statistics
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import render_executor
+import scad_deps
+from cli_utils import format_size, pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+
+# "1" selects the default log; any other value is a log path
+PROFILE_ENV = "OPENSCAD_RENDER_PROFILE"
+DEFAULT_LOG = WORKSPACE_DIR / ".openscad-cache" / "profile.jsonl"
+
+# A line announcing a new stage, e.g. "Compiling design (CSG Tree generation)..."
+STAGE_RE = re.compile(r"^([A-Z][^:]*?)\.\.\.\s*$")
+# "Name:   123" statistics (cache sizes and top level object counts)
+MESSAGE_PREFIXES = ("ECHO:", "WARNING:", "ERROR:", "DEPRECATED:", "TRACE:")
+STAT_RE = re.compile(r"^\s*([A-Za-z][A-Za-z ]*?):\s+(\d+)\s*$")
+TOTAL_TIME_RE = re.compile(r"Total rendering time:\s*(?:(\d+):(\d+):([\d.]+)|"
+                           r"(\d+) hours, (\d+) minutes, ([\d.]+) seconds)")
+
+def get_profile_log():
+    """Return the profile log path if profiling is enabled, else None"""
+    value = os.environ.get(PROFILE_ENV, "")
+    if not value or value == "0":
+        return None
+    return str(DEFAULT_LOG if value == "1" else Path(value).expanduser().resolve())
+
+def run_profiled(cmd, cwd=None, cancel_event=None):
+    """Run a command, returning ``(success, stdout, stderr, metrics)``.
+
+    ``metrics`` holds wall and CPU time, peak RSS and the arrival time of
+    every stderr line, which :func:`parse_stderr` turns into stage timings.
+    This is :func:`render_executor.run_limited` without limits.
+    """
+    return render_executor.run_limited(cmd, cwd, cancel_event)
+
+def snake_case(name):
+    """Turn ``Geometry cache size in bytes`` into ``geometry_cache_size_in_bytes``"""
+    return re.sub(r"\W+", "_", name.strip().lower()).strip("_")
+
+def parse_stderr(stderr, line_times=None, wall=None):
+    """Extract stage timings and statistics from OpenSCAD's stderr.
+
+    With ``line_times`` (the arrival time of each line) a stage lasts from
+    its announcement to the next stage or, for the last one, to ``wall``.
+    """
+    lines = stderr.splitlines()
+    line_times = line_times or []
+    stages, stats = [], {}
+    backend = None
+    total_time = None
+    warnings = 0
+    for number, line in enumerate(lines):
+        at = line_times[number] if number < len(line_times) else None
+        stage = STAGE_RE.match(line)
+        if stage:
+            stages.append({"stage": stage.group(1), "start": at})
+            continue
+        stat = None if line.startswith(MESSAGE_PREFIXES) else STAT_RE.match(line)
+        if stat:
+            stats[snake_case(stat.group(1))] = int(stat.group(2))
+        if line.startswith("WARNING:"):
+            warnings += 1
+        if "Top level object is" in line or "Rendering Polygons to" in line:
+            backend = "manifold" if "manifold" in line.lower() else backend or "cgal"
+        total = TOTAL_TIME_RE.search(line)
+        if total:
+            h, m, s = [g for g in total.groups() if g is not None]
+            total_time = int(h) * 3600 + int(m) * 60 + float(s)
+
+    for stage, following in zip(stages, stages[1:] + [None]):
+        end = following["start"] if following else wall
+        stage["seconds"] = (end - stage["start"]) if end is not None and stage["start"] is not None else None
+        del stage["start"]
+    return {"stages": stages, "stats": stats, "backend": backend,
+            "openscad_total": total_time, "warnings": warnings}
+
+def model_libraries(scad_file):
+    """Return the names of the libraries/ directories a model pulls in"""
+    libraries_dir = WORKSPACE_DIR / "libraries"
+    names = set()
+    for dep in scad_deps.dependency_closure(scad_file)[0]:
+        if libraries_dir in dep.parents:
+            names.add(dep.relative_to(libraries_dir).parts[0])
+    return sorted(names)
+
+def make_record(job, success, cached, stderr="", metrics=None):
+    """Build a profile record for one export"""
+    metrics = metrics or {}
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "scad": scad_deps.index_key(job["scad"]),
+        "kind": job["kind"],
+        "options": job["options"],
+        "version": job["version"],
+        "success": success,
+        "cached": cached,
+        "wall": round(metrics.get("wall", 0.0), 4),
+        "user_cpu": metrics.get("user_cpu"),
+        "sys_cpu": metrics.get("sys_cpu"),
+        "peak_rss": metrics.get("peak_rss"),
+        "libraries": model_libraries(job["scad"]),
+    }
+    if not cached:
+        record.update(parse_stderr(stderr, metrics.get("stderr_times"), metrics.get("wall")))
+    return record
+
+def append_record(log_file, record):
+    """Append one record to the JSONL log (a single O_APPEND write, safe across processes)"""
+    log_file = Path(log_file)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode())
+    finally:
+        os.close(fd)
+
+def read_records(log_file):
+    """Read profile records, skipping damaged lines"""
+    records = []
+    try:
+        with open(log_file) as handle:
+            for line in handle:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+def summarize(records):
+    """Aggregate records per model, per library and per stage"""
+    models, libraries, stages = {}, {}, {}
+    for record in records:
+        if record.get("cached") or not record.get("success"):
+            continue
+        model = models.setdefault(record["scad"], {"walls": [], "cpu": 0.0, "peak_rss": 0,
+                                                   "backend": None, "libraries": record["libraries"]})
+        model["walls"].append(record["wall"])
+        model["cpu"] += (record.get("user_cpu") or 0.0) + (record.get("sys_cpu") or 0.0)
+        model["peak_rss"] = max(model["peak_rss"], record.get("peak_rss") or 0)
+        model["backend"] = record.get("backend") or model["backend"]
+        for name in record["libraries"]:
+            library = libraries.setdefault(name, {"wall": 0.0, "models": set()})
+            library["wall"] += record["wall"]
+            library["models"].add(record["scad"])
+        for stage in record.get("stages", []):
+            if stage.get("seconds") is not None:
+                stages[stage["stage"]] = stages.get(stage["stage"], 0.0) + stage["seconds"]
+
+    for model in models.values():
+        model["total"] = sum(model["walls"])
+        model["median"] = statistics.median(model["walls"])
+        model["runs"] = len(model["walls"])
+    hits = sum(1 for r in records if r.get("cached"))
+    failures = sum(1 for r in records if not r.get("success"))
+    return {"models": models, "libraries": libraries, "stages": stages,
+            "records": len(records), "cache_hits": hits, "failures": failures}
+
+def print_summary(summary, top=10):
+    """Print the slowest models, libraries and stages"""
+    print("OpenSCAD Render Profile")
+    print("=" * 50)
+    print(f"Records: {summary['records']}  Cache hits: {summary['cache_hits']}  "
+          f"Failures: {summary['failures']}")
+
+    print()
+    print("Slowest models (by total render time):")
+    print(f"  {'Model':<40} {'Runs':>5} {'Median':>8} {'Total':>8} {'CPU':>8} {'Peak RSS':>10}  Backend")
+    models = sorted(summary["models"].items(), key=lambda item: item[1]["total"], reverse=True)
+    for name, model in models[:top]:
+        print(f"  {name[-40:]:<40} {model['runs']:>5} {model['median']:>7.2f}s {model['total']:>7.2f}s "
+              f"{model['cpu']:>7.2f}s {format_size(model['peak_rss']):>10}  {model['backend'] or '-'}")
+
+    if summary["libraries"]:
+        print()
+        print("Libraries (render time of the models using them):")
+        libraries = sorted(summary["libraries"].items(), key=lambda item: item[1]["wall"], reverse=True)
+        for name, library in libraries[:top]:
+            print(f"  {name:<40} {library['wall']:>7.2f}s  {len(library['models'])} models")
+
+    if summary["stages"]:
+        print()
+        print("Time per OpenSCAD stage:")
+        total = sum(summary["stages"].values()) or 1.0
+        for name, seconds in sorted(summary["stages"].items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name[:40]:<40} {seconds:>7.2f}s  {100.0 * seconds / total:5.1f}%")
+
+def main():
+    """Main function"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("summary", "clear"):
+        print("Usage:")
+        print("  python3 render_profile.py summary [--log FILE] [--top N] [--json]")
+        print("  python3 render_profile.py clear [--log FILE]")
+        print()
+        print(f"Record profiles with: {PROFILE_ENV}=1 python3 render_preview.py ... "
+              f"(or render_preview.py --profile)")
+        sys.exit(1)
+
+    args = sys.argv[2:]
+    log_file = Path(pop_option(args, "--log") or get_profile_log() or DEFAULT_LOG)
+    top = pop_option(args, "--top", 10, int)
+
+    if sys.argv[1] == "clear":
+        log_file.unlink(missing_ok=True)
+        print(f"Cleared {log_file}")
+        return
+
+    records = read_records(log_file)
+    if not records:
+        print(f"No profile records in {log_file}")
+        sys.exit(1)
+    summary = summarize(records)
+    if "--json" in args:
+        for library in summary["libraries"].values():
+            library["models"] = sorted(library["models"])
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, top)
+
+if __name__ == "__main__":
+    main()
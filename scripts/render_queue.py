@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Queue
+Spread batch renders over worker processes on several machines
+
+A coordinator enqueues the exports of a run into a SQLite database; any
+number of workers, on any host that sees the same workspace (e.g. over a
+network mount), lease jobs from it, heartbeat while rendering and record
+their results. Artifacts are written straight into the shared workspace.
+
+A lease that is not renewed (crashed worker, lost host) expires and the
+job is queued again, up to a retry limit. Every state change is also
+appended to a journal table. A run is identified by name, so enqueueing
+an interrupted run again keeps finished jobs and continues where it
+stopped.
+
+The queue uses SQLite's rollback journal rather than WAL, since WAL
+requires shared memory and does not work on network file systems. Lease
+times are wall-clock, so hosts need roughly synchronized clocks.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import scad_deps
+from cli_utils import pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+QUEUE_ENV = "OPENSCAD_RENDER_QUEUE"
+DEFAULT_QUEUE = WORKSPACE_DIR / ".openscad-cache" / "render_queue.db"
+DEFAULT_LEASE = 120
+DEFAULT_ATTEMPTS = 3
+POLL_INTERVAL = 2.0
+# Workers whose last heartbeat is older than this are shown as gone
+WORKER_TIMEOUT = 3 * DEFAULT_LEASE
+STDERR_LIMIT = 4000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, preset TEXT NOT NULL,
+    output_dir TEXT NOT NULL, use_cache INTEGER NOT NULL, created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL REFERENCES runs(id),
+    scad TEXT NOT NULL, kind TEXT NOT NULL, output TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0, state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL,
+    lease_owner TEXT, lease_expires REAL, result TEXT, updated REAL,
+    UNIQUE (run_id, scad, kind)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY, host TEXT, started REAL, heartbeat REAL,
+    completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY, time REAL NOT NULL, run_id INTEGER, job_id INTEGER,
+    event TEXT NOT NULL, worker TEXT, detail TEXT
+);
+"""
+
+def get_queue_path():
+    """Return the queue database path"""
+    return Path(os.environ.get(QUEUE_ENV) or DEFAULT_QUEUE).expanduser()
+
+def connect(db_file=None):
+    """Open the queue database in autocommit mode (transactions are explicit)"""
+    db_file = Path(db_file or get_queue_path())
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(db_file, timeout=60, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.executescript(SCHEMA)
+    return connection
+
+class transaction:
+    """``with transaction(connection):`` runs a BEGIN IMMEDIATE ... COMMIT block"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def log_event(connection, event, run_id=None, job_id=None, worker=None, detail=None):
+    """Append an event to the journal"""
+    connection.execute("INSERT INTO journal (time, run_id, job_id, event, worker, detail) VALUES (?, ?, ?, ?, ?, ?)",
+                       (time.time(), run_id, job_id, event, worker, detail))
+
+def find_run(connection, name=None):
+    """Return the run named ``name`` (default: the newest one) as a dict, or None"""
+    query = "SELECT id, name, preset, output_dir, use_cache, created FROM runs "
+    row = connection.execute(query + ("WHERE name = ?" if name else "ORDER BY id DESC LIMIT 1"),
+                             (name,) if name else ()).fetchone()
+    keys = ("id", "name", "preset", "output_dir", "use_cache", "created")
+    return dict(zip(keys, row)) if row else None
+
+def plan_jobs(paths, output_dir, preset):
+    """Return ``(scad, kind, output, priority)`` for every export of the models in ``paths``"""
+    import render_cost
+    import render_preview
+    models = render_preview.find_top_level_models(render_preview.collect_scad_files(paths))
+    output_root = Path(output_dir)
+    settings = render_preview.PRESETS[preset]
+    jobs = []
+    for model in sorted(models):
+        stem = Path(scad_deps.index_key(model)).with_suffix("")
+        for kind in settings["kinds"]:
+            jobs.append({"scad": str(model), "kind": kind,
+                         "output": scad_deps.index_key(WORKSPACE_DIR / output_root / f"{stem}.{kind}"),
+                         "options": ["--render"] if kind == "png" and settings["png_render"] else []})
+    estimates = render_cost.estimate_jobs(jobs)
+    return [(scad_deps.index_key(job["scad"]), job["kind"], job["output"], estimate["seconds"])
+            for job, estimate in zip(jobs, estimates)]
+
+def enqueue(connection, name, paths, preset="release", output_dir="renders", use_cache=True,
+            max_attempts=DEFAULT_ATTEMPTS, restart=False):
+    """Create or resume a run; return ``(run, added)``.
+
+    Jobs already in the run keep their state, so re-enqueueing an
+    interrupted run only adds new models. ``restart`` queues every job again.
+    Raises ValueError if an existing run has a different preset or output
+    directory.
+    """
+    planned = plan_jobs(paths, output_dir, preset)
+    with transaction(connection):
+        run = find_run(connection, name)
+        if run is None:
+            connection.execute("INSERT INTO runs (name, preset, output_dir, use_cache, created) VALUES (?, ?, ?, ?, ?)",
+                               (name, preset, output_dir, int(use_cache), time.time()))
+            run = find_run(connection, name)
+            log_event(connection, "run created", run["id"], detail=f"preset {preset}, {len(planned)} exports")
+        elif (run["preset"], run["output_dir"]) != (preset, output_dir):
+            raise ValueError(f"run {name} uses --preset {run['preset']} and --output {run['output_dir']}; "
+                             f"use another --run name for {preset} into {output_dir}")
+        elif restart:
+            connection.execute("UPDATE jobs SET state = 'queued', attempts = 0, lease_owner = NULL, "
+                               "result = NULL, updated = ? WHERE run_id = ?", (time.time(), run["id"]))
+            log_event(connection, "run restarted", run["id"])
+        added = 0
+        for scad, kind, output, priority in planned:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO jobs (run_id, scad, kind, output, priority, max_attempts, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (run["id"], scad, kind, output, priority, max_attempts, time.time()))
+            added += cursor.rowcount
+        if added:
+            log_event(connection, "enqueued", run["id"], detail=f"{added} exports")
+    return run, added
+
+def expire_leases(connection, now):
+    """Requeue (or fail, after ``max_attempts``) jobs whose lease ran out; call inside a transaction"""
+    expired = connection.execute("SELECT id, run_id, lease_owner, attempts, max_attempts FROM jobs "
+                                 "WHERE state = 'leased' AND lease_expires < ?", (now,)).fetchall()
+    for job_id, run_id, owner, attempts, max_attempts in expired:
+        if attempts >= max_attempts:
+            result = json.dumps({"success": False, "stderr": f"lease expired {attempts} times"})
+            connection.execute("UPDATE jobs SET state = 'failed', lease_owner = NULL, result = ?, updated = ? "
+                               "WHERE id = ?", (result, now, job_id))
+            log_event(connection, "failed", run_id, job_id, owner, "lease expired, no attempts left")
+        else:
+            connection.execute("UPDATE jobs SET state = 'queued', lease_owner = NULL, updated = ? WHERE id = ?",
+                               (now, job_id))
+            log_event(connection, "lease expired", run_id, job_id, owner)
+
+def claim(connection, worker, lease=DEFAULT_LEASE, run_name=None):
+    """Lease the most expensive queued job; return it as a dict, or None.
+
+    Every poll refreshes the worker's heartbeat, so idle workers stay listed.
+    """
+    now = time.time()
+    with transaction(connection):
+        connection.execute("UPDATE workers SET heartbeat = ? WHERE name = ?", (now, worker))
+        expire_leases(connection, now)
+        query = ("SELECT jobs.id, runs.id, runs.name, runs.preset, runs.use_cache, jobs.scad, jobs.kind, "
+                 "jobs.output, jobs.attempts FROM jobs JOIN runs ON runs.id = jobs.run_id WHERE jobs.state = 'queued'")
+        args = ()
+        if run_name:
+            query += " AND runs.name = ?"
+            args = (run_name,)
+        row = connection.execute(query + " ORDER BY runs.id, jobs.priority DESC, jobs.id LIMIT 1", args).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "run_id", "run", "preset", "use_cache", "scad", "kind", "output", "attempts"), row))
+        connection.execute("UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                           "attempts = attempts + 1, updated = ? WHERE id = ?", (worker, now + lease, now, job["id"]))
+        log_event(connection, "leased", job["run_id"], job["id"], worker, f"attempt {job['attempts'] + 1}")
+    return job
+
+def renew(connection, job_id, worker, lease=DEFAULT_LEASE):
+    """Extend a lease; return False if the worker no longer holds it"""
+    now = time.time()
+    with transaction(connection):
+        cursor = connection.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = 'leased' "
+                                    "AND lease_owner = ?", (now + lease, job_id, worker))
+        connection.execute("UPDATE workers SET heartbeat = ? WHERE name = ?", (now, worker))
+    return cursor.rowcount == 1
+
+def complete(connection, job, worker, result):
+    """Record a finished job; ignored if the lease was lost in the meantime"""
+    state = "done" if result["success"] else "failed"
+    now = time.time()
+    with transaction(connection):
+        cursor = connection.execute("UPDATE jobs SET state = ?, lease_owner = NULL, result = ?, updated = ? "
+                                    "WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                                    (state, json.dumps(result), now, job["id"], worker))
+        if cursor.rowcount:
+            column = "completed" if result["success"] else "failed"
+            connection.execute(f"UPDATE workers SET heartbeat = ?, {column} = {column} + 1 WHERE name = ?",
+                               (now, worker))
+            log_event(connection, state, job["run_id"], job["id"], worker, f"{result.get('elapsed', 0):.2f}s")
+        else:
+            log_event(connection, "result discarded", job["run_id"], job["id"], worker, "lease lost")
+    return cursor.rowcount == 1
+
+def job_result(job, outcome, worker):
+    """Reduce a run_export result to what the queue stores"""
+    output = scad_deps.key_path(job["output"])
+    return {"success": outcome["success"], "cached": outcome.get("cached", False),
+            "elapsed": round(outcome.get("elapsed", 0.0), 4), "worker": worker,
+            "stderr": (outcome.get("stderr") or "")[-STDERR_LIMIT:], "mesh": outcome.get("mesh"),
+            "size": output.stat().st_size if outcome["success"] and output.exists() else None}
+
+def run_leased_job(connection, job, worker, lease, export):
+    """Render one leased job while a heartbeat thread keeps its lease alive"""
+    import render_preview
+    scad_path = scad_deps.key_path(job["scad"])
+    output = scad_deps.key_path(job["output"])
+    output.parent.mkdir(parents=True, exist_ok=True)
+    render_job = render_preview.make_job(scad_path, output, job["kind"], bool(job["use_cache"]), preset=job["preset"])
+    cancel_event, stopped = threading.Event(), threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(lease / 3):
+            try:
+                if not renew(connection, job["id"], worker, lease):
+                    cancel_event.set()
+                    return
+            except sqlite3.Error:
+                continue
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        outcome = export(render_job, cancel_event)
+    except Exception as e:
+        outcome = {"success": False, "elapsed": 0.0, "stderr": str(e)}
+    finally:
+        stopped.set()
+        thread.join()
+    if cancel_event.is_set():
+        return None
+    result = job_result(job, outcome, worker)
+    complete(connection, job, worker, result)
+    return result
+
+def remaining(connection, run_name=None):
+    """Return the number of queued or leased jobs (of one run, or all)"""
+    query = "SELECT COUNT(*) FROM jobs JOIN runs ON runs.id = jobs.run_id WHERE jobs.state IN ('queued', 'leased')"
+    return connection.execute(query + (" AND runs.name = ?" if run_name else ""),
+                              (run_name,) if run_name else ()).fetchone()[0]
+
+def work(slots=1, lease=DEFAULT_LEASE, run_name=None, drain=False, stub=False):
+    """Run ``slots`` worker threads until stopped (or, with ``drain``, until nothing is left)"""
+    import render_preview
+    import render_service
+    def stub_export(job, cancel_event=None):
+        return render_service.stub_export(job)
+
+    export = stub_export if stub else render_preview.run_export
+    host = socket.gethostname()
+    stop = threading.Event()
+
+    def slot(number):
+        connection = connect()
+        worker = f"{host}:{os.getpid()}:{number}"
+        with transaction(connection):
+            connection.execute("INSERT OR REPLACE INTO workers (name, host, started, heartbeat) VALUES (?, ?, ?, ?)",
+                               (worker, host, time.time(), time.time()))
+        while not stop.is_set():
+            job = claim(connection, worker, lease, run_name)
+            if job is None:
+                if drain and remaining(connection, run_name) == 0:
+                    return
+                stop.wait(POLL_INTERVAL)
+                continue
+            result = run_leased_job(connection, job, worker, lease, export)
+            if result is None:
+                print(f"  ⚠ {job['scad']} {job['kind'].upper()}: lease lost, abandoned", flush=True)
+            else:
+                icon = "✓" if result["success"] else "✗"
+                cached = ", cached" if result["cached"] else ""
+                print(f"  {icon} {job['kind'].upper()} {job['scad']} ({result['elapsed']:.2f}s{cached}) [{worker}]",
+                      flush=True)
+
+    print(f"Render worker on {host} with {slots} slots, queue {get_queue_path()}", flush=True)
+    threads = [threading.Thread(target=slot, args=(n,), daemon=True) for n in range(slots)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        # Leases of interrupted jobs expire and the jobs are retried elsewhere
+        stop.set()
+        print("Stopping worker")
+        return 130
+    return 0
+
+def run_status(connection, run):
+    """Return job counts, failures and active workers of a run"""
+    counts = dict(connection.execute("SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state",
+                                     (run["id"],)).fetchall())
+    failures = [{"scad": scad, "kind": kind, **json.loads(result or "{}")} for scad, kind, result in connection.execute(
+        "SELECT scad, kind, result FROM jobs WHERE run_id = ? AND state = 'failed' ORDER BY scad", (run["id"],))]
+    workers = [{"name": name, "heartbeat": heartbeat, "completed": completed, "failed": failed}
+               for name, heartbeat, completed, failed in connection.execute(
+                   "SELECT name, heartbeat, completed, failed FROM workers WHERE heartbeat > ? ORDER BY name",
+                   (time.time() - WORKER_TIMEOUT,))]
+    return {"run": run["name"], "preset": run["preset"],
+            "counts": {state: counts.get(state, 0) for state in ("queued", "leased", "done", "failed")},
+            "failures": failures, "workers": workers}
+
+def print_status(status):
+    """Print a run's progress"""
+    counts = status["counts"]
+    total = sum(counts.values())
+    print(f"Run {status['run']} ({status['preset']}): {counts['done']}/{total} done, "
+          f"{counts['leased']} rendering, {counts['queued']} queued, {counts['failed']} failed")
+    for worker in status["workers"]:
+        print(f"  worker {worker['name']}: {worker['completed']} done, {worker['failed']} failed, "
+              f"last seen {time.time() - worker['heartbeat']:.0f}s ago")
+    for failure in status["failures"]:
+        reason = failure.get("stderr", "").strip().splitlines()[-1:] or ["unknown error"]
+        print(f"  ✗ {failure['scad']} {failure['kind'].upper()}: {reason[0]}")
+
+def main():
+    """Main function"""
+    commands = ("enqueue", "worker", "status", "wait", "retry", "journal")
+    args = sys.argv[1:]
+    if not args or args[0] not in commands:
+        print("Usage:")
+        print("  python3 render_queue.py enqueue [paths...] [--run NAME] [--preset P] [--output DIR]")
+        print("                          [--attempts N] [--no-cache] [--restart]")
+        print("                          # Queue the models in paths (default: projects examples)")
+        print("  python3 render_queue.py worker [--slots N] [--lease SECONDS] [--run NAME] [--drain] [--stub]")
+        print("                          # Render queued jobs; start one per build machine")
+        print("  python3 render_queue.py status [--run NAME] [--json]")
+        print("  python3 render_queue.py wait [--run NAME]      # Block until the run is finished")
+        print("  python3 render_queue.py retry [--run NAME]     # Queue failed jobs again")
+        print("  python3 render_queue.py journal [--run NAME] [--tail N]")
+        print()
+        print(f"Queue: {get_queue_path()} (override with {QUEUE_ENV}, e.g. on shared storage)")
+        print("Runs default to the newest one; enqueue defaults to a run named after today's date.")
+        sys.exit(1)
+
+    command = args.pop(0)
+    run_name = pop_option(args, "--run")
+    connection = connect()
+
+    if command == "enqueue":
+        import render_preview
+        preset = pop_option(args, "--preset", "release")
+        if preset not in render_preview.PRESETS:
+            print(f"Error: unknown preset {preset}")
+            sys.exit(2)
+        output_dir = pop_option(args, "--output", "renders")
+        attempts = pop_option(args, "--attempts", DEFAULT_ATTEMPTS, int)
+        use_cache = "--no-cache" not in args
+        restart = "--restart" in args
+        paths = [a for a in args if not a.startswith("--")] or ["projects", "examples"]
+        paths = [p if Path(p).is_absolute() or Path(p).exists() else str(WORKSPACE_DIR / p) for p in paths]
+        try:
+            run, added = enqueue(connection, run_name or f"nightly-{date.today().isoformat()}", paths,
+                                 preset, output_dir, use_cache, attempts, restart)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"✓ Run {run['name']}: {added} exports added")
+        print_status(run_status(connection, run))
+        return
+
+    if command == "worker":
+        slots = pop_option(args, "--slots", 1, int)
+        lease = pop_option(args, "--lease", DEFAULT_LEASE, float)
+        sys.exit(work(slots, lease, run_name, "--drain" in args, "--stub" in args))
+
+    run = find_run(connection, run_name)
+    if run is None:
+        print("No such run" if run_name else "No runs queued")
+        sys.exit(1)
+    if command == "status":
+        status = run_status(connection, run)
+        if "--json" in args:
+            print(json.dumps(status, indent=2))
+        else:
+            print_status(status)
+    elif command == "wait":
+        while remaining(connection, run["name"]):
+            time.sleep(POLL_INTERVAL)
+            with transaction(connection):
+                expire_leases(connection, time.time())
+        status = run_status(connection, run)
+        print_status(status)
+        sys.exit(1 if status["counts"]["failed"] else 0)
+    elif command == "retry":
+        with transaction(connection):
+            cursor = connection.execute("UPDATE jobs SET state = 'queued', attempts = 0, result = NULL, updated = ? "
+                                        "WHERE run_id = ? AND state = 'failed'", (time.time(), run["id"]))
+            log_event(connection, "retried", run["id"], detail=f"{cursor.rowcount} jobs")
+        print(f"✓ {cursor.rowcount} failed jobs queued again")
+    else:
+        tail = pop_option(args, "--tail", 50, int)
+        rows = connection.execute(
+            "SELECT journal.time, journal.event, journal.worker, journal.detail, jobs.scad, jobs.kind FROM journal "
+            "LEFT JOIN jobs ON jobs.id = journal.job_id WHERE journal.run_id = ? ORDER BY journal.id DESC LIMIT ?",
+            (run["id"], tail)).fetchall()
+        for at, event, worker, detail, scad, kind in reversed(rows):
+            target = f" {scad} {kind.upper()}" if scad else ""
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(at))} {event}{target}"
+                  f"{f' [{worker}]' if worker else ''}{f' ({detail})' if detail else ''}")
+
+if __name__ == "__main__":
+    main()
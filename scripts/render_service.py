@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Render Service
+Long-lived local daemon that keeps warm render workers
+
+OpenSCAD has no resident mode, so every export still runs an ``openscad``
+process. The service removes everything around it: workers are started once
+and reused, keep their imports and file-hash memo warm, and the OpenSCAD
+version is probed once for all clients. The CLI (``render_preview.py
+--service``) and watch mode submit jobs over a Unix socket using
+newline-delimited JSON:
+
+    {"op": "render", "job": {...}}  -> {"ok": true, "result": {...}}
+    {"op": "status"}                -> {"ok": true, "status": {...}}
+    {"op": "stop"}                  -> {"ok": true}
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from cli_utils import pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+SOCKET_ENV = "OPENSCAD_RENDER_SOCKET"
+DEFAULT_SOCKET = WORKSPACE_DIR / ".openscad-cache" / "render.sock"
+LATENCY_WINDOW = 1000
+
+def get_socket_path():
+    """Return the service socket path"""
+    return Path(os.environ.get(SOCKET_ENV) or DEFAULT_SOCKET)
+
+def stub_export(job):
+    """Stand-in for render_preview.run_export that never runs OpenSCAD.
+
+    Sleeps for ``job["stub_seconds"]`` and writes a placeholder output, which
+    is enough to exercise scheduling and the protocol.
+    """
+    start = time.monotonic()
+    time.sleep(float(job.get("stub_seconds", 0.05)))
+    success = "fail" not in Path(job["scad"]).name
+    if success:
+        Path(job["output"]).write_text("stub\n")
+    return dict(job, success=success, cached=False, elapsed=time.monotonic() - start,
+                stderr="" if success else "stub failure")
+
+def worker_main(connection, stub):
+    """Worker process: run export jobs received over ``connection`` until told to stop"""
+    if stub:
+        export = stub_export
+    else:
+        import render_preview
+        export = render_preview.run_export
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            result = export(job)
+        except Exception as e:
+            result = dict(job, success=False, cached=False, elapsed=0.0, stderr=str(e))
+        connection.send(result)
+
+class RenderService:
+    """Job queue feeding a pool of warm worker processes"""
+
+    def __init__(self, workers, stub=False):
+        self.stub = stub
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_times = deque(maxlen=LATENCY_WINDOW)
+        self.run_times = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+        self.version = None if stub else self._probe_version()
+        self.workers = [threading.Thread(target=self._dispatch, args=(n,), daemon=True)
+                        for n in range(workers)]
+        for thread in self.workers:
+            thread.start()
+
+    def _probe_version(self):
+        result = subprocess.run(["openscad", "--version"], capture_output=True, text=True)
+        return (result.stdout + result.stderr).strip() if result.returncode == 0 else None
+
+    def _start_worker(self):
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker_main, args=(child, self.stub), daemon=True)
+        process.start()
+        child.close()
+        return process, parent
+
+    def _dispatch(self, number):
+        """Feed one worker process from the shared queue, restarting it if it dies"""
+        process, connection = self._start_worker()
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                connection.send(None)
+                return
+            job, enqueued, reply = item
+            with self.lock:
+                self.in_flight += 1
+            started = time.monotonic()
+            try:
+                connection.send(job)
+                result = connection.recv()
+            except (EOFError, OSError) as e:
+                result = dict(job, success=False, cached=False, elapsed=0.0,
+                              stderr=f"worker {number} died: {e}")
+                process.join(timeout=1)
+                process, connection = self._start_worker()
+            finished = time.monotonic()
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.failed += 0 if result["success"] else 1
+                self.wait_times.append(started - enqueued)
+                self.run_times.append(finished - started)
+            reply.put(dict(result, queue_wait=started - enqueued))
+
+    def render(self, job):
+        """Queue a job and block until a worker has finished it"""
+        if self.version is not None:
+            job.setdefault("version", self.version)
+        job["service"] = False
+        reply = queue.Queue(maxsize=1)
+        self.jobs.put((job, time.monotonic(), reply))
+        return reply.get()
+
+    def status(self):
+        """Return queue depth, worker usage and latency statistics"""
+        def summary(values):
+            values = sorted(values)
+            if not values:
+                return {"mean": 0.0, "p50": 0.0, "p95": 0.0}
+            return {"mean": statistics.fmean(values), "p50": values[len(values) // 2],
+                    "p95": values[min(len(values) - 1, int(len(values) * 0.95))]}
+        with self.lock:
+            return {"workers": len(self.workers), "queue_depth": self.jobs.qsize(),
+                    "in_flight": self.in_flight, "completed": self.completed,
+                    "failed": self.failed, "uptime": time.time() - self.started,
+                    "openscad_version": self.version, "stub": self.stub,
+                    "queue_wait": summary(self.wait_times), "run_time": summary(self.run_times)}
+
+    def stop(self):
+        """Stop all workers after the queued jobs"""
+        for _ in self.workers:
+            self.jobs.put(None)
+
+def handle_client(service, connection, server):
+    """Answer newline-delimited JSON requests on one client connection"""
+    with connection, connection.makefile("rw") as stream:
+        for line in stream:
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "render":
+                    response = {"ok": True, "result": service.render(request["job"])}
+                elif op == "status":
+                    response = {"ok": True, "status": service.status()}
+                elif op == "stop":
+                    response = {"ok": True}
+                else:
+                    response = {"ok": False, "error": f"unknown op: {op}"}
+            except (ValueError, KeyError, TypeError) as e:
+                op, response = None, {"ok": False, "error": str(e)}
+            stream.write(json.dumps(response) + "\n")
+            stream.flush()
+            if op == "stop":
+                service.stop()
+                try:
+                    # Wake the accept() loop in serve()
+                    server.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                server.close()
+                return
+
+def serve(socket_path, workers, stub=False):
+    """Run the service in the foreground until a ``stop`` request arrives"""
+    socket_path = Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if ping(socket_path):
+            print(f"Error: A render service is already running on {socket_path}")
+            return 1
+        socket_path.unlink()
+
+    service = RenderService(workers, stub)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    server.listen(64)
+    print(f"Render service listening on {socket_path} with {workers} workers"
+          f"{' (stub)' if stub else ''}", flush=True)
+    try:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                break
+            threading.Thread(target=handle_client, args=(service, connection, server), daemon=True).start()
+    except KeyboardInterrupt:
+        service.stop()
+    finally:
+        server.close()
+        socket_path.unlink(missing_ok=True)
+    print("Render service stopped")
+    return 0
+
+def request(payload, socket_path=None, timeout=None):
+    """Send one request to the service and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(socket_path or get_socket_path()))
+        with client.makefile("rw") as stream:
+            stream.write(json.dumps(payload) + "\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+def ping(socket_path=None):
+    """Return True if a service answers on the socket"""
+    try:
+        return request({"op": "status"}, socket_path, timeout=2)["ok"]
+    except (OSError, ValueError):
+        return False
+
+def submit(job, socket_path=None):
+    """Render a job through the service; returns the result, or None if it is unreachable"""
+    try:
+        response = request({"op": "render", "job": job}, socket_path)
+    except (OSError, ValueError):
+        return None
+    return response.get("result") if response.get("ok") else None
+
+def print_status(status):
+    """Print service status"""
+    print("OpenSCAD Render Service")
+    print("=" * 50)
+    print(f"Workers: {status['workers']}  In flight: {status['in_flight']}  "
+          f"Queue depth: {status['queue_depth']}")
+    print(f"Completed: {status['completed']}  Failed: {status['failed']}  "
+          f"Uptime: {status['uptime']:.0f}s")
+    print(f"OpenSCAD: {status['openscad_version'] or ('stub' if status['stub'] else 'unknown')}")
+    for name in ("queue_wait", "run_time"):
+        stats = status[name]
+        print(f"{name.replace('_', ' ').capitalize()}: mean {stats['mean'] * 1000:.0f} ms, "
+              f"p50 {stats['p50'] * 1000:.0f} ms, p95 {stats['p95'] * 1000:.0f} ms")
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if not args or args[0] not in ("serve", "start", "stop", "status"):
+        print("Usage:")
+        print("  python3 render_service.py serve [--workers N] [--stub]   # Run in the foreground")
+        print("  python3 render_service.py start [--workers N] [--stub]   # Run in the background")
+        print("  python3 render_service.py status                         # Queue depth and latency")
+        print("  python3 render_service.py stop")
+        print()
+        print(f"Socket: {get_socket_path()} (override with {SOCKET_ENV})")
+        print("Submit work with: python3 render_preview.py <file.scad> --service")
+        sys.exit(1)
+
+    command = args.pop(0)
+    socket_path = get_socket_path()
+    workers = pop_option(args, "--workers", os.cpu_count() or 1, int)
+    stub = "--stub" in args
+
+    if command == "serve":
+        sys.exit(serve(socket_path, workers, stub))
+    elif command == "start":
+        if ping(socket_path):
+            print(f"Render service already running on {socket_path}")
+            return
+        log_file = socket_path.with_suffix(".log")
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(log_file, "a") as log:
+            subprocess.Popen([sys.executable, __file__, "serve", "--workers", str(workers)]
+                             + (["--stub"] if stub else []),
+                             stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        for _ in range(50):
+            if ping(socket_path):
+                print(f"✓ Render service started on {socket_path} (log: {log_file})")
+                return
+            time.sleep(0.1)
+        print(f"✗ Render service did not start, see {log_file}")
+        sys.exit(1)
+    elif command == "status":
+        try:
+            print_status(request({"op": "status"}, socket_path, timeout=5)["status"])
+        except OSError:
+            print(f"Render service is not running ({socket_path})")
+            sys.exit(1)
+    else:
+        try:
+            request({"op": "stop"}, socket_path, timeout=5)
+            print("✓ Render service stopped")
+        except OSError:
+            print(f"Render service is not running ({socket_path})")
+
+if __name__ == "__main__":
+    main()
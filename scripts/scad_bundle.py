@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Bundler
+Flatten a model and the library code it actually uses into one file
+
+The include <>/use <> tree of a model is resolved, every top-level
+statement is split out, and only the modules, functions and variables
+reachable from the model's own geometry are kept. The result is a single
+self-contained .scad in .openscad-cache/bundles/ whose header records a
+content hash. Bundles are keyed by the size and mtime of every source file,
+so an unchanged model reuses its bundle; bundles of earlier versions are
+evicted least recently used first once the directory outgrows its size cap.
+
+Models the bundler cannot flatten without changing their meaning raise
+BundleError; callers render the original file instead.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+import scad_deps
+from cli_utils import format_size, parse_size, pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+BUNDLE_DIR = WORKSPACE_DIR / ".openscad-cache" / "bundles"
+# Part of every bundle key; bump when the output format or rules change
+BUNDLER_VERSION = 2
+DEFAULT_MAX_SIZE = 64 * 1024 ** 2
+
+INCLUDE_RE = re.compile(r"(include|use)\s*<([^>\n]+)>\s*;?")
+DEFINITION_RE = re.compile(r"(module|function)\s+(\$?[A-Za-z_]\w*)\s*\(")
+ASSIGNMENT_RE = re.compile(r"(\$?[A-Za-z_]\w*)\s*=(?!=)")
+IDENTIFIER_RE = re.compile(r"\$?[A-Za-z_]\w*")
+# Names a statement binds itself: parameters with defaults, let/for
+# variables, local assignments (and named arguments, which is conservative)
+BINDING_RE = re.compile(r"(\$?[A-Za-z_]\w*)\s*=(?!=)")
+STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[()\[\]{};]')
+ELSE_RE = re.compile(r"\s*else\b")
+# Side effects that must survive even if nothing reads the variable
+EFFECT_RE = re.compile(r"\b(echo|assert)\s*\(")
+# File references resolve relative to the .scad file, which moves when bundled
+FILE_REFERENCE_RE = re.compile(r"\b(import|surface)\s*\(")
+HASH_PREFIX = "// Content hash: "
+
+class BundleError(Exception):
+    """Raised when a model cannot be flattened safely"""
+
+def statement_end(text, start):
+    """Return the end of the top-level statement starting at ``start``"""
+    depth = 0
+    for match in TOKEN_RE.finditer(text, start):
+        token = match.group(0)
+        if token in "([{":
+            depth += 1
+        elif token in ")]}":
+            depth -= 1
+            if depth == 0 and token == "}" and not ELSE_RE.match(text, match.end()):
+                return match.end()
+        elif token == ";" and depth == 0 and not ELSE_RE.match(text, match.end()):
+            return match.end()
+    return len(text)
+
+def split_statements(text):
+    """Split comment-free SCAD text into top-level statement dicts"""
+    statements = []
+    position = 0
+    while True:
+        while position < len(text) and (text[position].isspace() or text[position] == ";"):
+            position += 1
+        if position >= len(text):
+            return statements
+        match = INCLUDE_RE.match(text, position)
+        if match:
+            statements.append({"kind": match.group(1), "target": match.group(2).strip()})
+            position = match.end()
+            continue
+        end = statement_end(text, position)
+        chunk = text[position:end].strip()
+        position = end
+        definition = DEFINITION_RE.match(chunk)
+        assignment = ASSIGNMENT_RE.match(chunk)
+        if definition:
+            kind, name = definition.groups()
+        elif assignment:
+            kind, name = "assign", assignment.group(1)
+        else:
+            kind, name = "statement", None
+        code = STRING_RE.sub('""', chunk)
+        bound = set(BINDING_RE.findall(code))
+        if definition:
+            bound.update(parameter_names(code, definition.end()))
+        statements.append({"kind": kind, "name": name, "text": chunk,
+                           "refs": set(IDENTIFIER_RE.findall(code)), "bound": bound})
+
+def parameter_names(code, start):
+    """Return the parameter names of the list that opens just before ``start``"""
+    depth, segment, names = 0, [], set()
+    for char in code[start:]:
+        if depth == 0 and char in ",)":
+            match = IDENTIFIER_RE.match("".join(segment).strip())
+            if match:
+                names.add(match.group(0))
+            if char == ")":
+                break
+            segment = []
+            continue
+        depth += char in "([{"
+        depth -= char in ")]}"
+        segment.append(char)
+    return names
+
+class Scope:
+    """One file as seen by ``use``: its statements with includes inlined"""
+
+    def __init__(self, path):
+        self.path = path
+        self.statements = []
+        self.definitions = {}
+        self.uses = []
+
+def expand(path, scope, scopes, search_paths, stack=()):
+    """Append the statements of ``path`` (and, inline, its includes) to ``scope``"""
+    if path in stack:
+        raise BundleError(f"include cycle through {scad_deps.index_key(path)}")
+    text = scad_deps.strip_comments(path.read_text(errors="replace"))
+    statements = split_statements(text)
+    if len(scad_deps.DEPENDENCY_RE.findall(text)) != sum(s["kind"] in ("include", "use") for s in statements):
+        raise BundleError(f"{scad_deps.index_key(path)} has include/use below the top level")
+    for statement in statements:
+        if statement["kind"] in ("include", "use"):
+            resolved = scad_deps.resolve_dependency(statement["target"], path.parent, search_paths)
+            if resolved is None:
+                raise BundleError(f"cannot resolve <{statement['target']}> in {scad_deps.index_key(path)}")
+            if statement["kind"] == "include":
+                expand(resolved, scope, scopes, search_paths, stack + (path,))
+            else:
+                used = load_scope(resolved, scopes, search_paths)
+                if used not in scope.uses:
+                    scope.uses.append(used)
+            continue
+        statement["source"] = path
+        if statement["name"]:
+            scope.definitions.setdefault(statement["name"], []).append(len(scope.statements))
+        scope.statements.append(statement)
+
+def load_scope(path, scopes, search_paths):
+    """Return the (cached) scope of a file"""
+    if path not in scopes:
+        scopes[path] = Scope(path)
+        expand(path, scopes[path], scopes, search_paths)
+    return scopes[path]
+
+def resolve(scope, name):
+    """Return the ``(scope, index)`` statements a reference to ``name`` can mean.
+
+    A file's own modules, functions and variables come first; otherwise
+    modules and functions of the files it uses (not transitively).
+    """
+    if name in scope.definitions:
+        return [(scope, index) for index in scope.definitions[name]]
+    found = []
+    for used in scope.uses:
+        indexes = [i for i in used.definitions.get(name, []) if used.statements[i]["kind"] != "assign"]
+        if indexes:
+            found.append([(used, index) for index in indexes])
+    if len(found) > 1 and len({tuple(s.statements[i]["text"] for s, i in f) for f in found}) > 1:
+        raise BundleError(f"'{name}' is defined differently in several used files")
+    return found[0] if found else []
+
+def tree_shake(main):
+    """Return the kept ``(scope, index)`` pairs reachable from the model's geometry.
+
+    Also returns the names kept statements of used files reference but
+    cannot resolve, mapped to their file: OpenSCAD evaluates those as undef
+    (or the built-in), which flattening must not change.
+    """
+    pending = [(main, index) for index, statement in enumerate(main.statements)
+               if statement["kind"] == "statement"
+               or (statement["kind"] == "assign" and (statement["name"].startswith("$")
+                                                      or EFFECT_RE.search(statement["text"])))]
+    kept, unresolved = set(), {}
+    while pending:
+        item = pending.pop()
+        if item in kept:
+            continue
+        kept.add(item)
+        scope, index = item
+        statement = scope.statements[index]
+        for name in statement["refs"]:
+            found = resolve(scope, name)
+            if not found and scope is not main and not name.startswith("$") and name not in statement["bound"]:
+                unresolved.setdefault(name, scope)
+            pending.extend(found)
+    return kept, unresolved
+
+def flatten(scad_file, search_paths=None):
+    """Return ``(text, stats)`` for the flattened model"""
+    root = Path(scad_file).resolve()
+    search_paths = scad_deps.default_search_paths() if search_paths is None else search_paths
+    scopes = {}
+    main = load_scope(root, scopes, search_paths)
+    kept, unresolved = tree_shake(main)
+
+    # Used files come first; definitions are hoisted, so only variable order
+    # within one scope matters and it is preserved
+    ordered = [scope for scope in scopes.values() if scope is not main] + [main]
+    emitted, parts = {}, []
+    for scope in ordered:
+        indexes = sorted(index for kept_scope, index in kept if kept_scope is scope)
+        if scope is not main:
+            if not indexes:
+                continue
+            if any(s["kind"] == "assign" and s["name"].startswith("$") for s in scope.statements):
+                raise BundleError(f"{scad_deps.index_key(scope.path)} sets special variables at top level")
+        for index in indexes:
+            statement = scope.statements[index]
+            if FILE_REFERENCE_RE.search(statement["text"]):
+                raise BundleError(f"{scad_deps.index_key(statement['source'])} imports files by relative path")
+            name = statement["name"]
+            if name:
+                previous = emitted.setdefault((statement["kind"] == "assign", name), (scope, statement["text"]))
+                if previous[0] is not scope:
+                    if previous[1] != statement["text"]:
+                        raise BundleError(f"'{name}' is defined differently in "
+                                          f"{scad_deps.index_key(previous[0].path)} and {scad_deps.index_key(scope.path)}")
+                    continue
+            parts.append(statement["text"])
+
+    for (_, name), (scope, _) in emitted.items():
+        if name in unresolved and unresolved[name] is not scope:
+            raise BundleError(f"{scad_deps.index_key(unresolved[name].path)} references '{name}', which it does "
+                              f"not define but {scad_deps.index_key(scope.path)} does")
+
+    sources = sorted({s["source"] for scope in scopes.values() for s in scope.statements} | {root})
+    definitions = [(scope, i) for scope in scopes.values() for i, s in enumerate(scope.statements)
+                   if s["kind"] in ("module", "function")]
+    stats = {"sources": [scad_deps.index_key(path) for path in sources],
+             "source_bytes": sum(path.stat().st_size for path in sources),
+             "definitions": len(definitions),
+             "kept_definitions": sum(1 for item in definitions if item in kept)}
+    return "\n".join(parts) + "\n", stats
+
+def bundle_key(scad_file, search_paths=None):
+    """Return a key covering the model and every file reachable from it"""
+    root = Path(scad_file).resolve()
+    dependencies, missing = scad_deps.dependency_closure(root, search_paths)
+    if missing:
+        raise BundleError(f"cannot resolve {', '.join(f'<{m}>' for m in missing)}")
+    hasher = hashlib.sha256(f"bundler:{BUNDLER_VERSION}\n".encode())
+    for path in [root] + dependencies:
+        stat = path.stat()
+        hasher.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    return hasher.hexdigest()
+
+def read_header(bundle_file):
+    """Return the content hash recorded in a bundle's header, or None"""
+    with open(bundle_file) as handle:
+        for line in handle:
+            if line.startswith(HASH_PREFIX):
+                return line[len(HASH_PREFIX):].strip()
+            if not line.startswith("//"):
+                return None
+    return None
+
+def bundle_model(scad_file, bundle_dir=BUNDLE_DIR, search_paths=None):
+    """Return ``{"path", "hash", "cached", ...}`` for the model's bundle, building it if needed"""
+    scad_path = Path(scad_file).resolve()
+    bundle_file = Path(bundle_dir) / f"{scad_path.stem}-{bundle_key(scad_path, search_paths)[:16]}.scad"
+    content_hash = read_header(bundle_file) if bundle_file.exists() else None
+    if content_hash:
+        # The modification time doubles as the last use for eviction
+        os.utime(bundle_file)
+        return {"path": str(bundle_file), "hash": content_hash, "cached": True}
+
+    body, stats = flatten(scad_path, search_paths)
+    content_hash = hashlib.sha256(body.encode()).hexdigest()
+    header = [f"// Bundle of {scad_deps.index_key(scad_path)} generated by scripts/scad_bundle.py; do not edit",
+              f"// Sources: {len(stats['sources'])} files, "
+              f"{stats['kept_definitions']} of {stats['definitions']} definitions kept",
+              f"{HASH_PREFIX}{content_hash}", ""]
+    bundle_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = bundle_file.with_name(f"{bundle_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text("\n".join(header) + body)
+    os.replace(tmp_file, bundle_file)
+    evict(bundle_dir, parse_size(os.environ.get("OPENSCAD_BUNDLE_CACHE_SIZE", str(DEFAULT_MAX_SIZE))))
+    return dict(stats, path=str(bundle_file), hash=content_hash, cached=False,
+                bundle_bytes=bundle_file.stat().st_size)
+
+def evict(bundle_dir, max_size):
+    """Remove least recently used bundles until the directory fits ``max_size``; return the number removed"""
+    bundles = []
+    for bundle_file in Path(bundle_dir).glob("*.scad"):
+        try:
+            stat = bundle_file.stat()
+        except FileNotFoundError:
+            continue
+        bundles.append((stat.st_mtime, stat.st_size, bundle_file))
+    total = sum(size for _, size, _ in bundles)
+    removed = 0
+    for _, size, bundle_file in sorted(bundles):
+        if total <= max_size:
+            break
+        bundle_file.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+def clean(bundle_dir=BUNDLE_DIR):
+    """Remove all bundles; return the number removed"""
+    removed = 0
+    for bundle_file in Path(bundle_dir).glob("*.scad"):
+        bundle_file.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if not args or args[0] not in ("bundle", "prune", "clean"):
+        print("Usage:")
+        print("  python3 scad_bundle.py bundle <model.scad>... [--output FILE] [--json]")
+        print("                                        # Flatten models into .openscad-cache/bundles/")
+        print("  python3 scad_bundle.py prune --max-size 16M")
+        print("                                        # Evict least recently used bundles")
+        print("  python3 scad_bundle.py clean          # Remove all bundles")
+        print()
+        print("Render with a bundle: python3 render_preview.py --bundle <model.scad>")
+        sys.exit(1)
+
+    if args[0] == "clean":
+        print(f"✓ Removed {clean()} bundles")
+        return
+    if args[0] == "prune":
+        try:
+            max_size = pop_option(args, "--max-size", None, parse_size)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(2)
+        if max_size is None:
+            print("Please specify --max-size")
+            sys.exit(1)
+        print(f"✓ Removed {evict(BUNDLE_DIR, max_size)} bundles (limit {format_size(max_size)})")
+        return
+
+    args = args[1:]
+    output = pop_option(args, "--output")
+    as_json = "--json" in args
+    files = [a for a in args if not a.startswith("--")]
+    if not files or (output and len(files) > 1):
+        print("Please specify model files (--output takes a single model)")
+        sys.exit(1)
+
+    results, failed = [], False
+    for scad_file in files:
+        try:
+            result = bundle_model(scad_file)
+            if output:
+                Path(output).write_text(Path(result["path"]).read_text())
+                result["path"] = output
+        except (BundleError, OSError) as e:
+            result = {"error": str(e)}
+            failed = True
+        result["model"] = scad_file
+        results.append(result)
+        if as_json:
+            continue
+        if "error" in result:
+            print(f"✗ {scad_file}: {result['error']}")
+        elif result["cached"]:
+            print(f"✓ {scad_file} -> {result['path']} (up to date, {result['hash'][:12]})")
+        else:
+            print(f"✓ {scad_file} -> {result['path']} ({result['hash'][:12]})")
+            print(f"  {len(result['sources'])} source files, {result['kept_definitions']} of "
+                  f"{result['definitions']} definitions kept, "
+                  f"{result['source_bytes']:,} -> {result['bundle_bytes']:,} bytes")
+    if as_json:
+        print(json.dumps(results, indent=2))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Dependency Resolver
+Find the files a .scad model pulls in through include <> and use <>
+
+The dependency index persists the include/use graph of the workspace with
+file hashes in .openscad-cache/deps.json. Updates re-parse only files whose
+size or mtime changed, and the graph answers "which models are affected by
+these changed files" for selective re-rendering.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+INDEX_FILE = WORKSPACE_DIR / ".openscad-cache" / "deps.json"
+INDEX_VERSION = 1
+
+# Directories scanned by the index, and those holding renderable models
+SCAN_DIRS = ["projects", "examples", "utils", "libraries"]
+MODEL_DIRS = ["projects", "examples"]
+
+# include <file> / use <file> statements (comments are stripped first)
+DEPENDENCY_RE = re.compile(r"\b(include|use)\s*<([^>\n]+)>")
+# String literals (possibly unterminated) and the two comment forms
+COMMENT_RE = re.compile(r'"(?:[^"\\]|\\.)*(?:"|\\?\Z)|//[^\n]*|/\*.*?(?:\*/|\Z)', re.DOTALL)
+
+def strip_comments(text):
+    """Remove // and /* */ comments while leaving string literals intact"""
+    return COMMENT_RE.sub(_replace_comment, text)
+
+def _replace_comment(match):
+    """Keep strings; drop comments, keeping line numbers stable for callers that report them"""
+    token = match.group(0)
+    if token.startswith('"'):
+        return token
+    return "\n" * token.count("\n") if token.startswith("/*") else ""
+
+def default_search_paths():
+    """Return the library search path: OPENSCADPATH entries, then libraries/"""
+    paths = [Path(p) for p in os.environ.get("OPENSCADPATH", "").split(os.pathsep) if p]
+    return paths + [WORKSPACE_DIR / "libraries"]
+
+def parse_dependencies(text):
+    """Return ``(kind, target)`` pairs for every include/use statement in ``text``"""
+    return DEPENDENCY_RE.findall(strip_comments(text))
+
+def resolve_dependency(target, from_dir, search_paths=None):
+    """Resolve an include/use target the way OpenSCAD does, or return None.
+
+    Targets are looked up relative to the including file first, then in each
+    library search path.
+    """
+    for base in [Path(from_dir)] + list(search_paths if search_paths is not None else default_search_paths()):
+        candidate = base / target.strip()
+        if candidate.is_file():
+            return candidate.resolve()
+    return None
+
+def dependency_closure(scad_file, search_paths=None):
+    """Return ``(dependencies, missing)`` for everything reachable from ``scad_file``.
+
+    ``dependencies`` lists resolved paths in breadth-first order (excluding
+    ``scad_file`` itself); ``missing`` lists unresolved targets.
+    """
+    root = Path(scad_file).resolve()
+    search_paths = default_search_paths() if search_paths is None else search_paths
+    seen = {root}
+    queue = [root]
+    dependencies, missing = [], []
+    while queue:
+        current = queue.pop(0)
+        try:
+            text = current.read_text(errors="replace")
+        except OSError:
+            continue
+        for kind, target in parse_dependencies(text):
+            resolved = resolve_dependency(target, current.parent, search_paths)
+            if resolved is None:
+                missing.append(target)
+            elif resolved not in seen:
+                seen.add(resolved)
+                dependencies.append(resolved)
+                queue.append(resolved)
+    return dependencies, missing
+
+def index_key(path):
+    """Return the index key for a path: workspace-relative when possible"""
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(WORKSPACE_DIR).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+def key_path(key):
+    """Return the absolute path for an index key"""
+    return WORKSPACE_DIR / key
+
+def load_index(index_file=INDEX_FILE):
+    """Load the persisted dependency index"""
+    try:
+        index = json.loads(Path(index_file).read_text())
+    except (OSError, ValueError):
+        index = {}
+    if index.get("version") != INDEX_VERSION:
+        index = {"version": INDEX_VERSION, "files": {}}
+    return index
+
+def save_index(index, index_file=INDEX_FILE):
+    """Atomically write the dependency index"""
+    index_file = Path(index_file)
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(index, sort_keys=True))
+    os.replace(tmp_file, index_file)
+
+def scan_files(scan_dirs=SCAN_DIRS):
+    """Yield ``(path, stat)`` for every .scad file below the scanned directories"""
+    stack = [WORKSPACE_DIR / d for d in scan_dirs]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != ".git":
+                    stack.append(entry.path)
+            elif entry.name.endswith(".scad"):
+                yield Path(entry.path), entry.stat()
+
+def index_file_entry(path, stat, search_paths):
+    """Parse one file into an index entry"""
+    data = path.read_bytes()
+    deps, missing = [], []
+    for kind, target in parse_dependencies(data.decode("utf-8", errors="replace")):
+        resolved = resolve_dependency(target, path.parent, search_paths)
+        if resolved is None:
+            missing.append(target)
+        else:
+            deps.append({"kind": kind, "path": index_key(resolved)})
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+            "sha256": hashlib.sha256(data).hexdigest(), "deps": deps, "missing": missing}
+
+def update_index(index, scan_dirs=SCAN_DIRS, search_paths=None):
+    """Bring ``index`` up to date with the workspace.
+
+    Only files whose size or mtime changed are re-parsed; files with
+    unresolved targets are re-parsed too, in case a library was installed
+    since. Returns ``(scanned, reparsed, removed)`` counts.
+    """
+    search_paths = default_search_paths() if search_paths is None else search_paths
+    files = index["files"]
+    seen = set()
+    scanned = reparsed = 0
+    for path, stat in scan_files(scan_dirs):
+        key = index_key(path)
+        seen.add(key)
+        scanned += 1
+        entry = files.get(key)
+        if (entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+                and not entry["missing"]):
+            continue
+        try:
+            files[key] = index_file_entry(path, stat, search_paths)
+        except OSError:
+            continue
+        reparsed += 1
+
+    removed = [key for key in files if key not in seen]
+    for key in removed:
+        del files[key]
+    index["updated"] = time.time()
+    return scanned, reparsed, len(removed)
+
+def reverse_graph(index):
+    """Return a mapping of file key -> keys of the files that include/use it"""
+    dependents = {}
+    for key, entry in index["files"].items():
+        for dep in entry["deps"]:
+            dependents.setdefault(dep["path"], set()).add(key)
+    return dependents
+
+def affected_files(index, changed, models_only=True):
+    """Return the files affected by a change to any of ``changed`` (index keys).
+
+    Includes the changed files themselves. With ``models_only`` the result is
+    limited to renderable models below projects/ and examples/.
+    """
+    dependents = reverse_graph(index)
+    affected = set()
+    queue = list(changed)
+    while queue:
+        key = queue.pop()
+        if key in affected:
+            continue
+        affected.add(key)
+        queue.extend(dependents.get(key, ()))
+    if models_only:
+        affected = {k for k in affected
+                    if k.endswith(".scad") and k.split("/", 1)[0] in MODEL_DIRS and k in index["files"]}
+    return sorted(affected)
+
+def indexed_closure(index, key):
+    """Return the include/use closure of ``key`` using the index"""
+    seen, queue, closure = {key}, [key], []
+    while queue:
+        entry = index["files"].get(queue.pop(0))
+        for dep in entry["deps"] if entry else ():
+            if dep["path"] not in seen:
+                seen.add(dep["path"])
+                closure.append(dep["path"])
+                queue.append(dep["path"])
+    return closure
+
+def load_updated_index():
+    """Load, incrementally update and save the index; return it with timing stats"""
+    start = time.monotonic()
+    index = load_index()
+    scanned, reparsed, removed = update_index(index)
+    save_index(index)
+    return index, scanned, reparsed, removed, time.monotonic() - start
+
+def read_paths(args):
+    """Return paths from ``args``, reading them from stdin when given ``-``"""
+    if args == ["-"]:
+        return [line.strip() for line in sys.stdin if line.strip()]
+    return args
+
+def main():
+    """Main function"""
+    commands = ("index", "affected", "deps")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("Usage:")
+        print("  python3 scad_deps.py index                    # Build/refresh the dependency index")
+        print("  python3 scad_deps.py affected <file>... [--all]")
+        print("                                                # Models affected by changed files")
+        print("  python3 scad_deps.py affected -               # ...reading paths from stdin")
+        print("  python3 scad_deps.py deps <file.scad>         # List the include/use closure of a file")
+        print()
+        print("Example: git diff --name-only HEAD~1 | python3 scripts/scad_deps.py affected -")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    args = sys.argv[2:]
+    index, scanned, reparsed, removed, elapsed = load_updated_index()
+
+    if command == "index":
+        print(f"Indexed {scanned} files in {elapsed * 1000:.0f} ms "
+              f"({reparsed} parsed, {removed} removed) -> {INDEX_FILE}")
+    elif command == "affected":
+        models_only = "--all" not in args
+        paths = read_paths([a for a in args if a != "--all"])
+        changed = [index_key(WORKSPACE_DIR / p if not Path(p).is_absolute() and not Path(p).exists() else p)
+                   for p in paths]
+        for key in affected_files(index, changed, models_only):
+            print(key)
+    else:
+        if not args:
+            print("Please specify a .scad file")
+            sys.exit(1)
+        key = index_key(args[0])
+        if key in index["files"]:
+            closure = indexed_closure(index, key)
+            missing = [t for k in [key] + closure for t in index["files"].get(k, {}).get("missing", [])]
+        else:
+            dependencies, missing = dependency_closure(args[0])
+            closure = [index_key(d) for d in dependencies]
+        for dep in closure:
+            print(dep)
+        for target in missing:
+            print(f"missing: {target}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
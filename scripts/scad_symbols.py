@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD Symbol Index
+Find where library modules and functions are defined
+
+Top-level ``module`` and ``function`` definitions with their parameter
+lists are parsed from libraries/ and utils/ into a SQLite index at
+.openscad-cache/symbols.db. Updates re-parse only files whose size or
+mtime changed (library syncs refresh it automatically), and lookups and
+prefix completion are single indexed queries. The index also generates
+editor snippets and highlighting rules for the library symbols.
+"""
+
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import scad_deps
+from cli_utils import pop_option
+
+WORKSPACE_DIR = Path(__file__).resolve().parent.parent
+DB_FILE = WORKSPACE_DIR / ".openscad-cache" / "symbols.db"
+SCHEMA_VERSION = 1
+SCAN_DIRS = ["libraries", "utils"]
+SNIPPETS_FILE = WORKSPACE_DIR / ".vscode" / "snippets" / "libraries.json"
+GRAMMAR_FILE = WORKSPACE_DIR / ".vscode" / "openscad.json"
+
+# Strings, braces and definition heads, scanned in order to track nesting
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}]|\b(module|function)\s+([A-Za-z_$][\w$]*)\s*\(')
+DOC_PREFIX_RE = re.compile(r"^(Module|Function|Function&Module|Usage|Topics|See Also)\s*:", re.IGNORECASE)
+MAX_DOC_LENGTH = 160
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, library TEXT, mtime_ns INTEGER, size INTEGER
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    name TEXT NOT NULL, kind TEXT NOT NULL, params TEXT, file TEXT NOT NULL,
+    line INTEGER, library TEXT, doc TEXT
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file);
+"""
+
+def connect(db_file=DB_FILE):
+    """Open the index, creating (or recreating on a schema change) as needed"""
+    db_file = Path(db_file)
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(db_file)
+    connection.executescript(SCHEMA)
+    row = connection.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+    if row is None or int(row[0]) != SCHEMA_VERSION:
+        connection.executescript("DELETE FROM files; DELETE FROM symbols;")
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (str(SCHEMA_VERSION),))
+        connection.commit()
+    return connection
+
+def library_of(key):
+    """Return the library a file belongs to (``utils`` for workspace utilities)"""
+    parts = key.split("/")
+    return parts[1] if parts[0] == "libraries" and len(parts) > 2 else parts[0]
+
+def read_parameters(text, start):
+    """Return the text up to the parenthesis closing the one before ``start``"""
+    depth, i = 1, start
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            i += 1
+            while i < len(text) and text[i] != '"':
+                i += 2 if text[i] == "\\" else 1
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+            if depth == 0:
+                return " ".join(text[start:i].split())
+        i += 1
+    return " ".join(text[start:].split())
+
+def doc_comment(lines, line_number):
+    """Summarize the ``//`` comment block directly above a definition"""
+    block = []
+    index = line_number - 2
+    while index >= 0 and lines[index].lstrip().startswith("//"):
+        block.insert(0, lines[index].lstrip()[2:].strip())
+        index -= 1
+    for line in block:
+        if line.lower().startswith("synopsis:"):
+            return line.split(":", 1)[1].strip()[:MAX_DOC_LENGTH]
+    for line in block:
+        if line and not DOC_PREFIX_RE.match(line) and not set(line) <= set("=-/*"):
+            return line[:MAX_DOC_LENGTH]
+    return ""
+
+def parse_symbols(text):
+    """Return ``(name, kind, params, line, doc)`` for every top-level definition in ``text``"""
+    stripped = scad_deps.strip_comments(text)
+    lines = text.splitlines()
+    symbols = []
+    depth, line, position = 0, 1, 0
+    for match in TOKEN_RE.finditer(stripped):
+        token = match.group(0)
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth = max(0, depth - 1)
+        elif match.group(1) and depth == 0:
+            line += stripped.count("\n", position, match.start())
+            position = match.start()
+            params = read_parameters(stripped, match.end())
+            symbols.append((match.group(2), match.group(1), params, line, doc_comment(lines, line)))
+    return symbols
+
+def update_index(connection, scan_dirs=SCAN_DIRS):
+    """Re-parse changed files; return ``(scanned, parsed, removed)`` counts"""
+    known = {path: (mtime, size) for path, mtime, size in
+             connection.execute("SELECT path, mtime_ns, size FROM files")}
+    seen = set()
+    scanned = parsed = 0
+    with connection:
+        for path, stat in scad_deps.scan_files(scan_dirs):
+            key = scad_deps.index_key(path)
+            seen.add(key)
+            scanned += 1
+            if known.get(key) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                text = path.read_text(errors="replace")
+            except OSError:
+                continue
+            library = library_of(key)
+            connection.execute("DELETE FROM symbols WHERE file = ?", (key,))
+            connection.executemany(
+                "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(name, kind, params, key, line, library, doc)
+                 for name, kind, params, line, doc in parse_symbols(text)])
+            connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                               (key, library, stat.st_mtime_ns, stat.st_size))
+            parsed += 1
+        removed = [key for key in known if key not in seen]
+        for key in removed:
+            connection.execute("DELETE FROM symbols WHERE file = ?", (key,))
+            connection.execute("DELETE FROM files WHERE path = ?", (key,))
+    return scanned, parsed, len(removed)
+
+def refresh():
+    """Update the index and return a summary line (used after library syncs)"""
+    start = time.monotonic()
+    try:
+        with connect() as connection:
+            scanned, parsed, removed = update_index(connection)
+        connection.close()
+    except sqlite3.Error as e:
+        return f"Symbol index not updated: {e}"
+    return (f"Symbol index: {scanned} files, {parsed} parsed, {removed} removed "
+            f"in {(time.monotonic() - start) * 1000:.0f} ms")
+
+def lookup(connection, name, kind=None):
+    """Return definitions named exactly ``name``"""
+    query = "SELECT name, kind, params, file, line, library, doc FROM symbols WHERE name = ?"
+    args = [name]
+    if kind:
+        query += " AND kind = ?"
+        args.append(kind)
+    return connection.execute(query + " ORDER BY library, file", args).fetchall()
+
+def complete(connection, prefix, limit=20, kind=None):
+    """Return definitions whose name starts with ``prefix`` (an index range scan)"""
+    query = ("SELECT name, kind, params, file, line, library, doc FROM symbols "
+             "WHERE name >= ? AND name < ?")
+    args = [prefix, prefix + "\U0010ffff"]
+    if kind:
+        query += " AND kind = ?"
+        args.append(kind)
+    return connection.execute(query + " ORDER BY name, library LIMIT ?", args + [limit]).fetchall()
+
+def split_parameters(params):
+    """Split a parameter list at top-level commas"""
+    parts, depth, current, in_string = [], 0, [], False
+    for char in params:
+        if char == '"':
+            in_string = not in_string
+        elif not in_string and char in "([{":
+            depth += 1
+        elif not in_string and char in ")]}":
+            depth -= 1
+        if char == "," and depth == 0 and not in_string:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+def snippet_body(name, kind, params):
+    """Build a snippet body with a tab stop per parameter"""
+    stops = []
+    for number, param in enumerate(split_parameters(params), 1):
+        param_name, has_default, default = param.partition("=")
+        param_name = param_name.strip().replace("$", "\\$")
+        if has_default:
+            default = default.strip().replace("$", "\\$").replace("}", "\\}")
+            stops.append(f"{param_name}=${{{number}:{default}}}")
+        else:
+            stops.append(f"${{{number}:{param_name}}}")
+    call = name.replace("$", "\\$") + f"({', '.join(stops)})"
+    return [call + ";"] if kind == "module" else [call]
+
+def export_snippets(connection, output=SNIPPETS_FILE):
+    """Write editor snippets for every library symbol; return the count"""
+    snippets = {}
+    for name, kind, params, file, line, library, doc in connection.execute(
+            "SELECT name, kind, params, file, line, library, doc FROM symbols ORDER BY library, name, file"):
+        key = f"{library}: {name}"
+        if key in snippets or name.startswith("_"):
+            continue
+        snippets[key] = {"prefix": name, "body": snippet_body(name, kind, params),
+                         "description": doc or f"{kind} {name}({params}) from {file}:{line}"}
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(snippets, indent=2) + "\n")
+    return len(snippets)
+
+def export_grammar(connection, grammar_file=GRAMMAR_FILE):
+    """Add library module/function highlighting rules to the TextMate grammar"""
+    grammar = json.loads(Path(grammar_file).read_text())
+    for kind, scope in (("module", "entity.name.function.library-module.openscad"),
+                        ("function", "entity.name.function.library-function.openscad")):
+        names = sorted({name for (name,) in connection.execute(
+            "SELECT DISTINCT name FROM symbols WHERE kind = ? AND name NOT LIKE '\\_%' ESCAPE '\\'", (kind,))})
+        rule = f"library-{kind}s"
+        grammar["repository"][rule] = {"patterns": [{
+            "name": scope,
+            "match": "(?<![\\w$])(" + "|".join(re.escape(name) for name in names) + ")(?=\\s*\\()",
+        }]} if names else {"patterns": []}
+        if {"include": f"#{rule}"} not in grammar["patterns"]:
+            grammar["patterns"].append({"include": f"#{rule}"})
+    Path(grammar_file).write_text(json.dumps(grammar, indent=2) + "\n")
+
+def print_symbols(rows, as_json=False):
+    """Print lookup results"""
+    if as_json:
+        keys = ("name", "kind", "params", "file", "line", "library", "doc")
+        print(json.dumps([dict(zip(keys, row)) for row in rows], indent=2))
+        return
+    for name, kind, params, file, line, library, doc in rows:
+        print(f"{kind:<8} {name}({params})")
+        print(f"         {file}:{line}" + (f"  — {doc}" if doc else ""))
+
+def main():
+    """Main function"""
+    commands = ("index", "find", "complete", "stats", "export")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("Usage:")
+        print("  python3 scad_symbols.py index                         # Build/refresh the symbol index")
+        print("  python3 scad_symbols.py find <name> [--json]          # Where is a module/function defined")
+        print("  python3 scad_symbols.py complete <prefix> [--limit N] [--json]")
+        print("  python3 scad_symbols.py stats                         # Symbols per library")
+        print("  python3 scad_symbols.py export                        # Generate .vscode snippets and highlighting")
+        print()
+        print("Add --module or --function to find/complete to filter by kind")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    args = sys.argv[2:]
+    as_json = "--json" in args
+    kind = "module" if "--module" in args else "function" if "--function" in args else None
+    limit = pop_option(args, "--limit", 20, int)
+    args = [a for a in args if not a.startswith("--")]
+
+    start = time.monotonic()
+    connection = connect()
+    scanned, parsed, removed = update_index(connection)
+    if command == "index":
+        print(f"Indexed {scanned} files in {(time.monotonic() - start) * 1000:.0f} ms "
+              f"({parsed} parsed, {removed} removed) -> {DB_FILE}")
+    elif command in ("find", "complete"):
+        if not args:
+            print(f"Please specify a {'name' if command == 'find' else 'prefix'}")
+            sys.exit(1)
+        rows = lookup(connection, args[0], kind) if command == "find" else complete(connection, args[0], limit, kind)
+        print_symbols(rows, as_json)
+        if not rows:
+            sys.exit(1)
+    elif command == "stats":
+        print("OpenSCAD Symbol Index")
+        print("=" * 50)
+        for library, modules, functions, files in connection.execute(
+                "SELECT library, SUM(kind = 'module'), SUM(kind = 'function'), COUNT(DISTINCT file) "
+                "FROM symbols GROUP BY library ORDER BY library"):
+            print(f"  {library:<24} {modules:>6} modules {functions:>6} functions in {files} files")
+    else:
+        count = export_snippets(connection)
+        export_grammar(connection)
+        print(f"✓ Wrote {count} snippets to {SNIPPETS_FILE}")
+        print(f"✓ Updated library highlighting in {GRAMMAR_FILE}")
+    connection.close()
+
+if __name__ == "__main__":
+    main()
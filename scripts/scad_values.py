@@ -0,0 +1,39 @@
+"""
+OpenSCAD Values
+Format Python values as OpenSCAD literals for -D overrides and templates
+
+Kept free of other workspace imports so project scaffolding can use it
+without loading the render stack.
+"""
+
+import json
+import math
+import re
+
+# Non-numeric values that OpenSCAD should see as literals rather than strings
+LITERAL_RE = re.compile(r"^(true|false|undef|\[.*\])$")
+
+def format_value(value):
+    """Format a parameter value as an OpenSCAD expression"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return repr(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"OpenSCAD has no literal for {value}")
+        return repr(value)
+    if isinstance(value, list):
+        return "[" + ", ".join(format_value(v) for v in value) + "]"
+    text = str(value).strip()
+    if LITERAL_RE.match(text):
+        return text
+    # Numbers in any spelling Python accepts (.5, 1., +2, 1e3), normalized
+    try:
+        number = int(text)
+    except ValueError:
+        try:
+            number = float(text)
+        except ValueError:
+            return json.dumps(text)
+    return format_value(number)
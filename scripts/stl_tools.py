@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+OpenSCAD STL Tools
+Post-process rendered STL files: binary conversion, mesh checks, compression
+
+STL files are read through mmap and processed in fixed-size chunks of
+triangles, so memory stays bounded for ASCII input and binary input is
+never copied. numpy is used when it is installed; otherwise a pure-Python
+path produces the same results, only slower, except that the watertightness
+check is skipped: pairing every edge needs a dict entry per vertex and edge,
+which does not stay bounded for large meshes.
+
+The geometry fingerprint identifies a mesh independently of triangle order,
+the starting vertex of each triangle, ASCII/binary encoding and float noise
+below FINGERPRINT_QUANTUM, so re-renders that produce the same geometry can
+be told apart from real changes.
+"""
+
+import hashlib
+import gzip
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from cli_utils import pop_option
+
+HEADER_SIZE = 80
+RECORD_SIZE = 50
+CHUNK_TRIANGLES = 1 << 18
+RECORD = struct.Struct("<12fH")
+COMPRESSION_FORMATS = {"gzip": ".gz", "zstd": ".zst"}
+
+# Coordinates are snapped to this grid (mm) before fingerprinting
+FINGERPRINT_QUANTUM = 1e-5
+# Sidecar written next to each rendered STL: part.stl -> part.mesh.json
+SIDECAR_SUFFIX = ".mesh.json"
+MASK64 = (1 << 64) - 1
+MIX_SEEDS = (0x9E3779B97F4A7C15, 0xD6E8FEB86659FD93)
+
+# "facet normal nx ny nz" and "vertex x y z" lines, in file order
+ASCII_VALUES_RE = re.compile(rb"(?:facet\s+normal|vertex)\s+(\S+)\s+(\S+)\s+(\S+)")
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+
+def is_binary(data):
+    """Return True if ``data`` (the file contents) is a binary STL.
+
+    Binary files may also start with "solid", so the size implied by the
+    triangle count is what decides.
+    """
+    if len(data) < HEADER_SIZE + 4:
+        return False
+    count = struct.unpack_from("<I", data, HEADER_SIZE)[0]
+    return len(data) == HEADER_SIZE + 4 + count * RECORD_SIZE
+
+def binary_chunks(data):
+    """Yield ``(normals, vertices)`` chunks from binary STL data"""
+    count = struct.unpack_from("<I", data, HEADER_SIZE)[0]
+    for start in range(0, count, CHUNK_TRIANGLES):
+        size = min(CHUNK_TRIANGLES, count - start)
+        offset = HEADER_SIZE + 4 + start * RECORD_SIZE
+        if np is not None:
+            records = np.frombuffer(data, dtype=RECORD_DTYPE, count=size, offset=offset)
+            chunk = records["normal"].copy(), records["vertices"].copy()
+            # Do not hold a view of the mmap across the yield
+            del records
+            yield chunk
+        else:
+            normals, vertices = [], []
+            for values in RECORD.iter_unpack(data[offset:offset + size * RECORD_SIZE]):
+                normals.append(values[0:3])
+                vertices.append((values[3:6], values[6:9], values[9:12]))
+            yield normals, vertices
+
+def ascii_chunks(data):
+    """Yield ``(normals, vertices)`` chunks from ASCII STL data"""
+    values = []
+    for match in ASCII_VALUES_RE.finditer(data):
+        values.extend(match.groups())
+        if len(values) == CHUNK_TRIANGLES * 12:
+            yield ascii_chunk(values)
+            values = []
+    if values:
+        yield ascii_chunk(values[:len(values) - len(values) % 12])
+
+def ascii_chunk(values):
+    """Convert the text values of whole facets into a ``(normals, vertices)`` chunk"""
+    if np is not None:
+        facets = np.array(values, dtype=np.float64).astype(np.float32).reshape(-1, 4, 3)
+        return facets[:, 0], facets[:, 1:]
+    # Round through float32 so both paths see identical coordinates
+    floats = struct.unpack(f"<{len(values)}f", struct.pack(f"<{len(values)}f", *map(float, values)))
+    normals, vertices = [], []
+    for i in range(0, len(floats), 12):
+        normals.append(floats[i:i + 3])
+        vertices.append((floats[i + 3:i + 6], floats[i + 6:i + 9], floats[i + 9:i + 12]))
+    return normals, vertices
+
+def mix64(value):
+    """splitmix64 finalizer on Python ints (matches :func:`mix64_array`)"""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+def mix64_array(values):
+    """splitmix64 finalizer on a uint64 array (wrapping arithmetic)"""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def triangle_hash(triangle):
+    """Hash one triangle of quantized vertices, invariant under rotation of its vertices.
+
+    The hash sums the hashes of the three directed edges, so the winding
+    (and with it the facing) still matters.
+    """
+    vertex_hashes = []
+    for point in triangle:
+        value = MIX_SEEDS[0]
+        for coordinate in point:
+            value = mix64(value ^ (coordinate & MASK64))
+        vertex_hashes.append(value)
+    edges = 0
+    for a, b in ((0, 1), (1, 2), (2, 0)):
+        edges += mix64((vertex_hashes[a] * MIX_SEEDS[1] + vertex_hashes[b]) & MASK64)
+    return mix64(edges & MASK64)
+
+def triangle_hash_array(vertices):
+    """Vectorized :func:`triangle_hash` for an ``(n, 3, 3)`` array of float coordinates"""
+    quantized = np.rint(vertices.astype(np.float64) / FINGERPRINT_QUANTUM).astype(np.int64).view(np.uint64)
+    vertex_hashes = np.full(quantized.shape[:2], MIX_SEEDS[0], dtype=np.uint64)
+    for axis in range(3):
+        vertex_hashes = mix64_array(vertex_hashes ^ quantized[:, :, axis])
+    edges = np.zeros(len(vertices), dtype=np.uint64)
+    for a, b in ((0, 1), (1, 2), (2, 0)):
+        edges += mix64_array(vertex_hashes[:, a] * np.uint64(MIX_SEEDS[1]) + vertex_hashes[:, b])
+    return mix64_array(edges)
+
+class MeshStats:
+    """Accumulate triangle count, bounds, area, volume and edge pairing chunk by chunk"""
+
+    def __init__(self):
+        self.triangles = 0
+        self.minimum = [float("inf")] * 3
+        self.maximum = [float("-inf")] * 3
+        self.area = 0.0
+        self.volume = 0.0
+        self._vertex_chunks = []
+        # Order-independent multiset hash: two sums of per-triangle hashes
+        self._hash_sums = [0, 0]
+
+    def add(self, vertices):
+        """Add a chunk of triangles"""
+        if np is not None:
+            self._add_array(vertices)
+        else:
+            for triangle in vertices:
+                self._add_triangle(triangle)
+
+    def _add_array(self, vertices):
+        if not len(vertices):
+            return
+        self.triangles += len(vertices)
+        points = vertices.reshape(-1, 3)
+        self.minimum = np.minimum(self.minimum, points.min(axis=0)).tolist()
+        self.maximum = np.maximum(self.maximum, points.max(axis=0)).tolist()
+        v0, v1, v2 = (vertices[:, i].astype(np.float64) for i in range(3))
+        self.area += float(np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1).sum()) / 2
+        self.volume += float(np.einsum("ij,ij->i", v0, np.cross(v1, v2)).sum()) / 6
+        # Compare coordinates bitwise; adding 0.0 turns -0.0 into 0.0 first
+        self._vertex_chunks.append((vertices + np.float32(0)).view(np.uint32).reshape(-1, 3))
+        hashes = triangle_hash_array(vertices)
+        with np.errstate(over="ignore"):
+            self._hash_sums[0] = (self._hash_sums[0] + int(hashes.sum(dtype=np.uint64))) & MASK64
+            self._hash_sums[1] = (self._hash_sums[1]
+                                  + int(mix64_array(hashes ^ np.uint64(MIX_SEEDS[1])).sum(dtype=np.uint64))) & MASK64
+
+    def _add_triangle(self, triangle):
+        self.triangles += 1
+        for point in triangle:
+            for axis in range(3):
+                self.minimum[axis] = min(self.minimum[axis], point[axis])
+                self.maximum[axis] = max(self.maximum[axis], point[axis])
+        (ax, ay, az), (bx, by, bz), (cx, cy, cz) = triangle
+        ux, uy, uz = bx - ax, by - ay, bz - az
+        vx, vy, vz = cx - ax, cy - ay, cz - az
+        nx, ny, nz = uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+        self.area += (nx * nx + ny * ny + nz * nz) ** 0.5 / 2
+        self.volume += (ax * (by * cz - bz * cy) + ay * (bz * cx - bx * cz) + az * (bx * cy - by * cx)) / 6
+        value = triangle_hash([[round(c / FINGERPRINT_QUANTUM) for c in point] for point in triangle])
+        self._hash_sums[0] = (self._hash_sums[0] + value) & MASK64
+        self._hash_sums[1] = (self._hash_sums[1] + mix64(value ^ MIX_SEEDS[1])) & MASK64
+
+    def open_edges(self):
+        """Count directed edges that are not matched by exactly one opposite edge (None without numpy)"""
+        if np is None:
+            return None
+        if not self._vertex_chunks:
+            return 0
+        points = np.concatenate(self._vertex_chunks)
+        _, ids = np.unique(points, axis=0, return_inverse=True)
+        ids = ids.reshape(-1, 3).astype(np.int64)
+        count = int(ids.max()) + 1
+        starts, ends = ids.reshape(-1), np.roll(ids, -1, axis=1).reshape(-1)
+        edges, counts = np.unique(starts * count + ends, return_counts=True)
+        reverse = (edges % count) * count + edges // count
+        position = np.clip(np.searchsorted(edges, reverse), 0, len(edges) - 1)
+        matched = (edges[position] == reverse) & (counts[position] == 1)
+        return int(np.count_nonzero(~matched | (counts != 1)))
+
+    def fingerprint(self):
+        """Return the geometry fingerprint (hex)"""
+        text = f"{self.triangles}:{self._hash_sums[0]:016x}:{self._hash_sums[1]:016x}"
+        return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+    def summary(self):
+        """Return the statistics as a JSON-serialisable dict"""
+        empty = self.triangles == 0
+        open_edges = self.open_edges()
+        return {
+            "triangles": self.triangles,
+            "bbox_min": None if empty else [round(v, 6) for v in self.minimum],
+            "bbox_max": None if empty else [round(v, 6) for v in self.maximum],
+            "size": None if empty else [round(hi - lo, 6) for lo, hi in zip(self.minimum, self.maximum)],
+            "area": round(self.area, 6),
+            "volume": round(abs(self.volume), 6),
+            "watertight": None if open_edges is None else not empty and open_edges == 0,
+            "open_edges": open_edges,
+            "fingerprint": self.fingerprint(),
+        }
+
+def write_binary_chunk(handle, normals, vertices):
+    """Append a chunk of triangles to a binary STL"""
+    if np is not None:
+        records = np.zeros(len(vertices), dtype=RECORD_DTYPE)
+        records["normal"] = normals
+        records["vertices"] = vertices
+        handle.write(records.tobytes())
+    else:
+        for normal, (v0, v1, v2) in zip(normals, vertices):
+            handle.write(RECORD.pack(*normal, *v0, *v1, *v2, 0))
+
+def process_stl(stl_file, convert=True, compress=None, sidecar=False):
+    """Stream an STL once: convert ASCII to binary in place and compute mesh statistics.
+
+    With ``compress`` ("gzip" or "zstd") a compressed copy is written next
+    to the (converted) file; with ``sidecar`` the statistics are saved as
+    ``<stem>.mesh.json``. Returns the statistics, including the original
+    and final format and size.
+    """
+    stl_file = Path(stl_file)
+    original_size = stl_file.stat().st_size
+    stats = MeshStats()
+    tmp_file = stl_file.with_name(f".{stl_file.name}.{os.getpid()}.tmp")
+    with open(stl_file, "rb") as source:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if original_size else memoryview(b"") as data:
+            binary = is_binary(data)
+            chunks = binary_chunks(data) if binary else ascii_chunks(data)
+            writer = open(tmp_file, "wb") if convert and not binary else None
+            try:
+                if writer:
+                    writer.write(f"binary STL converted from {stl_file.name}".encode()[:HEADER_SIZE]
+                                 .ljust(HEADER_SIZE, b" ") + b"\0\0\0\0")
+                for normals, vertices in chunks:
+                    stats.add(vertices)
+                    if writer:
+                        write_binary_chunk(writer, normals, vertices)
+                if writer:
+                    writer.seek(HEADER_SIZE)
+                    writer.write(struct.pack("<I", stats.triangles))
+            except BaseException:
+                if writer:
+                    writer.close()
+                    tmp_file.unlink(missing_ok=True)
+                raise
+            # Release buffer exports on the mmap before it is closed
+            chunks = None
+    if writer:
+        writer.close()
+        os.replace(tmp_file, stl_file)
+
+    result = stats.summary()
+    result.update({"format": "binary" if binary else "ascii", "original_size": original_size,
+                   "stored_size": stl_file.stat().st_size, "converted": writer is not None})
+    if compress:
+        compressed = compress_file(stl_file, compress)
+        result["compressed"] = str(compressed)
+        result["compressed_size"] = compressed.stat().st_size
+    if sidecar:
+        sidecar_path(stl_file).write_text(json.dumps(result, indent=2) + "\n")
+    return result
+
+def sidecar_path(stl_file):
+    """Return the statistics sidecar of an STL"""
+    stl_file = Path(stl_file)
+    return stl_file.with_name(stl_file.stem + SIDECAR_SUFFIX)
+
+def collect_fingerprints(source):
+    """Map STL paths (relative to ``source``) to fingerprints.
+
+    ``source`` is a directory of renders or a JSON file written by
+    ``fingerprint --output``. Sidecars are used when they are newer than the
+    STL; other files are fingerprinted on the fly (read-only).
+    """
+    source = Path(source)
+    if source.is_file():
+        return json.loads(source.read_text())["fingerprints"]
+    fingerprints = {}
+    for stl_file in sorted(source.rglob("*.stl")):
+        sidecar = sidecar_path(stl_file)
+        stats = None
+        try:
+            if sidecar.stat().st_mtime_ns >= stl_file.stat().st_mtime_ns:
+                stats = json.loads(sidecar.read_text())
+        except (OSError, ValueError):
+            pass
+        if not stats or "fingerprint" not in stats:
+            stats = process_stl(stl_file, convert=False)
+        fingerprints[stl_file.relative_to(source).as_posix()] = stats["fingerprint"]
+    return fingerprints
+
+def compare_fingerprints(before, after):
+    """Return ``(changed, added, removed, unchanged)`` path lists"""
+    changed = sorted(p for p in before.keys() & after.keys() if before[p] != after[p])
+    unchanged = sorted(p for p in before.keys() & after.keys() if before[p] == after[p])
+    return changed, sorted(after.keys() - before.keys()), sorted(before.keys() - after.keys()), unchanged
+
+def compress_file(path, method="gzip"):
+    """Write a compressed copy of ``path`` next to it and return its path"""
+    if method not in COMPRESSION_FORMATS:
+        raise ValueError(f"Unknown compression format: {method}")
+    path = Path(path)
+    target = path.with_name(path.name + COMPRESSION_FORMATS[method])
+    tmp_file = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    with open(path, "rb") as source:
+        if method == "gzip":
+            with gzip.open(tmp_file, "wb", compresslevel=6) as destination:
+                shutil.copyfileobj(source, destination, 1 << 20)
+        else:
+            if zstandard is None:
+                raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+            with open(tmp_file, "wb") as destination:
+                zstandard.ZstdCompressor(level=10).copy_stream(source, destination)
+    os.replace(tmp_file, target)
+    return target
+
+def format_stats(stats):
+    """One-line summary of mesh statistics"""
+    if not stats["triangles"]:
+        return "empty mesh"
+    size = " x ".join(f"{v:g}" for v in stats["size"])
+    if stats["watertight"] is None:
+        state = "watertightness not checked (needs numpy)"
+    else:
+        state = "watertight" if stats["watertight"] else f"NOT watertight ({stats['open_edges']} open edges)"
+    return f"{stats['triangles']} triangles, {size} mm, volume {stats['volume']:.1f} mm³, {state}"
+
+def fingerprint_command(command, args):
+    """Run the fingerprint and compare commands; return the exit code"""
+    names_only = "--names" in args
+    output = pop_option(args, "--output")
+    args = [a for a in args if a != "--names"]
+    try:
+        if command == "fingerprint":
+            fingerprints = collect_fingerprints(args[0])
+            document = json.dumps({"source": str(Path(args[0]).resolve()), "fingerprints": fingerprints},
+                                  indent=2) + "\n"
+            if output:
+                Path(output).write_text(document)
+                print(f"✓ {len(fingerprints)} fingerprints written to {output}")
+            else:
+                print(document, end="")
+            return 0
+        if len(args) < 2:
+            print("Error: compare needs two directories or fingerprint files")
+            return 2
+        before, after = collect_fingerprints(args[0]), collect_fingerprints(args[1])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    changed, added, removed, unchanged = compare_fingerprints(before, after)
+    if names_only:
+        for path in changed + added:
+            print(path)
+        return 0
+    for label, paths in (("changed", changed), ("added", added), ("removed", removed)):
+        for path in paths:
+            print(f"  {label:<8} {path}")
+    print(f"{len(changed)} changed, {len(added)} added, {len(removed)} removed, "
+          f"{len(unchanged)} geometrically unchanged")
+    return 1 if changed or added or removed else 0
+
+def main():
+    """Main function"""
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ("info", "convert", "compress", "fingerprint", "compare"):
+        print("Usage:")
+        print("  python3 stl_tools.py info <file.stl>... [--json]          # Mesh statistics")
+        print("  python3 stl_tools.py convert <file.stl>... [--compress gzip|zstd]")
+        print("                                                           # ASCII -> binary in place")
+        print("  python3 stl_tools.py compress <file.stl>... [--format gzip|zstd]")
+        print("  python3 stl_tools.py fingerprint <dir> [--output run.json] # Geometry fingerprints")
+        print("  python3 stl_tools.py compare <dir|run.json> <dir|run.json> [--names]")
+        print("                                                           # Which models changed")
+        sys.exit(1)
+
+    command = args.pop(0)
+    if command in ("fingerprint", "compare"):
+        sys.exit(fingerprint_command(command, args))
+    as_json = "--json" in args
+    if as_json:
+        args.remove("--json")
+    method = pop_option(args, "--compress")
+    method = pop_option(args, "--format", method)
+    if method is not None and method not in COMPRESSION_FORMATS:
+        print(f"Error: unknown compression format {method} (choose from {', '.join(COMPRESSION_FORMATS)})")
+        sys.exit(2)
+
+    failed = False
+    results = {}
+    for path in args:
+        try:
+            if command == "compress":
+                target = compress_file(path, method or "gzip")
+                print(f"✓ {path} -> {target} ({Path(path).stat().st_size} -> {target.stat().st_size} bytes)")
+                continue
+            stats = process_stl(path, convert=command == "convert", compress=method)
+        except (OSError, ValueError) as e:
+            print(f"✗ {path}: {e}")
+            failed = True
+            continue
+        results[path] = stats
+        if not as_json:
+            converted = f" (converted from ASCII, {stats['original_size']} -> {stats['stored_size']} bytes)" \
+                if stats["converted"] else ""
+            icon = {True: "✓", False: "✗"}.get(stats["watertight"], "⚠")
+            print(f"{icon} {path}: {format_stats(stats)}{converted}")
+    if as_json:
+        print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ import sys
 import os
 from pathlib import Path
 
+import library_manager
+
 def run_command(command, description):
     """Run a command and handle errors."""
     print(f"  {description}...")
@@ -44,6 +46,20 @@ def update_submodule(submodule_path, update_all=False):
             print(f"✓ {submodule_path} updated successfully!")
         return success
 
+def get_submodule_paths(workspace_root):
+    """Return initialized submodule checkouts listed in .gitmodules"""
+    gitmodules = Path(workspace_root) / ".gitmodules"
+    if not gitmodules.exists():
+        return []
+    paths = []
+    for line in gitmodules.read_text().splitlines():
+        key, _, value = line.strip().partition("=")
+        if key.strip() == "path":
+            path = Path(workspace_root) / value.strip()
+            if (path / ".git").exists():
+                paths.append(path)
+    return paths
+
 def show_library_status():
     """Show the current status of all submodules."""
     print("Current library status:")
@@ -68,6 +84,7 @@ def main():
         print("OpenSCAD Library Update Script")
         print("Usage:")
         print("  python3 update_libraries.py all          - Update all libraries")
+        print("        [--jobs N] [--report FILE] [--json]  (fetch in parallel, fast-forward changed ones)")
         print("  python3 update_libraries.py status       - Show library status")
         print("  python3 update_libraries.py <library>    - Update specific library")
         print("")
@@ -83,7 +100,9 @@ def main():
     os.chdir(workspace_root)
     
     if command == "all":
-        update_submodule(None, update_all=True)
+        if "--json" not in sys.argv[2:]:
+            print("Updating all OpenSCAD libraries...")
+        sys.exit(library_manager.run_update_all(get_submodule_paths(workspace_root), sys.argv[2:]))
     elif command == "status":
         show_library_status()
     elif command in ["bosl2", "dotscad", "round-anything", "nopscadlib", "bosl"]:
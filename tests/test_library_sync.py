@@ -0,0 +1,107 @@
+"""
+Concurrent library sync (download_libraries.sync_libraries) against local bare repositories
+"""
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import download_libraries
+
+GIT_IDENTITY = ["-c", "user.name=Test", "-c", "user.email=test@example.com"]
+
+def git(*args, cwd=None):
+    """Run git and return its stdout"""
+    return subprocess.run(["git", *GIT_IDENTITY, *args], cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+class LibrarySyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.libraries_dir = self.root / "libraries"
+        self.libraries_dir.mkdir()
+        os.environ.pop(download_libraries.library_cache.CACHE_ENV, None)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_upstream(self, name, commits=2):
+        """Create a bare repository standing in for GitHub, with a working clone to push from"""
+        bare = self.root / "upstream" / f"{name}.git"
+        git("init", "--quiet", "--bare", "--initial-branch=main", str(bare))
+        work = self.root / "work" / name
+        git("clone", "--quiet", str(bare), str(work))
+        git("checkout", "--quiet", "-b", "main", cwd=work)
+        for number in range(commits):
+            self.commit(work, f"part{number}.scad", f"module part{number}() cube({number + 1});\n")
+        return bare.as_uri(), work
+
+    def commit(self, work, file_name, content):
+        """Add a commit to a working clone and push it upstream"""
+        (work / file_name).write_text(content)
+        git("add", file_name, cwd=work)
+        git("commit", "--quiet", "-m", f"Add {file_name}", cwd=work)
+        git("push", "--quiet", "origin", "HEAD:main", cwd=work)
+        return git("rev-parse", "HEAD", cwd=work)
+
+    def sync(self, libraries, **options):
+        options.setdefault("backoff", 0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return download_libraries.sync_libraries(libraries, self.libraries_dir, **options)
+
+    def test_clones_libraries_concurrently(self):
+        libraries = {}
+        for number, strategy in enumerate(("full", "shallow", "full", "shallow")):
+            url, _ = self.make_upstream(f"lib{number}")
+            libraries[f"lib{number}"] = {"url": url, "description": f"Library {number}", "strategy": strategy}
+        results = self.sync(libraries, jobs=4)
+        self.assertEqual([r["name"] for r in results], list(libraries))
+        for result in results:
+            self.assertTrue(result["success"], result["error"])
+            self.assertEqual(result["action"], "clone")
+            self.assertTrue((self.libraries_dir / result["name"] / "part1.scad").exists())
+        self.assertEqual(git("rev-list", "--count", "HEAD", cwd=self.libraries_dir / "lib1"), "1")
+
+    def test_updates_existing_checkouts(self):
+        url, work = self.make_upstream("lib")
+        libraries = {"lib": {"url": url, "description": "Library"}}
+        self.sync(libraries)
+        head = self.commit(work, "part9.scad", "module part9() sphere(1);\n")
+        result, = self.sync(libraries)
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(result["action"], "update")
+        self.assertEqual(git("rev-parse", "HEAD", cwd=self.libraries_dir / "lib"), head)
+
+    def test_failures_are_retried_and_reported(self):
+        url, _ = self.make_upstream("good")
+        libraries = {"good": {"url": url, "description": "Reachable"},
+                     "missing": {"url": (self.root / "upstream" / "missing.git").as_uri(),
+                                 "description": "Unreachable"}}
+        results = self.sync(libraries, jobs=2, retries=2)
+        good, missing = results
+        self.assertTrue(good["success"])
+        self.assertFalse(missing["success"])
+        self.assertEqual(missing["attempts"], 3)
+        self.assertFalse((self.libraries_dir / "missing").exists())
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(download_libraries.print_summary(results, 0.0), 1)
+
+    def test_installs_locked_commits(self):
+        url, work = self.make_upstream("lib")
+        pinned = git("rev-parse", "HEAD", cwd=work)
+        self.commit(work, "part9.scad", "module part9() sphere(1);\n")
+        libraries = {"lib": {"url": url, "description": "Library"}}
+        result, = self.sync(libraries, pins={"lib": {"url": url, "commit": pinned}})
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(git("rev-parse", "HEAD", cwd=self.libraries_dir / "lib"), pinned)
+
+if __name__ == "__main__":
+    unittest.main()
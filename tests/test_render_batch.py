@@ -0,0 +1,97 @@
+"""
+Batch rendering (render_preview.py --batch) against a stub openscad on PATH
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+
+# Records when each export starts and ends, fails models named *fail*
+STUB_OPENSCAD = textwrap.dedent("""\
+    #!{python}
+    import os, sys, time
+    args = sys.argv[1:]
+    if "--version" in args:
+        print("OpenSCAD version 2021.01 (stub)", file=sys.stderr)
+        sys.exit(0)
+    if "--help" in args:
+        print("  -o arg", file=sys.stderr)
+        sys.exit(1)
+    output, source = args[args.index("-o") + 1], args[-1]
+    start = time.time()
+    if "fail" in os.path.basename(source):
+        print("ERROR: Parser error in file", source, file=sys.stderr)
+        sys.exit(1)
+    time.sleep(float(os.environ.get("STUB_DELAY", "0.5")))
+    with open(output, "w") as handle:
+        handle.write("solid stub\\nfacet normal 0 0 1\\nouter loop\\nvertex 0 0 0\\nvertex 1 0 0\\n"
+                     "vertex 0 1 0\\nendloop\\nendfacet\\nendsolid stub\\n" if output.endswith(".stl") else "png")
+    with open(os.environ["STUB_LOG"], "a") as log:
+        log.write(f"{{source}} {{output[-3:]}} {{start}} {{time.time()}}\\n")
+    """)
+
+class BatchRenderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        bin_dir = self.root / "bin"
+        bin_dir.mkdir()
+        stub = bin_dir / "openscad"
+        stub.write_text(STUB_OPENSCAD.format(python=sys.executable))
+        stub.chmod(0o755)
+        self.models = self.root / "models"
+        self.models.mkdir()
+        self.log = self.root / "stub.log"
+        self.env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+                        STUB_LOG=str(self.log), OPENSCAD_RENDER_CACHE=str(self.root / "cache"))
+        for name in ("OPENSCAD_RENDER_PROFILE", "OPENSCAD_RENDER_MEMORY_LIMIT", "OPENSCAD_RENDER_CPU_LIMIT",
+                     "OPENSCAD_RENDER_TIMEOUT", "OPENSCAD_RENDER_CGROUP"):
+            self.env.pop(name, None)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def render(self, *args):
+        return subprocess.run([sys.executable, str(SCRIPTS_DIR / "render_preview.py"), "--batch", str(self.models),
+                               "--output", str(self.root / "renders"), "--no-cache", *args],
+                              cwd=self.root, env=self.env, capture_output=True, text=True, timeout=120)
+
+    def log_entries(self):
+        entries = [line.split() for line in self.log.read_text().splitlines()]
+        return {(Path(source).name, kind): (float(start), float(end)) for source, kind, start, end in entries}
+
+    def test_renders_every_export(self):
+        for name in ("a", "b", "c"):
+            (self.models / f"{name}.scad").write_text("cube(1);\n")
+        result = self.render("--jobs", "4")
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("Rendered 3/3 files", result.stdout)
+        for name in ("a", "b", "c"):
+            for kind in ("stl", "png"):
+                self.assertTrue((self.root / "renders" / "models" / f"{name}.{kind}").exists())
+
+    def test_stl_and_png_of_one_file_run_concurrently(self):
+        (self.models / "part.scad").write_text("cube(1);\n")
+        result = self.render("--jobs", "2")
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        entries = self.log_entries()
+        stl, png = entries[("part.scad", "stl")], entries[("part.scad", "png")]
+        self.assertLess(max(stl[0], png[0]), min(stl[1], png[1]), "exports did not overlap")
+
+    def test_reports_failures_with_exit_code(self):
+        (self.models / "good.scad").write_text("cube(1);\n")
+        (self.models / "fail.scad").write_text("cube(\n")
+        result = self.render("--jobs", "2")
+        self.assertEqual(result.returncode, 1, result.stdout + result.stderr)
+        self.assertIn("Rendered 1/2 files", result.stdout)
+        self.assertIn("fail.scad", result.stdout)
+        self.assertIn("Parser error", result.stdout)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Render service scheduling and protocol (render_service.py) with the stub worker
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import render_service
+
+WORKERS = 2
+
+class RenderServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.socket_path = self.root / "render.sock"
+        self.server = subprocess.Popen(
+            [sys.executable, str(SCRIPTS_DIR / "render_service.py"), "serve", "--stub", "--workers", str(WORKERS)],
+            env=dict(os.environ, **{render_service.SOCKET_ENV: str(self.socket_path)}),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        deadline = time.monotonic() + 30
+        while not render_service.ping(self.socket_path):
+            if self.server.poll() is not None or time.monotonic() > deadline:
+                self.fail(f"render service did not start: {self.server.stdout.read()}")
+            time.sleep(0.05)
+
+    def tearDown(self):
+        if self.server.poll() is None:
+            try:
+                render_service.request({"op": "stop"}, self.socket_path, timeout=5)
+            except OSError:
+                pass
+            try:
+                self.server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.server.kill()
+                self.server.wait()
+        self.server.stdout.close()
+        self.tmp.cleanup()
+
+    def job(self, name, seconds=0.05):
+        return {"scad": str(self.root / f"{name}.scad"), "output": str(self.root / f"{name}.stl"),
+                "kind": "stl", "stub_seconds": seconds}
+
+    def status(self):
+        response = render_service.request({"op": "status"}, self.socket_path, timeout=5)
+        self.assertTrue(response["ok"])
+        return response["status"]
+
+    def test_render_round_trip(self):
+        result = render_service.submit(self.job("part"), self.socket_path)
+        self.assertTrue(result["success"])
+        self.assertIn("queue_wait", result)
+        self.assertEqual((self.root / "part.stl").read_text(), "stub\n")
+        status = self.status()
+        self.assertEqual((status["workers"], status["completed"], status["failed"]), (WORKERS, 1, 0))
+        self.assertTrue(status["stub"])
+
+    def test_jobs_are_spread_over_the_workers(self):
+        jobs = [self.job(f"part{number}", 0.5) for number in range(2 * WORKERS)]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            results = list(pool.map(lambda job: render_service.submit(job, self.socket_path), jobs))
+        elapsed = time.monotonic() - start
+        self.assertTrue(all(result["success"] for result in results))
+        # Two rounds of 0.5s on two workers, not four rounds on one
+        self.assertLess(elapsed, 4 * 0.5)
+        self.assertGreater(max(result["queue_wait"] for result in results), 0.3)
+        status = self.status()
+        self.assertEqual((status["completed"], status["queue_depth"], status["in_flight"]), (len(jobs), 0, 0))
+
+    def test_failures_are_counted(self):
+        result = render_service.submit(self.job("fail"), self.socket_path)
+        self.assertFalse(result["success"])
+        self.assertEqual(result["stderr"], "stub failure")
+        self.assertEqual(self.status()["failed"], 1)
+
+    def test_bad_requests_get_an_error_response(self):
+        self.assertFalse(render_service.request({"op": "explode"}, self.socket_path, timeout=5)["ok"])
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(5)
+            client.connect(str(self.socket_path))
+            with client.makefile("rw") as stream:
+                stream.write("not json\n")
+                stream.flush()
+                self.assertFalse(json.loads(stream.readline())["ok"])
+                stream.write(json.dumps({"op": "render"}) + "\n")
+                stream.flush()
+                self.assertFalse(json.loads(stream.readline())["ok"])
+        self.assertTrue(render_service.ping(self.socket_path))
+
+    def test_stop_shuts_the_service_down(self):
+        self.assertTrue(render_service.request({"op": "stop"}, self.socket_path, timeout=5)["ok"])
+        self.assertEqual(self.server.wait(timeout=10), 0)
+        self.assertFalse(self.socket_path.exists())
+        self.assertFalse(render_service.ping(self.socket_path))
+
+if __name__ == "__main__":
+    unittest.main()